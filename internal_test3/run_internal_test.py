@@ -20,6 +20,7 @@ def show_usage():
     --all:         run all test
     --verifier:    test basic verifier
     --mockobject:  test mockobject
+    --runner:      test spec discovery and runner
 """ % sys.version_info[:3])
     sys.exit()
 
@@ -37,6 +38,10 @@ def main():
         import test_mock_object
         is_run = True
 
+    if "--runner" in sys.argv or "--all" in sys.argv:
+        import test_spec_runner
+        is_run = True
+
     if not is_run:
         show_usage()
     show_result()
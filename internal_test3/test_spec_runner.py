@@ -0,0 +1,753 @@
+# -*- coding: utf-8 -*-
+
+from pyspec3.utils.mini_test import test
+import os
+import shutil
+import tempfile
+import pyspec3
+import pyspec3.discovery
+import pyspec3.runner
+
+
+SPEC_SOURCE = """
+import pyspec3
+from pyspec3 import spec, context, ignore, value_of
+
+class StackBehavior(object):
+    @context
+    def an_empty_stack(self):
+        self.stack = []
+
+    @context(group=1)
+    def a_stack_with_one_item(self):
+        self.stack = [1]
+
+    @spec
+    def should_be_empty(self):
+        value_of(self.stack).should_be_empty()
+
+    @spec(group=1)
+    def should_have_one_item(self):
+        value_of(len(self.stack)).should_equal(2)
+
+    @spec(expected=IndexError)
+    def pop_should_raise_error(self):
+        self.stack.pop()
+
+    @ignore
+    def not_implemented(self):
+        pass
+
+@spec
+def module_spec():
+    raise ValueError("error")
+"""
+
+
+def write_spec(directory, name, source=SPEC_SOURCE):
+    path = os.path.join(directory, name)
+    with open(path, "w") as output:
+        output.write(source)
+    return path
+
+
+with test("discover specs without importing"):
+    directory = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(directory, "sub"))
+        write_spec(directory, "spec_stack.py",
+                   "raise ImportError('not imported')\n" + SPEC_SOURCE)
+        write_spec(os.path.join(directory, "sub"), "helper.py", "import os\n")
+        spec_files = pyspec3.discovery.discover(directory)
+        assert len(spec_files) == 1
+        names = [info.qualname() for info in spec_files[0].specs]
+        assert names == ["StackBehavior.an_empty_stack",
+                         "StackBehavior.a_stack_with_one_item",
+                         "StackBehavior.should_be_empty",
+                         "StackBehavior.should_have_one_item",
+                         "StackBehavior.pop_should_raise_error",
+                         "StackBehavior.not_implemented", "module_spec"]
+        infos = spec_files[0].specs
+        assert infos[1].kind == "context" and infos[1].group == 1
+        assert infos[4].expected == "IndexError"
+        assert infos[5].ignored
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("discover reuses index of unchanged files"):
+    directory = tempfile.mkdtemp()
+    try:
+        write_spec(directory, "spec_stack.py")
+        pyspec3.discovery.discover(directory)
+        scan_source = pyspec3.discovery.scan_source
+        def fail_scan(source, filename):
+            raise AssertionError("%s was scanned" % filename)
+        pyspec3.discovery.scan_source = fail_scan
+        try:
+            spec_files = pyspec3.discovery.discover(directory)
+        finally:
+            pyspec3.discovery.scan_source = scan_source
+        assert len(spec_files[0].specs) == 7
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("runner runs contexts, groups and expected exceptions"):
+    directory = tempfile.mkdtemp()
+    try:
+        path = write_spec(directory, "spec_runner_sample.py")
+        module = pyspec3.runner.load_file(path)
+        result = pyspec3.runner.run_suites(
+            pyspec3.runner.collect_module(module))
+        statuses = dict((spec_result.name.split("::")[-1].split(".")[-1],
+                         spec_result.status)
+                        for spec_result in result.results)
+        assert statuses == {"should_be_empty": "success",
+                            "should_have_one_item": "failure",
+                            "pop_should_raise_error": "success",
+                            "not_implemented": "ignored",
+                            "module_spec": "error"}
+        assert not result.was_successful()
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("select specs by pattern, group and shard"):
+    import io
+    import pyspec3.textui
+    directory = tempfile.mkdtemp()
+    try:
+        write_spec(directory, "spec_selected.py")
+        write_spec(directory, "spec_broken.py",
+                   "raise ImportError('not imported')\n" + SPEC_SOURCE)
+        spec_files = pyspec3.discovery.discover(directory)
+        selected = pyspec3.discovery.select(spec_files,
+                                            patterns=["*.should_*"],
+                                            groups=[1], root=directory)
+        assert [spec_file.spec_id(info, directory) for spec_file in selected
+                for info in spec_file.specs if info.kind == "spec"] == \
+            ["spec_broken.py::StackBehavior.should_have_one_item",
+             "spec_selected.py::StackBehavior.should_have_one_item"]
+        shards = [pyspec3.discovery.select(spec_files, shard=(index, 3))
+                  for index in range(3)]
+        assert sum(len([info for info in spec_file.specs
+                        if info.kind == "spec"])
+                   for shard in shards for spec_file in shard) == 10
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("run selected specs without importing other files"):
+    import io
+    import pyspec3.textui
+    directory = tempfile.mkdtemp()
+    try:
+        write_spec(directory, "spec_selected.py")
+        write_spec(directory, "spec_broken.py",
+                   "raise ImportError('not imported')\n" + SPEC_SOURCE)
+        ui = pyspec3.textui.TextSpecTestRunner(stream=io.StringIO())
+        result = ui.run(paths=[directory], patterns=["spec_selected.py::"])
+        assert result.count() == 5
+        ui.list([directory], patterns=["module_spec"])
+        assert ui.stream.getvalue().endswith(
+            "spec_broken.py\n  module_spec\nspec_selected.py\n  module_spec\n")
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("files that can't be parsed become error results"):
+    import io
+    import pyspec3.textui
+    directory = tempfile.mkdtemp()
+    try:
+        write_spec(directory, "spec_good.py")
+        write_spec(directory, "spec_bad.py", "@spec\ndef broken(:\n    pass\n")
+        spec_files = pyspec3.discovery.discover(directory)
+        errors = [spec_file for spec_file in spec_files if spec_file.error]
+        assert [spec_file.relative_path for spec_file in errors] == \
+            ["spec_bad.py"]
+        assert "SyntaxError" in errors[0].error
+        ui = pyspec3.textui.TextSpecTestRunner(stream=io.StringIO())
+        result = ui.run(paths=[directory])
+        assert result.count() == 6
+        assert result.count(pyspec3.runner.ERROR) == 2
+        assert "ERROR: spec_bad.py" in ui.stream.getvalue()
+        assert os.path.exists(os.path.join(directory, ".pyspec_cache",
+                                           "index.json"))
+        assert not os.path.exists(os.path.join(directory,
+                                               ".pyspec_index.json"))
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("discover finds specs in nested classes and blocks"):
+    import io
+    import pyspec3.textui
+    directory = tempfile.mkdtemp()
+    try:
+        write_spec(directory, "nested_spec_helpers.py",
+                   "from pyspec3 import spec, value_of\n")
+        write_spec(directory, "spec_nested.py", """
+from nested_spec_helpers import spec, value_of
+
+class Outer(object):
+    class InnerBehavior(object):
+        @spec
+        def should_run(self):
+            value_of(1).should_equal(1)
+
+if True:
+    @spec
+    def conditional_spec():
+        pass
+""")
+        spec_files = pyspec3.discovery.discover(directory)
+        assert [info.qualname() for spec_file in spec_files
+                for info in spec_file.specs] == \
+            ["Outer.InnerBehavior.should_run", "conditional_spec"]
+        ui = pyspec3.textui.TextSpecTestRunner(stream=io.StringIO())
+        result = ui.run(paths=[directory])
+        assert result.count(pyspec3.runner.SUCCESS) == 2, ui.stream.getvalue()
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("spec id is made from file path and qualified name"):
+    class Behavior(object):
+        @pyspec3.spec
+        def should_work(self):
+            pass
+    pyspec3.spec_root = os.path.dirname(os.path.abspath(__file__))
+    try:
+        attribute = pyspec3.runner.get_attribute(Behavior.should_work)
+        assert attribute.spec_id == \
+            "test_spec_runner.py::Behavior.should_work"
+        assert attribute.key == pyspec3.spec_key(attribute.spec_id)
+        assert pyspec3.make_spec_id(Behavior.should_work, (1, "a")) == \
+            "test_spec_runner.py::Behavior.should_work[1, 'a']"
+    finally:
+        pyspec3.spec_root = None
+
+
+with test("runner and discovery make the same spec ids"):
+    directory = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(directory, "sub"))
+        path = write_spec(os.path.join(directory, "sub"), "spec_same_id.py")
+        spec_files = pyspec3.discovery.discover(directory)
+        static_ids = [spec_files[0].spec_id(info, directory)
+                      for info in spec_files[0].specs if info.kind == "spec"]
+        assert static_ids[0] == \
+            "sub/spec_same_id.py::StackBehavior.should_be_empty"
+        module = pyspec3.runner.load_file(path)
+        pyspec3.spec_root = directory
+        try:
+            result = pyspec3.runner.run_suites(
+                pyspec3.runner.collect_module(module))
+        finally:
+            pyspec3.spec_root = None
+        assert sorted(spec_result.name for spec_result in result.results) == \
+            sorted(static_ids)
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("test index is unique across threads"):
+    import threading
+    indexes = []
+    def take():
+        indexes.extend(pyspec3.get_test_index() for i in range(1000))
+    threads = [threading.Thread(target=take) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(indexes)) == 4000
+
+
+with test("registry finds specs of group without walking modules"):
+    from pyspec3.registry import registry, SPEC, CONTEXT
+    @pyspec3.spec(group="registry sample")
+    def grouped_spec():
+        pass
+    @pyspec3.context(group="registry sample")
+    def grouped_context():
+        pass
+    @pyspec3.ignore
+    @pyspec3.spec(group=("registry sample", "other"))
+    def ignored_spec():
+        pass
+    assert registry.find(kind=SPEC, group="registry sample") == \
+        [grouped_spec, ignored_spec]
+    assert registry.find(kind=CONTEXT, group="registry sample") == \
+        [grouped_context]
+    assert registry.find(group="registry sample", ignored=True) == \
+        [ignored_spec]
+    @pyspec3.spec(expected=ValueError)
+    def no_group_spec():
+        raise ValueError()
+    @pyspec3.spec(cases=[1])
+    def no_group_cases(value):
+        pass
+    ungrouped = registry.find(kind=SPEC, group=None)
+    assert no_group_spec in ungrouped and no_group_cases in ungrouped
+    assert grouped_spec not in ungrouped
+    attribute = pyspec3.get_pyspec_attribute(ignored_spec)
+    assert attribute.groups == ("registry sample", "other")
+    assert attribute.ignored and attribute.timeout == 100.0
+    assert not hasattr(attribute, "__dict__")
+
+
+with test("registry doesn't keep specs alive"):
+    import gc
+    import weakref
+    from pyspec3.registry import registry, SPEC
+    def define():
+        @pyspec3.spec(group="freed sample")
+        def freed_spec():
+            pass
+        return freed_spec
+    freed_spec = define()
+    reference = weakref.ref(freed_spec)
+    assert registry.find(kind=SPEC, group="freed sample") == [freed_spec]
+    del freed_spec
+    gc.collect()
+    assert reference() is None
+    assert registry.find(kind=SPEC, group="freed sample") == []
+
+
+with test("decorated function has __pyspec_attribute"):
+    @pyspec3.spec(timeout=5)
+    def timed_spec():
+        pass
+    attribute = getattr(timed_spec, "__pyspec_attribute")
+    assert attribute.row == pyspec3.get_pyspec_attribute(timed_spec).row
+    assert attribute.timeout == 5.0
+    attribute.set_timeout(None)
+    assert attribute.timeout == 0.0
+
+
+with test("parametrized spec runs each case with its own id"):
+    import json
+    import types
+    directory = tempfile.mkdtemp()
+    try:
+        case_path = os.path.join(directory, "cases.jsonl")
+        with open(case_path, "w") as output:
+            for value in range(3):
+                output.write(json.dumps({"value": value,
+                                         "expected": value * 2}) + "\n")
+        def generated_cases():
+            for value in range(4):
+                yield value, value * value
+        class SquareBehavior(object):
+            @pyspec3.spec(cases=generated_cases)
+            def square(self, value, expected):
+                pyspec3.value_of(value * value).should_equal(expected)
+            @pyspec3.spec(cases=case_path)
+            def double(self, value, expected):
+                pyspec3.value_of(value + value).should_equal(expected)
+            @pyspec3.spec(cases=["a", "bb", "c"])
+            def single(self, text):
+                pyspec3.value_of(len(text)).should_equal(1)
+        module = types.ModuleType("parametrized_sample")
+        SquareBehavior.__module__ = module.__name__
+        module.SquareBehavior = SquareBehavior
+        result = pyspec3.runner.run_suites(
+            pyspec3.runner.collect_module(module), keep_passed=False)
+        assert result.count() == 10
+        assert [spec_result.name.split(".")[-1]
+                for spec_result in result.results] == ["single['bb']"]
+        names = []
+        class Names(pyspec3.runner.Listener):
+            def start_spec(self, name):
+                names.append(name.split(".")[-1])
+        pyspec3.runner.run_suites(pyspec3.runner.collect_module(module),
+                                  Names())
+        assert names[:5] == ["square[0, 0]", "square[1, 1]", "square[2, 4]",
+                             "square[3, 9]", "double[value=0, expected=0]"]
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("relative case path is read from the spec file directory"):
+    directory = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(directory, "cases"))
+        with open(os.path.join(directory, "cases", "square.jsonl"), "w") as \
+                output:
+            output.write("[2, 4]\n[3, 9]\n")
+        path = write_spec(directory, "spec_relative_cases.py", """
+import pyspec3
+
+@pyspec3.spec(cases="cases/square.jsonl")
+def square(value, expected):
+    pyspec3.value_of(value * value).should_equal(expected)
+""")
+        module = pyspec3.runner.load_file(path)
+        result = pyspec3.runner.run_suites(
+            pyspec3.runner.collect_module(module))
+        assert result.count(pyspec3.runner.SUCCESS) == 2, \
+            [spec_result.message for spec_result in result.results]
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("case ids have limited parameters"):
+    def long_spec(text):
+        pass
+    spec_id = pyspec3.make_spec_id(long_spec, ("x" * 10000,))
+    assert len(spec_id) < 200, spec_id
+    assert spec_id.endswith("long_spec['%s ... %s']" % ("x" * 30, "x" * 25)), \
+        spec_id
+
+
+with test("shared contexts run once for each group of specs"):
+    import types
+    calls = []
+    class ModelBehavior(object):
+        @pyspec3.context
+        def load_model(self):
+            calls.append("load")
+            self.model = []
+        @pyspec3.context(group="tagged")
+        def load_tagged(self):
+            calls.append("tagged")
+            self.model = ["tag"]
+        @pyspec3.spec
+        def first(self):
+            self.model.append(1)
+        @pyspec3.spec
+        def second(self):
+            pyspec3.value_of(self.model).should_equal([1])
+        @pyspec3.spec(group="tagged")
+        def tagged(self):
+            pyspec3.value_of(self.model).should_equal(["tag"])
+        @pyspec3.spec_finalize
+        def unload(self):
+            calls.append("unload")
+    module = types.ModuleType("shared_context_sample")
+    ModelBehavior.__module__ = module.__name__
+    module.ModelBehavior = ModelBehavior
+    suites = pyspec3.runner.collect_module(module)
+    assert [len(specs) for contexts, specs
+            in pyspec3.runner.schedule(suites[0])] == [2, 1]
+    result = pyspec3.runner.run_suites(suites, share_contexts=True)
+    assert result.was_successful() and result.count() == 3
+    assert calls == ["load", "unload", "tagged", "unload"]
+    del calls[:]
+    result = pyspec3.runner.run_suites(suites)
+    assert result.count(pyspec3.runner.FAILURE) == 1
+    assert calls.count("load") == 2 and calls.count("unload") == 3
+
+
+with test("errors of class finalizers are reported"):
+    import types
+    class ClosingBehavior(object):
+        @pyspec3.class_context
+        def open(self):
+            self.opened = True
+        @pyspec3.spec
+        def works(self):
+            pass
+        @pyspec3.class_finalize
+        def close(self):
+            raise IOError("can't close")
+    module = types.ModuleType("class_finalize_sample")
+    ClosingBehavior.__module__ = module.__name__
+    module.ClosingBehavior = ClosingBehavior
+    result = pyspec3.runner.run_suites(pyspec3.runner.collect_module(module))
+    assert not result.was_successful()
+    assert [(spec_result.name.split(".")[-1], spec_result.status)
+            for spec_result in result.results] == \
+        [("works", "success"), ("close", "error")]
+    assert "can't close" in result.results[1].message
+
+
+with test("fixtures are cached in their scope and evicted over budget"):
+    import io
+    import types
+    from pyspec3 import fixtures
+    events = []
+    @pyspec3.fixture(scope="module", size=10)
+    def corpus(name):
+        events.append("build %s" % name)
+        yield [name]
+        events.append("close %s" % name)
+    @pyspec3.fixture(size=10)
+    def scratch():
+        events.append("scratch")
+        return []
+    class CorpusBehavior(object):
+        @pyspec3.context
+        def a_corpus(self):
+            self.corpus = corpus("en")
+            self.scratch = scratch()
+        @pyspec3.spec
+        def first(self):
+            pyspec3.value_of(self.corpus).should_equal(["en"])
+        @pyspec3.spec
+        def second(self):
+            pyspec3.value_of(corpus("en")).should_be_same(self.corpus)
+    module = types.ModuleType("fixture_sample")
+    CorpusBehavior.__module__ = module.__name__
+    module.CorpusBehavior = CorpusBehavior
+    result = pyspec3.runner.run_suites(pyspec3.runner.collect_module(module))
+    assert result.was_successful()
+    assert events == ["build en", "scratch", "scratch", "close en"]
+    stats = dict((stats.name.split(".")[-1], stats)
+                 for stats in result.fixtures)
+    assert (stats["corpus"].builds, stats["corpus"].hits) == (1, 2)
+    assert stats["scratch"].hit_rate() == 0.0
+    output = io.StringIO()
+    pyspec3.textui.TextSpecTestRunner(stream=output).report(result)
+    assert "Fixtures: 3 built" in output.getvalue()
+    assert "2 of 5 uses hit the cache (40%)" in output.getvalue()
+
+    del events[:]
+    cache = fixtures.FixtureCache(budget=25)
+    cache.enter(fixtures.SPEC, "first")
+    for name in ("a", "b"):
+        cache.get(corpus, (name,))
+    cache.enter(fixtures.SPEC, "second")
+    cache.get(corpus, ("a",))
+    cache.get(corpus, ("c",))
+    assert events == ["build a", "build b", "build c", "close b"]
+    assert cache.total_size == 20
+    cache.clear()
+    assert events[-2:] == ["close c", "close a"]
+
+
+with test("fixtures of a running class are not evicted over budget"):
+    import types
+    from pyspec3 import fixtures
+    events = []
+    @pyspec3.fixture(scope="class", size=20)
+    def db():
+        connection = {"open": True}
+        events.append("open db")
+        yield connection
+        connection["open"] = False
+        events.append("close db")
+    @pyspec3.fixture(size=20)
+    def big():
+        return []
+    class DatabaseBehavior(object):
+        @pyspec3.class_context
+        def a_database(self):
+            self.db = db()
+        @pyspec3.context
+        def a_big_value(self):
+            self.big = big()
+        @pyspec3.spec
+        def first(self):
+            pyspec3.value_of(self.db["open"]).should_be_true()
+        @pyspec3.spec
+        def second(self):
+            pyspec3.value_of(self.db["open"]).should_be_true()
+            pyspec3.value_of(db()).should_be_same(self.db)
+    module = types.ModuleType("fixture_budget_sample")
+    DatabaseBehavior.__module__ = module.__name__
+    module.DatabaseBehavior = DatabaseBehavior
+    budget = fixtures.config.budget
+    fixtures.config.budget = 30
+    try:
+        result = pyspec3.runner.run_suites(
+            pyspec3.runner.collect_module(module))
+    finally:
+        fixtures.config.budget = budget
+    assert result.was_successful()
+    assert events == ["open db", "close db"]
+    stats = dict((stats.name.split(".")[-1], stats)
+                 for stats in result.fixtures)
+    assert stats["db"].evictions == 0
+
+
+with test("spec fixtures used in a class context are released at class "
+          "end"):
+    import types
+    from pyspec3 import fixtures
+    events = []
+    @pyspec3.fixture(size=10)
+    def conn():
+        events.append("open")
+        yield "conn"
+        events.append("close")
+    class ConnectionBehavior(object):
+        @pyspec3.class_context
+        def a_connection(self):
+            self.conn = conn()
+        @pyspec3.spec
+        def first(self):
+            pyspec3.value_of(self.conn).should_equal("conn")
+    class OtherBehavior(object):
+        @pyspec3.spec
+        def works(self):
+            pass
+    module = types.ModuleType("class_context_fixture_sample")
+    for behavior in (ConnectionBehavior, OtherBehavior):
+        behavior.__module__ = module.__name__
+        setattr(module, behavior.__name__, behavior)
+    budget = fixtures.config.budget
+    fixtures.config.budget = 0
+    try:
+        for run in range(2):
+            result = pyspec3.runner.run_suites(
+                pyspec3.runner.collect_module(module))
+            assert result.was_successful()
+            assert not fixtures.cache.entries
+    finally:
+        fixtures.config.budget = budget
+    assert events == ["open", "close", "open", "close"]
+
+
+with test("teardown errors of evicted fixtures are reported"):
+    from pyspec3 import fixtures
+    closed = []
+    @pyspec3.fixture(size=10)
+    def broken(name):
+        yield name
+        closed.append(name)
+        raise ValueError("close %s" % name)
+    cache = fixtures.FixtureCache(budget=15)
+    cache.enter(fixtures.SPEC, "first")
+    cache.get(broken, ("a",))
+    cache.get(broken, ("b",))
+    cache.enter(fixtures.SPEC, "second")
+    cache.get(broken, ("c",))
+    cache.get(broken, ("d",))
+    assert closed == ["a", "b"]
+    error = cache.leave(fixtures.SPEC)
+    assert str(error) == "close a"
+    assert closed == ["a", "b", "d", "c"]
+    cache.enter(fixtures.SPEC, "third")
+    cache.get(broken, ("e",))
+    cache.get(broken, ("f",))
+    error = cache.clear()
+    assert str(error) == "close f"
+    assert closed[-2:] == ["f", "e"]
+
+
+with test("fixtures with unhashable arguments are keyed by identity"):
+    from pyspec3 import fixtures
+    built = []
+    @pyspec3.fixture
+    def total(values):
+        built.append(values)
+        return sum(values)
+    cache = fixtures.FixtureCache()
+    cache.enter(fixtures.SPEC, "first")
+    values = [1, 2]
+    assert cache.get(total, (values,)) == 3
+    assert cache.get(total, (values,)) == 3
+    assert cache.get(total, ([1, 2],)) == 3
+    assert cache.get(total, (), {"values": values}) == 3
+    assert len(built) == 3
+    cache.clear()
+
+
+with test("watchdog interrupts specs that run longer than their timeout"):
+    import time
+    import types
+    finalized = []
+    class HungBehavior(object):
+        @pyspec3.spec(timeout=0.2)
+        def sleeps(self):
+            time.sleep(30)
+        @pyspec3.spec(timeout=0.2)
+        def spins(self):
+            while True:
+                try:
+                    pass
+                except Exception:
+                    pass
+        @pyspec3.spec
+        def passes(self):
+            pass
+        @pyspec3.spec_finalize
+        def finalize(self):
+            finalized.append(True)
+    module = types.ModuleType("hung_sample")
+    HungBehavior.__module__ = module.__name__
+    module.HungBehavior = HungBehavior
+    start = time.time()
+    result = pyspec3.runner.run_suites(pyspec3.runner.collect_module(module))
+    assert time.time() - start < 5
+    assert [spec_result.status for spec_result in result.results] == \
+        ["timeout", "timeout", "success"]
+    assert not result.was_successful() and len(finalized) == 3
+    message = result.results[0].message
+    assert "HungBehavior.sleeps timed out after 0.2s" in message
+    assert "time.sleep(30)" in message
+    assert result.results[0].elapsed > 0.2
+    assert pyspec3.watchdog.Watchdog().grace is None
+
+
+with test("watchdog interrupts class contexts and class finalizers"):
+    import time
+    import types
+    events = []
+    class SlowClassBehavior(object):
+        @pyspec3.class_context
+        def a_slow_server(self):
+            time.sleep(30)
+        @pyspec3.spec(timeout=0.3)
+        def first(self):
+            events.append("first")
+        @pyspec3.spec(timeout=0.2)
+        def second(self):
+            events.append("second")
+        @pyspec3.class_finalize
+        def stop_server(self):
+            events.append("stop")
+            time.sleep(30)
+    module = types.ModuleType("slow_class_sample")
+    SlowClassBehavior.__module__ = module.__name__
+    module.SlowClassBehavior = SlowClassBehavior
+    start = time.time()
+    result = pyspec3.runner.run_suites(pyspec3.runner.collect_module(module))
+    assert time.time() - start < 5
+    assert [(spec_result.name.split(".")[-1], spec_result.status)
+            for spec_result in result.results] == \
+        [("first", "timeout"), ("second", "timeout"),
+         ("stop_server", "timeout")]
+    assert events == ["stop"]
+    assert "timed out after 0.3s" in result.results[0].message
+    assert "time.sleep(30)" in result.results[0].message
+
+
+with test("a timed out shared context is finalized and its fixtures are "
+          "released"):
+    import time
+    import types
+    events = []
+    @pyspec3.fixture
+    def connection():
+        events.append("open")
+        yield "connection"
+        events.append("close")
+    class SlowContextBehavior(object):
+        @pyspec3.context
+        def a_slow_server(self):
+            self.connection = connection()
+            time.sleep(30)
+        @pyspec3.spec(timeout=0.2)
+        def first(self):
+            pass
+        @pyspec3.spec(timeout=0.2)
+        def second(self):
+            pass
+        @pyspec3.spec_finalize
+        def finalize(self):
+            events.append("finalize %s" % self.connection)
+    module = types.ModuleType("slow_context_sample")
+    SlowContextBehavior.__module__ = module.__name__
+    module.SlowContextBehavior = SlowContextBehavior
+    start = time.time()
+    result = pyspec3.runner.run_suites(pyspec3.runner.collect_module(module),
+                                       share_contexts=True)
+    assert time.time() - start < 5
+    assert [spec_result.status for spec_result in result.results] == \
+        ["timeout", "timeout"]
+    assert events == ["open", "finalize connection", "close"]
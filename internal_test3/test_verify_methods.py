@@ -1,9 +1,22 @@
 # -*- coding: utf-8 -*-
 
 from pyspec3.utils.mini_test import test
+import sys
 import pyspec3
 
 
+class Report(object):
+    def __init__(self):
+        self.messages = []
+        pyspec3.report_out = self
+
+    def write(self, value):
+        self.messages.append(value)
+
+    def close(self):
+        pyspec3.report_out = None
+
+
 with test("ignore", exception=pyspec3.IgnoreTestCase):
     pyspec3.ignore_spec()
 
@@ -32,4 +45,1010 @@ with test("spec decorator"):
     @pyspec3.spec
     def test_method():
         pass
-    assert hasattr(test_method, "__pyspec_attribute")
\ No newline at end of file
+    assert hasattr(test_method, "__pyspec_attribute")
+
+
+with test("should_equal message uses About() expression"):
+    About = pyspec3.StandardVerifier
+    value = 1
+    assert About(value).should_equal(1) == "value should equal 1."
+
+
+with test("should_be_same without About() expression"):
+    obj = object()
+    pyspec3.StandardVerifier(obj).should_be_same(obj)
+
+
+with test("source lookup is cached by code and line"):
+    import pyspec3.source
+    pyspec3.source.clear_cache()
+    report = Report()
+    for i in range(3):
+        pyspec3.StandardVerifier(i).should_equal(i)
+    report.close()
+    assert len(pyspec3.source._target_cache) == 1
+
+
+with test("value_of() expression across lines"):
+    value = [1, 2]
+    msg = pyspec3.value_of(value).should_equal(
+        [1, 2])
+    assert msg == "value should equal [1, 2]."
+
+
+with test("source index is rebuilt when file is modified"):
+    import os
+    import tempfile
+    import pyspec3.source
+    fd, path = tempfile.mkstemp(suffix=".py")
+    os.write(fd, b"value_of(a).should_equal(1)\n")
+    os.close(fd)
+    index = pyspec3.source.get_index(path)
+    assert index.find(1).target == "a"
+    with open(path, "w") as f:
+        f.write("value_of(b).should_equal(\n    2)\n")
+    os.utime(path, (0, index.mtime + 10))
+    index = pyspec3.source.get_index(path)
+    assert index.find(2).target == "b"
+    assert index.find(2).arguments == ("2",)
+    os.remove(path)
+
+
+with test("passed verification message is formatted only for report_out"):
+    class Value(object):
+        formatted = 0
+        def __str__(self):
+            Value.formatted += 1
+            return "value"
+    value = Value()
+    pyspec3.value_of(value).should_be_true()
+    assert Value.formatted == 0
+    report = Report()
+    try:
+        pyspec3.value_of(value).should_be_true()
+    finally:
+        report.close()
+    source, msg = report.messages[0]
+    assert msg == "value should be True."
+    assert Value.formatted == 0
+
+
+with test("verifiers of other packages write (source, message) tuples"):
+    class EvenVerifier(pyspec3.StandardVerifier):
+        def should_be_even(self):
+            source = self._get_target()
+            msg = "%s should be even." % self._source(source, self.actual)
+            self._write((source, msg))
+    count = pyspec3.passed_count
+    report = Report()
+    try:
+        number = 4
+        EvenVerifier(number).should_be_even()
+    finally:
+        report.close()
+    assert pyspec3.passed_count == count + 1
+    source, msg = report.messages[0]
+    assert msg == "%s should be even." % EvenVerifier._source(source, number)
+
+
+with test("passed message falls back to plain values"):
+    class BrokenRepr(object):
+        def __repr__(self):
+            raise ValueError("broken")
+        def __str__(self):
+            return "broken value"
+    value = BrokenRepr()
+    report = Report()
+    try:
+        pyspec3.StandardVerifier(value).should_be_same(value)
+    finally:
+        report.close()
+    source, msg = report.messages[0]
+    assert msg == "broken value should be same broken value."
+
+
+with test("passed verifications are only counted without report_out"):
+    count = pyspec3.passed_count
+    pyspec3.value_of(1).should_equal(1)
+    pyspec3.value_of([]).should_be_empty()
+    assert pyspec3.passed_count == count + 2
+
+
+with test("count_only mode doesn't send messages to report_out"):
+    report = Report()
+    pyspec3.count_only = True
+    try:
+        assert pyspec3.value_of(1).should_equal(1) is None
+    finally:
+        pyspec3.count_only = False
+        report.close()
+    assert report.messages == []
+
+
+with test("type verifier is chosen by the nearest class in the MRO"):
+    class Base(object): pass
+    class Derived(Base): pass
+    class BaseVerifier(pyspec3.StandardVerifier): pass
+    class DerivedVerifier(pyspec3.StandardVerifier): pass
+    pyspec3.regist_type_verifier(Base, BaseVerifier)
+    try:
+        assert type(pyspec3.value_of(Derived())) is BaseVerifier
+        pyspec3.regist_type_verifier(Derived, DerivedVerifier)
+        assert type(pyspec3.value_of(Derived())) is DerivedVerifier
+        assert type(pyspec3.value_of(Base())) is BaseVerifier
+        assert type(pyspec3.value_of(1)) is pyspec3.StandardVerifier
+    finally:
+        pyspec3.unregist_type_verifier((Base, Derived))
+    assert type(pyspec3.value_of(Derived())) is pyspec3.StandardVerifier
+
+
+with test("predicate verifier is checked before type verifier"):
+    class Marked(object):
+        marked = False
+    class MarkedVerifier(pyspec3.StandardVerifier): pass
+    class PredicateVerifier(pyspec3.StandardVerifier): pass
+    is_marked = lambda actual: getattr(actual, "marked", 0)
+    pyspec3.regist_type_verifier(Marked, MarkedVerifier)
+    try:
+        value = Marked()
+        assert type(pyspec3.value_of(value)) is MarkedVerifier
+        pyspec3.regist_test_verifier(is_marked, PredicateVerifier)
+        assert type(pyspec3.value_of(value)) is MarkedVerifier
+        value.marked = True
+        assert type(pyspec3.value_of(value)) is PredicateVerifier
+    finally:
+        pyspec3.unregist_test_verifier(is_marked)
+        pyspec3.unregist_type_verifier(Marked)
+
+
+with test("by_type predicate is called once for each type"):
+    class Tagged(object): pass
+    class TaggedVerifier(pyspec3.StandardVerifier): pass
+    calls = []
+    def is_tagged(actual):
+        calls.append(type(actual))
+        return isinstance(actual, Tagged)
+    pyspec3.regist_test_verifier(is_tagged, TaggedVerifier, by_type=True)
+    try:
+        for i in range(3):
+            assert type(pyspec3.value_of(Tagged())) is TaggedVerifier
+            assert type(pyspec3.value_of(i)) is pyspec3.StandardVerifier
+    finally:
+        pyspec3.unregist_test_verifier(is_tagged)
+    assert calls == [Tagged, int]
+    assert type(pyspec3.value_of(Tagged())) is pyspec3.StandardVerifier
+
+
+with test("should_equal_array success"):
+    import array
+    values = array.array("d", range(100000))
+    pyspec3.value_of(values).should_equal_array(array.array("d", values))
+    pyspec3.value_of(memoryview(values)).should_equal_array(list(values))
+
+
+with test("should_equal_array fail", exception=AssertionError):
+    import array
+    values = array.array("i", range(10))
+    pyspec3.value_of(values).should_equal_array([0, 1, 2, 3, 4, 5, 6, 7, 8, 0])
+
+
+with test("should_equal_array reports count and first differences"):
+    import array
+    values = array.array("i", range(100))
+    expected = list(range(100))
+    for index in range(10, 90, 5):
+        expected[index] = -1
+    try:
+        pyspec3.value_of(values).should_equal_array(expected, max_report=2)
+    except AssertionError as error:
+        msg = str(error)
+    assert "16 of 100 elements" in msg
+    assert msg.endswith("[10] 10 != -1, [15] 15 != -1, ...")
+
+
+with test("should_equal_array_nearly"):
+    import array
+    values = array.array("d", [1.0, 2.0, 3.0])
+    pyspec3.value_of(values).should_equal_array_nearly([1.001, 2.0, 2.99])
+    pyspec3.value_of(values).should_equal_array_nearly([1.1, 2.1, 3.1], 0.2)
+
+
+with test("should_equal_array_nearly fail", exception=AssertionError):
+    import array
+    values = array.array("d", [1.0, 2.0, 3.0])
+    pyspec3.value_of(values).should_equal_array_nearly([1.0, 2.0, 3.5], 0.2)
+
+
+with test("should_equal_array treats NaN at the same index as equal"):
+    import array
+    nan = float("nan")
+    values = array.array("d", [1.0, nan, 3.0] * 10000)
+    values[-1] = 4.0
+    expected = array.array("d", [1.0, nan, 3.0] * 10000)
+    for other in (array.array("f", expected), list(expected)):
+        try:
+            pyspec3.value_of(values).should_equal_array(other)
+        except AssertionError as error:
+            msg = str(error)
+        assert "1 of 30000 elements" in msg
+    expected[-1] = 4.0
+    pyspec3.value_of(values).should_equal_array(expected)
+    pyspec3.value_of(values).should_equal_array_nearly(expected, 0.1)
+
+
+with test("should_equal_array fails for different shapes"):
+    actual = memoryview(bytes(range(6))).cast("B", (2, 3))
+    expected = memoryview(bytes(range(6))).cast("B", (3, 2))
+    try:
+        pyspec3.value_of(actual).should_equal_array(expected)
+    except AssertionError as error:
+        msg = str(error)
+    assert msg == "actual should have shape (3, 2), but had (2, 3)."
+    pyspec3.value_of(actual).should_equal_array(list(range(6)))
+
+
+with test("failure message of huge value is shortened"):
+    expected = "a" * 1000000
+    actual = expected[:500000] + "b" + expected[500001:]
+    try:
+        pyspec3.value_of(actual).should_equal(expected)
+    except AssertionError as error:
+        msg = str(error)
+    assert len(msg) < 1000
+    assert "first difference at index 500000 (line 1, column 500001)" in msg
+
+
+with test("container subclasses and bytes are rendered without full repr"):
+    import collections
+    import pyspec3.valuediff
+    class Registry(dict):
+        def __repr__(self):
+            raise AssertionError("full repr() should not be called")
+    values = [collections.deque(range(1000000)), bytearray(1000000),
+              Registry((i, i) for i in range(100000)), b"\0" * 1000000]
+    for value in values:
+        text = pyspec3.valuediff.limited_repr(value)
+        assert len(text) <= 250, (type(value), len(text))
+    assert pyspec3.valuediff.limited_repr(Registry(a=1)) == \
+        "Registry({'a': 1})"
+
+
+with test("failure message has no empty difference report"):
+    class NeverEqual(list):
+        def __eq__(self, other):
+            return False
+    try:
+        pyspec3.value_of(NeverEqual([1])).should_equal([1])
+    except AssertionError as error:
+        msg = str(error)
+    assert not msg.endswith("\n")
+
+
+with test("failure message shows first differences of list"):
+    import pyspec3.valuediff
+    expected = list(range(1000))
+    actual = [-1] * 1000
+    try:
+        pyspec3.value_of(actual).should_equal(expected)
+    except AssertionError as error:
+        msg = str(error)
+    lines = msg.splitlines()
+    assert lines[1] == "  [0]: expected 0, but was -1"
+    assert len(lines) == pyspec3.valuediff.config.max_differences + 2
+
+
+with test("full diff is written to spill_directory"):
+    import os
+    import shutil
+    import tempfile
+    import pyspec3.valuediff
+    directory = tempfile.mkdtemp()
+    pyspec3.valuediff.config.spill_directory = directory
+    try:
+        pyspec3.value_of("a\nb\nc\n").should_equal("a\nB\nc\n")
+    except AssertionError as error:
+        msg = str(error)
+    finally:
+        pyspec3.valuediff.config.spill_directory = None
+    path = msg.splitlines()[-1].split(": ", 1)[1]
+    assert "+b\n" in open(path).read()
+    shutil.rmtree(directory)
+
+
+with test("failure message shows path to nested difference"):
+    import dataclasses
+    @dataclasses.dataclass
+    class User(object):
+        name: str
+        tags: list
+    expected = {"users": [User("a", [1]), User("b", [2])], "count": 2}
+    actual = {"users": [User("a", [1]), User("c", [2])], "count": 2}
+    try:
+        pyspec3.value_of(actual).should_equal(expected)
+    except AssertionError as error:
+        msg = str(error)
+    assert msg.splitlines()[1:] == \
+        ["  ['users'][1].name: expected 'b', but was 'c'"]
+
+
+with test("iter_differences stops at requested count"):
+    import itertools
+    import pyspec3.valuediff
+    differences = pyspec3.valuediff.iter_differences(
+        list(range(100)), [0] * 100)
+    found = list(itertools.islice(differences, 3))
+    assert [pyspec3.valuediff.format_path(d.path) for d in found] == \
+        ["[1]", "[2]", "[3]"]
+
+
+with test("deep_equal compares deeply nested structure"):
+    import pyspec3.valuediff
+    expected = actual = None
+    for i in range(sys.getrecursionlimit() * 2):
+        expected = [expected]
+        actual = [actual]
+    assert pyspec3.valuediff.deep_equal(expected, actual)
+    actual = [actual]
+    assert not pyspec3.valuediff.deep_equal(expected, actual)
+
+
+with test("deep_equal requires same container kinds and compares leaves"):
+    import dataclasses
+    import pyspec3.valuediff
+    deep_equal = pyspec3.valuediff.deep_equal
+    assert not deep_equal([1, 2], (1, 2))
+    assert not deep_equal({"a": [1]}, {"a": (1,)})
+    assert deep_equal({1}, frozenset([1]))
+    @dataclasses.dataclass(eq=False)
+    class Point(object):
+        x: int
+    assert not deep_equal(Point(1), Point(1))
+    class Leaf(object):
+        compared = 0
+        def __eq__(self, other):
+            Leaf.compared += 1
+            return True
+    expected = actual = None
+    for i in range(100):
+        expected = [Leaf(), expected]
+        actual = [Leaf(), actual]
+    assert deep_equal(expected, actual)
+    assert Leaf.compared == 100
+    try:
+        pyspec3.value_of((1, 2)).should_equal([1, 2])
+    except AssertionError as error:
+        msg = str(error)
+    assert msg.endswith("type: expected list, but was tuple")
+
+
+with test("should_include_all success"):
+    pyspec3.value_of(list(range(1000))).should_include_all(range(0, 1000, 7))
+    pyspec3.value_of([[1], 2, {"a": 1}]).should_include_all([[1], {"a": 1}])
+
+
+with test("should_include_all reports missing items"):
+    try:
+        pyspec3.value_of(list(range(10))).should_include_all(
+            range(100), max_report=3)
+    except AssertionError as error:
+        msg = str(error)
+    assert msg.endswith("but 90 items were missing: [10, 11, 12]")
+
+
+with test("should_include_none fail", exception=AssertionError):
+    pyspec3.value_of([1, [2], 3]).should_include_none([4, [2]])
+
+
+with test("should_include_all and none check substrings of str and bytes"):
+    pyspec3.value_of("hello world").should_include_all(["hello", "world"])
+    pyspec3.value_of(b"hello world").should_include_all([b"hello", b"o w"])
+    pyspec3.value_of(bytearray(b"abc")).should_include_none([b"ca", b"d"])
+    pyspec3.value_of("hello world").should_include_none(["bye"])
+    for value, items in (("hello world", ["lo w"]), (b"hello", [b"ell"])):
+        try:
+            pyspec3.value_of(value).should_include_none(items)
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError("%r includes %r" % (value, items))
+
+
+with test("should_have_same_elements"):
+    pyspec3.value_of([3, 1, [2], 1]).should_have_same_elements([1, [2], 1, 3])
+
+
+with test("bulk verifiers read iterators with unhashable items once"):
+    pyspec3.value_of(iter([1, 2, [3]])).should_include_all([1, 2])
+    pyspec3.value_of([1, 2, [3]]).should_have_same_elements(
+        item for item in [1, 2, [3]])
+
+
+with test("should_have_same_elements fail", exception=AssertionError):
+    pyspec3.value_of([3, 1, 2, 1]).should_have_same_elements([1, 2, 3])
+
+
+with test("ignore_stack flag doesn't bleed between threads"):
+    import threading
+    errors = []
+    barrier = threading.Barrier(8)
+    class Probe(object):
+        def __eq__(self, other):
+            if not pyspec3.is_ignoring_stack():
+                errors.append("flag was reset by other thread")
+            return True
+    def worker():
+        barrier.wait()
+        for i in range(2000):
+            pyspec3.value_of(Probe()).should_equal(i)
+            if pyspec3.is_ignoring_stack():
+                errors.append("flag was set by other thread")
+    threads = [threading.Thread(target=worker) for i in range(8)]
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == [], errors[:3]
+
+
+with test("ignore_stack flag doesn't bleed between asyncio tasks"):
+    import asyncio
+    async def verify(value):
+        await asyncio.sleep(0)
+        pyspec3.value_of(value).should_equal(value)
+        await asyncio.sleep(0)
+        return pyspec3.is_ignoring_stack()
+    async def main():
+        return await asyncio.gather(*[verify(i) for i in range(100)])
+    assert not any(asyncio.run(main()))
+    assert not pyspec3.is_ignoring_stack()
+
+
+with test("ignore_stack flag is reset if __eq__ raises"):
+    class Broken(object):
+        def __eq__(self, other):
+            raise ValueError("broken")
+    try:
+        pyspec3.value_of(Broken()).should_equal(1)
+    except ValueError:
+        pass
+    assert not pyspec3.is_ignoring_stack()
+    try:
+        pyspec3.value_of([Broken()]).should_include(1)
+    except ValueError:
+        pass
+    assert not pyspec3.is_ignoring_stack()
+
+
+with test("ignore_stack flag is reset after array verifier fails"):
+    import array
+    try:
+        pyspec3.value_of(array.array("i", [1])).should_equal_array([2])
+    except AssertionError:
+        pass
+    assert not pyspec3.is_ignoring_stack()
+
+
+with test("passed_count counts verifications of all threads"):
+    import threading
+    barrier = threading.Barrier(8)
+    def worker():
+        barrier.wait()
+        for i in range(2000):
+            pyspec3.value_of(i + 1).should_be_true()
+    threads = [threading.Thread(target=worker) for i in range(8)]
+    count = pyspec3.passed_count
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert pyspec3.passed_count == count + 8 * 2000, pyspec3.passed_count
+
+
+with test("should_not_equal resets ignore_stack flag"):
+    pyspec3.value_of(1).should_not_equal(2)
+    assert not pyspec3.ignore_stack
+
+
+def retried(verify, attempts=3):
+    # timing verifiers depend on machine load, so retry them before failing.
+    for attempt in range(attempts - 1):
+        try:
+            return verify()
+        except AssertionError:
+            pass
+    return verify()
+
+
+with test("should_complete_within success"):
+    data = list(range(100))
+    pyspec3.value_of(lambda: sorted(data)).should_complete_within(1.0,
+                                                                  repeat=3)
+
+
+with test("should_complete_within fail", exception=AssertionError):
+    import time
+    pyspec3.value_of(lambda: time.sleep(0.01)).should_complete_within(
+        0.001, repeat=3)
+
+
+with test("should_complete_within message has statistics"):
+    report = Report()
+    pyspec3.value_of(lambda: None).should_complete_within(1, repeat=3)
+    report.close()
+    source, msg = report.messages[0]
+    assert "should complete within 1 s. (median " in str(msg)
+    assert "3 samples x " in str(msg)
+
+
+with test("calibration stops when it uses up the time budget"):
+    import time
+    from pyspec3 import benchmark
+    calls = []
+    def slow():
+        calls.append(None)
+        time.sleep(0.01)
+    start = time.perf_counter()
+    loops = benchmark.calibrate(slow, sample_time=10, max_time=0.05)
+    assert time.perf_counter() - start < 2
+    assert loops == 10 and len(calls) == 11
+    start = time.perf_counter()
+    timing = benchmark.measure(slow, warmup=0, sample_time=10, max_time=0.05)
+    assert time.perf_counter() - start < 5
+    assert len(timing.samples) == benchmark.MIN_SAMPLES
+
+
+with test("should_be_faster_than"):
+    import time
+    fast = lambda: None
+    slow = lambda: time.sleep(0.01)
+    retried(lambda: pyspec3.value_of(fast).should_be_faster_than(slow,
+                                                                 repeat=3))
+
+
+with test("should_be_faster_than fail", exception=AssertionError):
+    import time
+    fast = lambda: None
+    slow = lambda: time.sleep(0.01)
+    pyspec3.value_of(slow).should_be_faster_than(fast, repeat=3)
+
+
+with test("should_complete_within needs callable", exception=TypeError):
+    pyspec3.value_of(1).should_complete_within(1)
+
+
+with test("should_allocate_less_than success"):
+    pyspec3.value_of(lambda: sum(range(1000))).should_allocate_less_than(
+        1024)
+
+
+with test("should_allocate_less_than shows allocating lines"):
+    def build():
+        return [str(i) for i in range(10000)]
+    try:
+        pyspec3.value_of(build).should_allocate_less_than(1024)
+    except AssertionError as error:
+        msg = str(error)
+    assert msg.startswith("build should allocate less than 1 KiB, but peak")
+    assert "test_verify_methods.py:" in msg.splitlines()[1]
+
+
+with test("should_allocate_less_than checks net allocation"):
+    import tracemalloc
+    def temporary():
+        buffer = bytearray(1000000)
+    pyspec3.value_of(temporary).should_allocate_less_than(10000, net=True)
+    assert not tracemalloc.is_tracing()
+
+
+with test("should_scale_linearly success"):
+    retried(lambda: pyspec3.value_of(sum).should_scale_linearly(
+        lambda n: list(range(n))))
+
+
+with test("should_scale_linearly fail with timing table"):
+    def pairs(data):
+        return sum(1 for a in data for b in data if a == b)
+    try:
+        pyspec3.value_of(pairs).should_scale_linearly(
+            lambda n: list(range(n)), sizes=[50, 100, 200, 400], repeat=1)
+    except AssertionError as error:
+        msg = str(error)
+    lines = msg.splitlines()
+    assert lines[0].startswith("pairs should scale as O(n) (exponent 1.00)")
+    assert len(lines) == 6
+
+
+with test("should_scale_as accepts complexity class"):
+    import random
+    # reversed or sorted input is O(n) for timsort, so shuffle it.
+    shuffler = random.Random(12345)
+    def shuffled(n):
+        data = list(range(n))
+        shuffler.shuffle(data)
+        return data
+    retried(lambda: pyspec3.value_of(sorted).should_scale_as(
+        "O(n log n)", shuffled))
+
+
+with test("should_resolve_to runs coroutine"):
+    import asyncio
+    async def double(value):
+        await asyncio.sleep(0)
+        return value * 2
+    pyspec3.value_of(double(2)).should_resolve_to(4)
+
+
+with test("should_all_resolve_to gathers concurrently"):
+    import time
+    import asyncio
+    async def late(value):
+        await asyncio.sleep(0.05)
+        return value
+    start = time.perf_counter()
+    pyspec3.value_of([late(i) for i in range(20)]).should_all_resolve_to(
+        list(range(20)), within=5.0)
+    # 20 sequential waits take 1 second.
+    assert time.perf_counter() - start < 0.75
+
+
+with test("should_all_resolve_to fail", exception=AssertionError):
+    import asyncio
+    async def double(value):
+        await asyncio.sleep(0)
+        return value * 2
+    pyspec3.value_of([double(1), double(2)]).should_all_resolve_to([2, 5])
+
+
+with test("should_complete_within cancels slow awaitable",
+          exception=AssertionError):
+    import asyncio
+    async def late(value):
+        await asyncio.sleep(1)
+        return value
+    pyspec3.value_of(late(1)).should_complete_within(0.001)
+
+
+with test("should_all_resolve_to closes coroutines if it rejects them"):
+    import asyncio
+    async def double(value):
+        await asyncio.sleep(0)
+        return value * 2
+    pending = double(1)
+    try:
+        pyspec3.value_of([pending, 2]).should_all_resolve_to([2, 2])
+    except TypeError:
+        pass
+    assert pending.cr_frame is None
+
+
+with test("awaitable verifiers close the loop of finished thread"):
+    import asyncio
+    import threading
+    import pyspec3.asyncloop
+    async def double(value):
+        await asyncio.sleep(0)
+        return value * 2
+    loops = []
+    def worker():
+        pyspec3.value_of(double(2)).should_resolve_to(4)
+        loops.append(pyspec3.asyncloop.get_loop())
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert loops[0].is_closed()
+    assert loops[0] not in pyspec3.asyncloop._loops
+
+
+with test("importing pyspec3 doesn't import asyncio"):
+    import os
+    import subprocess
+    root = os.path.dirname(os.path.dirname(os.path.abspath(pyspec3.__file__)))
+    output = subprocess.check_output(
+        [sys.executable, "-c",
+         "import sys, pyspec3; print('asyncio' in sys.modules)"],
+        cwd=root)
+    assert output.strip() == b"False", output
+
+
+with test("should_equal_stream success"):
+    def numbers(count):
+        for i in range(count):
+            yield i
+    pyspec3.value_of(numbers(5000)).should_equal_stream(range(5000),
+                                                        chunk_size=64)
+
+
+with test("should_equal_stream fail shows window"):
+    def broken(count, bad):
+        for i in range(count):
+            yield -1 if i == bad else i
+    try:
+        pyspec3.value_of(broken(5000, 4000)).should_equal_stream(
+            numbers(5000), chunk_size=64, window=2)
+    except AssertionError as error:
+        lines = str(error).splitlines()
+    assert lines[0].endswith("but item 4000 was different.")
+    assert lines[1] == "  before:   [3998, 3999]"
+    assert lines[3] == "  actual:   [-1, 4001, 4002]"
+
+
+with test("should_equal_stream fail with short stream",
+          exception=AssertionError):
+    pyspec3.value_of(numbers(3)).should_equal_stream(numbers(4))
+
+
+with test("should_equal_file success"):
+    import os
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp()
+    try:
+        path1 = os.path.join(directory, "actual.txt")
+        path2 = os.path.join(directory, "expected.txt")
+        with open(path1, "wb") as output:
+            output.write(b"first line\nsecond line\n" * 1000)
+        with open(path2, "wb") as output:
+            output.write(b"first line\nsecond line\n" * 1000)
+        pyspec3.value_of(path1).should_equal_file(path2, chunk_size=100)
+        pyspec3.value_of(path1).should_equal_file(
+            b"first line\nsecond line\n" * 1000)
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("should_equal_file fail shows offset and line"):
+    import os
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp()
+    try:
+        path1 = os.path.join(directory, "actual.txt")
+        path2 = os.path.join(directory, "expected.txt")
+        with open(path1, "wb") as output:
+            output.write(b"first line\nsecond line\n" * 1000)
+        with open(path2, "wb") as output:
+            output.write(b"first line\nsecond line\n" * 500 +
+                         b"first line\nsecond LINE\n" * 500)
+        try:
+            pyspec3.value_of(path1).should_equal_file(path2, chunk_size=100)
+        except AssertionError as error:
+            lines = str(error).splitlines()
+        assert lines[1] == \
+            "first difference at byte 11518 (line 1002, column 8)"
+    finally:
+        shutil.rmtree(directory)
+
+
+class Word(object):
+    def __init__(self, text):
+        self.text = text
+
+
+class WordVerifier(pyspec3.StandardVerifier):
+    should_have_length = pyspec3.VerifyMethod(
+        lambda actual, length: len(actual.text) == length,
+        "%(actual)s should have length %(length)s, but didn't.",
+        "%(actual)s should have length %(length)s.")
+
+
+def is_word(value):
+    return isinstance(value, Word)
+
+
+pyspec3.regist_test_verifier(is_word, WordVerifier)
+
+
+with test("verify_method success message"):
+    report = Report()
+    word = Word("spam")
+    msg = pyspec3.value_of(word).should_have_length(4)
+    report.close()
+    assert str(msg) == "word should have length 4."
+    assert WordVerifier.should_have_length.__name__ == "should_have_length"
+
+
+with test("verify_method failure message"):
+    try:
+        pyspec3.value_of(word).should_have_length(length=5)
+    except AssertionError as error:
+        msg = str(error)
+    assert msg == "word should have length 5, but didn't."
+
+
+with test("verify_method is the old name of VerifyMethod"):
+    assert pyspec3.verify_method is pyspec3.VerifyMethod
+    pyspec3.unregist_test_verifier(is_word)
+    assert type(pyspec3.value_of(word)) is not WordVerifier
+
+
+with test("VerifyMethod predicate can return Mismatch and Match"):
+    def same_lines(actual, expected):
+        for number, (a, e) in enumerate(zip(actual, expected), 1):
+            if a != e:
+                return pyspec3.Mismatch(line=number,
+                                        lines=["  %r != %r" % (a, e)])
+        return pyspec3.Match(count=len(actual))
+    class LinesVerifier(pyspec3.StandardVerifier):
+        should_have_lines = pyspec3.VerifyMethod(
+            same_lines,
+            "%(actual)s should have lines %(expected_source)s, but line "
+            "%(line)d was different.",
+            "%(actual)s should have %(count)d lines %(expected_source)s.")
+    class Lines(list):
+        pass
+    def is_lines(value):
+        return isinstance(value, Lines)
+    pyspec3.regist_test_verifier(is_lines, LinesVerifier)
+    try:
+        text = Lines(["spam", "ham"])
+        try:
+            pyspec3.value_of(text).should_have_lines(["spam", "egg"])
+        except AssertionError as error:
+            msg = str(error)
+        assert msg == 'text should have lines ["spam", "egg"], but line 2 ' \
+                      "was different.\n  'ham' != 'egg'", msg
+        report = Report()
+        try:
+            pyspec3.value_of(text).should_have_lines(["spam", "ham"])
+        finally:
+            report.close()
+        assert report.messages[0][1] == \
+            'text should have 2 lines ["spam", "ham"].', report.messages
+    finally:
+        pyspec3.unregist_test_verifier(is_lines)
+
+
+with test("should_equal_stream is defined by VerifyMethod"):
+    try:
+        pyspec3.value_of(iter([1, 2, 3])).should_equal_stream([1, 2, 4])
+    except AssertionError as error:
+        msg = str(error)
+    lines = msg.splitlines()
+    assert lines[0] == "iter([1, 2, 3]) should equal stream [1, 2, 4], but " \
+                       "item 2 was different.", lines[0]
+    assert lines[2:] == ["  expected: [4]", "  actual:   [3]"]
+
+
+with test("should_resolve_to rejects values that are not awaitable",
+          exception=TypeError):
+    pyspec3.value_of(5).should_resolve_to(5)
+
+
+with test("should_match_snapshot records and matches"):
+    import os
+    import shutil
+    import tempfile
+    import pyspec3.snapshot
+    directory = tempfile.mkdtemp()
+    pyspec3.snapshot.config.directory_name = directory
+    try:
+        pyspec3.snapshot.clear_cache()
+        page = {"title": "spam", "items": [1, 2, 3]}
+        pyspec3.value_of(page).should_match_snapshot("page")
+        # the index is written once by flush().
+        assert not os.path.exists(os.path.join(directory, "index.json"))
+        pyspec3.snapshot.clear_cache()
+        assert os.path.exists(os.path.join(directory, "index.json"))
+        pyspec3.value_of(page).should_match_snapshot("page")
+    finally:
+        pyspec3.snapshot.clear_cache()
+        pyspec3.snapshot.config.directory_name = "__snapshots__"
+        shutil.rmtree(directory)
+
+
+with test("should_match_snapshot fail and update"):
+    import shutil
+    import tempfile
+    import pyspec3.snapshot
+    directory = tempfile.mkdtemp()
+    pyspec3.snapshot.config.directory_name = directory
+    try:
+        pyspec3.snapshot.clear_cache()
+        page = {"title": "spam", "items": [1, 2, 3]}
+        pyspec3.value_of(page).should_match_snapshot("page")
+        page["items"].append(4)
+        try:
+            pyspec3.value_of(page).should_match_snapshot("page")
+        except AssertionError as error:
+            msg = str(error)
+        assert msg.startswith('page should match snapshot "page", but was '
+                              "different.")
+        pyspec3.snapshot.config.update = True
+        pyspec3.value_of(page).should_match_snapshot("page")
+        pyspec3.snapshot.config.update = False
+        pyspec3.snapshot.clear_cache()
+        pyspec3.value_of(page).should_match_snapshot("page")
+    finally:
+        pyspec3.snapshot.clear_cache()
+        pyspec3.snapshot.config.update = False
+        pyspec3.snapshot.config.directory_name = "__snapshots__"
+        shutil.rmtree(directory)
+
+
+with test("each case of a parametrized spec has its own snapshot"):
+    import os
+    import json
+    import types
+    import shutil
+    import tempfile
+    import pyspec3.runner
+    import pyspec3.snapshot
+    class PageBehavior(object):
+        @pyspec3.spec(cases=[1, 2])
+        def page(self, number):
+            pyspec3.value_of([number]).should_match_snapshot("page")
+    module = types.ModuleType("snapshot_case_sample")
+    PageBehavior.__module__ = module.__name__
+    module.PageBehavior = PageBehavior
+    directory = tempfile.mkdtemp()
+    pyspec3.snapshot.config.directory_name = directory
+    try:
+        pyspec3.snapshot.clear_cache()
+        for i in range(2):
+            result = pyspec3.runner.run_suites(
+                pyspec3.runner.collect_module(module))
+            assert result.was_successful(), result.results
+            pyspec3.snapshot.clear_cache()
+        with open(os.path.join(directory, "index.json")) as index_file:
+            keys = sorted(json.load(index_file))
+        assert keys == ["test_verify_methods.py::PageBehavior.page[1]::page",
+                        "test_verify_methods.py::PageBehavior.page[2]::page"]
+    finally:
+        pyspec3.snapshot.clear_cache()
+        pyspec3.snapshot.config.directory_name = "__snapshots__"
+        shutil.rmtree(directory)
+
+
+with test("broken snapshot index is reported"):
+    import os
+    import shutil
+    import tempfile
+    import pyspec3.snapshot
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, "index.json"), "w") as index_file:
+            index_file.write('{"key": "ab')
+        try:
+            pyspec3.snapshot.SnapshotStore(directory)
+        except ValueError as error:
+            msg = str(error)
+        assert "index.json is broken" in msg, msg
+        assert "remove it to record the snapshots again" in msg
+    finally:
+        shutil.rmtree(directory)
+
+
+with test("snapshot stores merge their indexes on flush"):
+    import os
+    import json
+    import shutil
+    import hashlib
+    import tempfile
+    import pyspec3.snapshot
+    directory = tempfile.mkdtemp()
+    try:
+        # two stores stand for two workers that share the directory.
+        stores = [pyspec3.snapshot.SnapshotStore(directory)
+                  for i in range(2)]
+        for number, store in enumerate(stores):
+            data = pyspec3.snapshot.serialize(number)
+            store.write("key%d" % number, data,
+                        hashlib.sha256(data).hexdigest())
+        for store in stores:
+            store.flush()
+        with open(stores[0].index_path()) as index_file:
+            assert sorted(json.load(index_file)) == ["key0", "key1"]
+        assert sorted(stores[1].index) == ["key0", "key1"]
+        assert not os.path.exists(stores[0].index_path() + ".lock")
+    finally:
+        shutil.rmtree(directory)
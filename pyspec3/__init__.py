@@ -61,14 +61,56 @@ POSSIBILITY OF SUCH DAMAGE.
 
 """
 
+import os
+import sys
+import hashlib
+import inspect
+import itertools
+import threading
+import contextvars
 import pyspec3.compat_ironpython
+from pyspec3.source import (get_target as _find_target,
+                            get_arguments as _find_arguments)
+from pyspec3.valuediff import (shorten as _shorten,
+                               limited_str as _limited_str,
+                               limited_repr as _limited_repr,
+                               describe_difference as _describe_difference,
+                               deep_equal as _deep_equal)
+from pyspec3.benchmark import (Timing as _Timing,
+                               measure as _measure,
+                               format_time as _format_time,
+                               measure_allocation as _measure_allocation,
+                               format_size as _format_size,
+                               measure_scaling as _measure_scaling,
+                               complexity_exponent as _complexity_exponent)
+from pyspec3.asyncloop import (is_awaitable as _is_awaitable,
+                               run as _run_awaitable,
+                               run_timed as _run_timed,
+                               gather as _gather,
+                               close_awaitables as _close_awaitables,
+                               synchronous as _synchronous)
+from pyspec3.stream import (compare_streams as _compare_streams,
+                            END as _END)
+from pyspec3.filecompare import compare_contents as _compare_contents
+from pyspec3.snapshot import (check as _check_snapshot,
+                              deserialize as _deserialize_snapshot)
+import pyspec3.registry as _registry_module
+from pyspec3.registry import registry as _registry
+from pyspec3.membership import (missing_items as _missing_items,
+                                included_items as _included_items,
+                                different_elements as _different_elements)
+from pyspec3.fixtures import fixture
 
 __version__ = "0.44alpha"
 
 __pyspec = 1
-ignore_stack = False
-__test_index = 0
+_ignore_stack = contextvars.ContextVar("pyspec_ignore_stack", default=False)
+__test_index = itertools.count(1)
+__test_index_lock = threading.Lock()
+_passed_count_lock = threading.Lock()
 __verifiers = []
+__type_verifiers = {}
+__verifier_cache = {}
 
 
 __all__ = (
@@ -80,24 +122,206 @@ __all__ = (
     "ignore",
     "IgnoreTestCase",
     "value_of",
-    "Verify",
     "run_test",
     "report_out",
-    "regist_test_verifier")
+    "regist_test_verifier",
+    "regist_type_verifier",
+    "unregist_test_verifier",
+    "unregist_type_verifier",
+    "VerifyMethod",
+    "verify_method",
+    "Mismatch",
+    "Match",
+    "fixture")
 
 
 report_out = None
+count_only = False
+passed_count = 0
+# directory that spec ids are relative to. None means the current directory.
+spec_root = None
+# length of each parameter in ids of parametrized specs.
+_parameter_limit = 60
+
+
+def is_ignoring_stack():
+    """Return True while a verifier is running in the current context.
+
+    Test runners use it to trim verifier frames from tracebacks. The flag is
+    kept in a context variable, so verifiers running in other threads or
+    asyncio tasks never change it.
+    """
+    return _ignore_stack.get()
+
+
+def set_ignoring_stack(flag):
+    """Set the flag returned by is_ignoring_stack() in the current context.
+
+    Verifiers defined outside this module call it around their checks and
+    reset it in a finally clause:
+
+        pyspec3.set_ignoring_stack(True)
+        try:
+            ...
+        finally:
+            pyspec3.set_ignoring_stack(False)
+    """
+    _ignore_stack.set(flag)
+
+
+def __getattr__(name):
+    # pyspec3.ignore_stack was a module global before.
+    if name == "ignore_stack":
+        return _ignore_stack.get()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 def get_test_index():
-    global __test_index
-    __test_index += 1
-    return __test_index
+    """Return next ordering number of decorated methods.
+
+    It is safe to call from several threads. The numbers depend on import
+    order, so use spec_id of the attributes to identify specs.
+    """
+    with __test_index_lock:
+        return next(__test_index)
+
+
+def _relative_spec_path(path, root):
+    if root is None:
+        root = spec_root if spec_root is not None else os.getcwd()
+    path = os.path.abspath(path)
+    try:
+        path = os.path.relpath(path, os.path.abspath(root))
+    except ValueError:
+        # path is on another drive than root.
+        pass
+    return path.replace(os.sep, "/")
+
+
+def make_spec_id(function, parameters=None, root=None):
+    """Return stable identifier of spec function.
+
+    It is made from the path of the spec file relative to the run root and
+    the qualified name, like
+    'specs/spec_stack.py::StackBehavior.should_be_empty'. Runner results,
+    and patterns and shards of pyspec3.discovery.select(), use the same
+    ids, so a spec has one id whether it is imported or not. Parameters
+    are added by limited repr(), so large parameters don't make huge ids.
+
+    @param function: spec function, or (path, qualified name) tuple of a
+                     spec found by pyspec3.discovery.
+    @param parameters: tuple of positional arguments or dict of keyword
+                       arguments of a parametrized spec, or None.
+    @param root: directory of the run. None means pyspec3.spec_root.
+    """
+    if isinstance(function, tuple):
+        path, qualname = function
+    else:
+        qualname = getattr(function, "__qualname__", function.__name__)
+        try:
+            path = inspect.getfile(inspect.unwrap(function))
+        except TypeError:
+            path = None
+    if path is None:
+        module = getattr(function, "__module__", None) or "<unknown>"
+        spec_id = "%s::%s" % (module, qualname)
+    else:
+        spec_id = "%s::%s" % (_relative_spec_path(path, root), qualname)
+    if isinstance(parameters, dict):
+        spec_id = "%s[%s]" % (spec_id, ", ".join(
+            "%s=%s" % (key, _limited_repr(value, _parameter_limit))
+            for key, value in parameters.items()))
+    elif parameters is not None:
+        spec_id = "%s[%s]" % (spec_id, ", ".join(
+            _limited_repr(value, _parameter_limit) for value in parameters))
+    return spec_id
+
+
+def spec_key(spec_id):
+    """Return short hex digest of spec id for file names and caches."""
+    return hashlib.sha1(spec_id.encode("utf-8")).hexdigest()[:16]
+
+
+def regist_test_verifier(check_function, verifier, by_type=False):
+    """Register verifier class chosen by predicate.
+
+    value_of() returns verifier(actual) if check_function(actual) is True.
+    Predicates are checked in registration order before type verifiers.
+
+    Each predicate is called at every value_of(), so they cost O(n) for n
+    predicates. If the result of the predicate depends only on the type of
+    the value, like isinstance() checks, give by_type=True. It is called
+    once for each type and the result is cached with type verifiers, so it
+    costs nothing at later value_of() calls.
+
+    @param by_type: True if check_function returns the same result for all
+                    values of the same type.
+    """
+    global __verifiers
+    __verifiers.append((check_function, verifier, by_type))
+    __verifier_cache.clear()
 
 
-def regist_test_verifier(check_function, verifier):
+def unregist_test_verifier(check_function):
+    """Remove verifiers registered with check_function."""
     global __verifiers
-    __verifiers.append((check_function, verifier))
+    __verifiers[:] = [entry for entry in __verifiers
+                      if entry[0] is not check_function]
+    __verifier_cache.clear()
+
+
+def regist_type_verifier(types, verifier):
+    """Register verifier class chosen by type of actual value.
+
+    value_of() looks up the classes in type(actual).__mro__ and uses the
+    verifier of the nearest one. The result is cached for each type, so
+    type verifiers don't slow down value_of() as they increase.
+
+    A type can be given by its qualified name like "numpy.ndarray". It is
+    useful for types of optional modules that should not be imported only
+    to register verifiers.
+
+    @param types: type, qualified type name or tuple of them.
+    @param verifier: verifier class.
+    """
+    global __type_verifiers
+    if not isinstance(types, tuple):
+        types = (types,)
+    for value_type in types:
+        __type_verifiers[value_type] = verifier
+    __verifier_cache.clear()
+
+
+def unregist_type_verifier(types):
+    """Remove type verifiers of types given to regist_type_verifier()."""
+    if not isinstance(types, tuple):
+        types = (types,)
+    for value_type in types:
+        __type_verifiers.pop(value_type, None)
+    __verifier_cache.clear()
+
+
+def _resolve_type_verifier(value_type):
+    for base in value_type.__mro__:
+        verifier = __type_verifiers.get(base)
+        if verifier is None:
+            verifier = __type_verifiers.get(
+                "%s.%s" % (base.__module__, base.__qualname__))
+        if verifier is not None:
+            return verifier
+    return StandardVerifier
+
+
+def _resolve_verifier(actual):
+    """Return (predicates to check at each call, verifier) of the type of
+    actual. by_type predicates are checked here only once."""
+    predicates = []
+    for check_function, verifier, by_type in __verifiers:
+        if not by_type:
+            predicates.append((check_function, verifier))
+        elif check_function(actual):
+            return tuple(predicates), verifier
+    return tuple(predicates), _resolve_type_verifier(type(actual))
 
 
 class IgnoreTestCase(Exception):
@@ -105,11 +329,208 @@ class IgnoreTestCase(Exception):
 
 
 def value_of(actual):
-    global __verifiers
-    for check_function, verifier in __verifiers:
+    value_type = type(actual)
+    try:
+        predicates, verifier = __verifier_cache[value_type]
+    except KeyError:
+        predicates, verifier = __verifier_cache[value_type] = \
+            _resolve_verifier(actual)
+    for check_function, predicate_verifier in predicates:
         if check_function(actual):
-            return verifier(actual)
-    return StandardVerifier(actual)
+            return predicate_verifier(actual)
+    return verifier(actual)
+
+
+class Deferred(object):
+    """Message field of VerifyMethod that is computed only when the
+    template uses it."""
+    __slots__ = ("function", "args")
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __call__(self):
+        return self.function(*self.args)
+
+
+class _Fields(dict):
+    """Mapping of message fields for '%' operator. Deferred values are
+    called when they are read."""
+    __slots__ = ()
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if type(value) is Deferred:
+            return value()
+        return value
+
+
+class Mismatch(object):
+    """Failure of a VerifyMethod predicate with details for the message.
+
+    A predicate returns it instead of False when the failure message needs
+    more than the arguments. It is false in boolean context.
+
+    usage:
+        def equal_lines(actual, expected):
+            for number, (a, e) in enumerate(zip(actual, expected), 1):
+                if a != e:
+                    return pyspec3.Mismatch(line=number,
+                                            lines=["  %r != %r" % (a, e)])
+            return True
+
+    @ivar failure: template used instead of the failure template, or None.
+    @ivar lines: lines added after the message as they are.
+    @ivar exception: exception class raised for the failure.
+    @ivar fields: values added to the template mapping. They can be
+                  Deferred objects.
+    """
+    __slots__ = ("failure", "lines", "exception", "fields")
+    def __init__(self, failure=None, lines=(), exception=AssertionError,
+                 **fields):
+        self.failure = failure
+        self.lines = lines
+        self.exception = exception
+        self.fields = fields
+
+    def __bool__(self):
+        return False
+
+
+class Match(object):
+    """Success of a VerifyMethod predicate with values for the report
+    message. It is true in boolean context.
+
+    @ivar fields: values added to the template mapping. They can be
+                  Deferred objects.
+    """
+    __slots__ = ("fields",)
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def __bool__(self):
+        return True
+
+
+class VerifyMethod(object):
+    """Define a verifier method by a predicate and message templates.
+
+    The generated method calls predicate(actual, *args, **kwargs) and
+    raises AssertionError if it returns false. Source lookup and message
+    formatting are shared with built-in verifiers: they are done only for
+    failures and reported verifications, and only the fields that the
+    template uses are computed. The predicate can return Mismatch to
+    change the failure message and the exception, and Match to add values
+    to the report message.
+
+    Templates are formatted with a mapping that has these keys:
+        actual: expression of the value in the spec code
+        actual_value: expression and the value
+        value: the value
+        parameter names of the predicate after the first one. The first
+        of them is shown with its expression in the spec code, and
+        <name>_source has only the expression.
+
+    usage:
+        class PathVerifier(pyspec3.StandardVerifier):
+            should_exist = pyspec3.VerifyMethod(
+                lambda actual: os.path.exists(actual),
+                "%(actual)s should exist, but didn't.",
+                "%(actual)s should exist.")
+
+            should_have_size = pyspec3.VerifyMethod(
+                lambda actual, size: os.path.getsize(actual) == size,
+                "%(actual)s should have %(size)s bytes, but didn't.",
+                "%(actual)s should have %(size)s bytes.")
+
+    @param predicate: function that returns True if the value is correct
+    @param failure: template of AssertionError message
+    @param success: template of report message
+    @param doc: docstring of the method
+    """
+    __slots__ = ("predicate", "failure", "success", "doc")
+    def __init__(self, predicate, failure, success, doc=None):
+        self.predicate = predicate
+        self.failure = failure
+        self.success = success
+        self.doc = doc
+
+    def __set_name__(self, owner, name):
+        method = self.build(name)
+        method.__qualname__ = "%s.%s" % (owner.__qualname__, name)
+        setattr(owner, name, method)
+
+    def build(self, name):
+        """Return verifier method function named name."""
+        predicate = self.predicate
+        failure = self.failure
+        success = self.success
+        parameters = list(inspect.signature(predicate).parameters.values())
+        names = [parameter.name for parameter in parameters[1:]
+                 if parameter.kind not in (parameter.VAR_POSITIONAL,
+                                           parameter.VAR_KEYWORD)]
+        defaults = dict((parameter.name, parameter.default)
+                        for parameter in parameters[1:]
+                        if parameter.default is not parameter.empty)
+
+        def fields(verifier, args, kwargs):
+            """Return source code and mapping of message fields."""
+            if names:
+                source, match1, match2 = verifier._get_arguments(name, 1)
+            else:
+                source = match1 = verifier._get_target(1)
+                match2 = None
+            values = dict(defaults)
+            values.update(zip(names, args))
+            values.update(kwargs)
+            mapping = _Fields(
+                actual=Deferred(verifier._source, match1, verifier.actual),
+                actual_value=Deferred(verifier._value_with_source, match1,
+                                      verifier.actual),
+                value=Deferred(verifier._value, verifier.actual))
+            for index, key in enumerate(names):
+                if key not in values:
+                    continue
+                if index == 0:
+                    match = match2 if args else None
+                    mapping[key + "_source"] = Deferred(verifier._source,
+                                                        match, values[key])
+                if index == 0 and args:
+                    mapping[key] = Deferred(verifier._value_with_source,
+                                            match2, values[key])
+                else:
+                    mapping[key] = Deferred(verifier._value, values[key])
+            return source, mapping
+
+        def method(self, *args, **kwargs):
+            _ignore_stack.set(True)
+            try:
+                result = predicate(self.actual, *args, **kwargs)
+                if not result:
+                    source, mapping = fields(self, args, kwargs)
+                    if type(result) is not Mismatch:
+                        raise AssertionError(failure % mapping)
+                    mapping.update(result.fields)
+                    msg = (result.failure or failure) % mapping
+                    raise result.exception("\n".join([msg] +
+                                                     list(result.lines)))
+                if not self._is_reported():
+                    return self._count()
+                source, mapping = fields(self, args, kwargs)
+                if type(result) is Match:
+                    mapping.update(result.fields)
+                msg = success % mapping
+                self._write((source, msg))
+                return msg
+            finally:
+                _ignore_stack.set(False)
+
+        method.__name__ = name
+        method.__doc__ = self.doc
+        return method
+
+
+# verify_method was the name of VerifyMethod before.
+verify_method = VerifyMethod
 
 
 class VerifierBase(object):
@@ -118,21 +539,32 @@ class VerifierBase(object):
         self.actual = actual
 
     @staticmethod
-    def _get_target():
-        import re
-        source = compat_ironpython.get_source_code(3)
-        if source is None:
+    def _get_target(depth=0):
+        """Return the expression of actual value in the spec code.
+
+        @param depth: number of frames between the verifier method and
+                      the caller of this method.
+        """
+        if sys.platform == "cli":
             return None
-        match = re.search(r"About\((.*?)\).should", source)
-        if match:
-            return match.group(1)
-        return None
+        return _find_target(3 + depth)
+
+    @staticmethod
+    def _get_arguments(method_name, depth=0):
+        """Return (source code, actual expression, expected expression).
+
+        @param depth: number of frames between the verifier method and
+                      the caller of this method.
+        """
+        if sys.platform == "cli":
+            return None, None, None
+        return _find_arguments(method_name, 3 + depth)
 
     @staticmethod
     def _source(source, actual):
         if source is not None:
             return "%s" % source
-        return "<%r>" % actual
+        return "<%s>" % _limited_repr(actual)
 
     @classmethod
     def _value_with_source(cls, source, actual):
@@ -140,19 +572,265 @@ class VerifierBase(object):
             value = cls._value(actual)
             if source == value:
                 return value
-            return "%s(=%s)" % (source, cls._value(actual))
-        return "<%r>" % actual
+            return "%s(=%s)" % (source, value)
+        return "<%s>" % _limited_repr(actual)
 
     @staticmethod
     def _value(value):
+        """Return short string of the value for messages.
+
+        Long values are cut by pyspec3.valuediff.config.repr_limit.
+        """
         if isinstance(value, str):
-            return '"%s"' % value
-        return '%s' % str(value)
+            return '"%s"' % _shorten(value)
+        return _limited_str(value)
+
+    @staticmethod
+    def _is_reported():
+        """Return True if passed verifications should make messages.
+
+        If it returns False, verifiers only count passed verifications and
+        skip source lookup and message building. should_equal() and
+        should_not_equal() return their messages, so they skip them only in
+        count_only mode.
+        """
+        return report_out is not None and not count_only
+
+    @staticmethod
+    def _count():
+        global passed_count
+        with _passed_count_lock:
+            passed_count += 1
 
     @staticmethod
     def _write(value):
-        if report_out:
-            report_out.write(value)
+        """Count passed verification and send (source, message) to
+        report_out."""
+        global passed_count
+        with _passed_count_lock:
+            passed_count += 1
+        # report_out may be replaced by another thread after the check.
+        out = report_out
+        if out:
+            out.write(value)
+
+
+def _stream_items(item, after):
+    items = [] if item is _END else [item]
+    items.extend(after)
+    return _limited_repr(items)
+
+
+def _equal_streams(actual, expected, chunk_size=1024, window=3):
+    difference = _compare_streams(actual, expected, chunk_size, window)
+    if not difference:
+        return True
+    return Mismatch(
+        reason=difference.reason(),
+        lines=["  before:   %s" % _limited_repr(difference.before),
+               "  expected: %s" % _stream_items(difference.expected,
+                                                difference.expected_after),
+               "  actual:   %s" % _stream_items(difference.actual,
+                                                difference.actual_after)])
+
+
+def _equal_files(actual, expected, chunk_size=1 << 20):
+    difference = _compare_contents(actual, expected, chunk_size)
+    if not difference:
+        return True
+    return Mismatch(lines=difference.lines())
+
+
+def _matches_snapshot(actual, name):
+    # frames: this function, the verifier method and the spec.
+    result = _check_snapshot(sys._getframe(2), name, actual)
+    if result.status == "missing":
+        return Mismatch("%(actual)s should match snapshot %(name)s, but it "
+                        "was not recorded.")
+    if result.status != "different":
+        return True
+    if result.expected is None:
+        return Mismatch(lines=["snapshot content was lost: %s" % result.path])
+    lines = []
+    difference = _describe_difference(_deserialize_snapshot(result.expected),
+                                      _deserialize_snapshot(result.actual))
+    if difference:
+        lines.append(difference)
+    lines.append("snapshot: %s" % result.path)
+    return Mismatch(lines=lines)
+
+
+def _resolves_to(actual, expected, within=None):
+    if not _is_awaitable(actual):
+        return Mismatch("%(actual_value)s should be awaitable.",
+                        exception=TypeError)
+    try:
+        result = _run_awaitable(actual, within)
+    except TimeoutError:
+        return Mismatch("%(actual)s should complete within %(within)s, but "
+                        "it was cancelled.", within=_format_time(within * 1e9))
+    if expected == result:
+        return True
+    difference = _describe_difference(expected, result)
+    return Mismatch(lines=[difference] if difference else [],
+                    expected=Deferred(VerifierBase._value, expected),
+                    result=Deferred(VerifierBase._value, result))
+
+def _not_collection(actual):
+    if not hasattr(actual, "__contains__") and \
+            not hasattr(actual, "__iter__"):
+        return Mismatch("%(actual_value)s should have __contains__ or "
+                        "__iter__ method.", exception=TypeError)
+    return None
+
+
+def _includes_all(actual, expected, max_report=10):
+    mismatch = _not_collection(actual)
+    if mismatch is not None:
+        return mismatch
+    count, missing = _missing_items(actual, expected, max_report)
+    if not count:
+        return True
+    return Mismatch(count=count,
+                    missing=Deferred(VerifierBase._value, missing))
+
+
+def _includes_none(actual, expected, max_report=10):
+    mismatch = _not_collection(actual)
+    if mismatch is not None:
+        return mismatch
+    count, included = _included_items(actual, expected, max_report)
+    if not count:
+        return True
+    return Mismatch(count=count,
+                    included=Deferred(VerifierBase._value, included))
+
+
+def _has_same_elements(actual, expected, max_report=10):
+    mismatch = _not_collection(actual)
+    if mismatch is not None:
+        return mismatch
+    (missing_count, missing), (unexpected_count, unexpected) = \
+        _different_elements(actual, expected, max_report)
+    if not missing_count and not unexpected_count:
+        return True
+    return Mismatch(missing_count=missing_count,
+                    missing=Deferred(VerifierBase._value, missing),
+                    unexpected_count=unexpected_count,
+                    unexpected=Deferred(VerifierBase._value, unexpected))
+
+
+def _cancelled(within):
+    return Mismatch("%(actual)s should complete within %(within)s, but it "
+                    "was cancelled.", within=_format_time(within * 1e9))
+
+
+def _all_resolve_to(actual, expected, within=None):
+    awaitables = list(actual)
+    for awaitable in awaitables:
+        if not _is_awaitable(awaitable):
+            _close_awaitables(awaitables)
+            return Mismatch("%(actual)s should be awaitables, but had "
+                            "%(item)s.", exception=TypeError,
+                            item=Deferred(VerifierBase._value, awaitable))
+    try:
+        results = _gather(awaitables, within)
+    except TimeoutError:
+        return _cancelled(within)
+    expected = list(expected)
+    if expected == results:
+        return Match(expected=Deferred(VerifierBase._value, expected))
+    difference = _describe_difference(expected, results)
+    return Mismatch(lines=[difference] if difference else [],
+                    expected=Deferred(VerifierBase._value, expected),
+                    result=Deferred(VerifierBase._value, results))
+
+
+def _not_callable(actual, **values):
+    """Return Mismatch if actual or one of values is not callable. The
+    message shows the value by its field name."""
+    if not callable(actual):
+        return Mismatch("%(actual_value)s should be callable.",
+                        exception=TypeError)
+    for name, value in values.items():
+        if not callable(value):
+            return Mismatch("%%(%s)s should be callable." % name,
+                            exception=TypeError)
+    return None
+
+
+def _completes_within(actual, seconds, percentile=50, repeat=None,
+                      warmup=1):
+    budget = _format_time(seconds * 1e9)
+    if _is_awaitable(actual):
+        try:
+            result, elapsed = _run_timed(actual, seconds)
+        except TimeoutError:
+            return _cancelled(seconds)
+        timing = _Timing([elapsed], 1)
+    else:
+        mismatch = _not_callable(actual)
+        if mismatch is not None:
+            return mismatch
+        timing = _measure(_synchronous(actual), repeat=repeat, warmup=warmup)
+    measured = timing.percentile(percentile)
+    if measured > seconds * 1e9:
+        return Mismatch(budget=budget, percentile=percentile,
+                        measured=_format_time(measured), timing=timing)
+    return Match(budget=budget, timing=timing)
+
+
+def _faster_than(actual, expected, times=1.0, percentile=50, repeat=None,
+                 warmup=1):
+    mismatch = _not_callable(actual, expected=expected)
+    if mismatch is not None:
+        return mismatch
+    timing = _measure(_synchronous(actual), repeat=repeat, warmup=warmup)
+    expected_timing = _measure(_synchronous(expected), repeat=repeat,
+                               warmup=warmup)
+    measured = timing.percentile(percentile)
+    expected_measured = expected_timing.percentile(percentile)
+    if measured * times >= expected_measured:
+        return Mismatch(times=times, percentile=percentile,
+                        measured=_format_time(measured),
+                        expected_measured=_format_time(expected_measured),
+                        timing=timing, expected_timing=expected_timing)
+    return Match(times=times, timing=timing, expected_timing=expected_timing)
+
+
+def _allocates_less_than(actual, size, net=False):
+    mismatch = _not_callable(actual)
+    if mismatch is not None:
+        return mismatch
+    allocation = _measure_allocation(actual)
+    kind = "net" if net else "peak"
+    measured = allocation.net if net else allocation.peak
+    if measured >= size:
+        return Mismatch(lines=["  %s" % line
+                               for line in allocation.top_lines()],
+                        budget=_format_size(size), kind=kind,
+                        measured=_format_size(measured),
+                        allocation=allocation)
+    return Match(budget=_format_size(size), allocation=allocation)
+
+
+def _scales_as(actual, complexity, generator, sizes=None, tolerance=0.3,
+               repeat=3):
+    mismatch = _not_callable(actual, generator=generator)
+    if mismatch is not None:
+        return mismatch
+    scaling = _measure_scaling(actual, generator, sizes, repeat)
+    limit = _complexity_exponent(complexity, scaling.sizes)
+    table = Deferred("\n  ".join, scaling.table())
+    if scaling.exponent > limit + tolerance:
+        return Mismatch(complexity=complexity, limit=limit,
+                        exponent=scaling.exponent, table=table)
+    return Match(complexity=complexity, scaling=scaling, table=table)
+
+
+def _scales_linearly(actual, generator, sizes=None, tolerance=0.3,
+                     repeat=3):
+    return _scales_as(actual, "O(n)", generator, sizes, tolerance, repeat)
 
 
 class StandardVerifier(VerifierBase):
@@ -164,6 +842,8 @@ class StandardVerifier(VerifierBase):
         a = 100
         About(a).should_equal(10)
     """
+    __slots__ = ()
+
     def should_equal(self, expected):
         """Test the value is equal to a target.
 
@@ -177,20 +857,83 @@ class StandardVerifier(VerifierBase):
 
         @param expected: target value
         """
-        global ignore_stack
-        ignore_stack = True
-        source = self._get_target()
-        if not expected == self.actual:
-            msg = "%s should equal %s, but was %s." % \
-                (self._source(source, self.actual),
-                 self._value(expected), self._value(self.actual))
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should equal %s." % \
-            (self._source(source, self.actual), self._value(expected))
-        self._write((source, msg))
-        ignore_stack = False
-        return msg
+        _ignore_stack.set(True)
+        try:
+            try:
+                equal = expected == self.actual
+            except RecursionError:
+                equal = _deep_equal(expected, self.actual)
+            if not equal:
+                source = self._get_target()
+                msg = "%s should equal %s, but was %s." % \
+                    (self._source(source, self.actual),
+                     self._value(expected), self._value(self.actual))
+                difference = _describe_difference(expected, self.actual)
+                if difference:
+                    msg = "%s\n%s" % (msg, difference)
+                raise AssertionError(msg)
+            if count_only:
+                return self._count()
+            source = self._get_target()
+            msg = "%s should equal %s." % \
+                (self._source(source, self.actual), self._value(expected))
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
+
+    should_equal_stream = VerifyMethod(
+        _equal_streams,
+        "%(actual)s should equal stream %(expected_source)s, but %(reason)s.",
+        "%(actual)s should equal stream %(expected_source)s.",
+        doc="""Test the iterable yields the same items as expected iterable.
+
+        Both iterables are read in lockstep, chunk_size items at a time,
+        and it stops at the first difference. The streams are never
+        converted to lists, so memory doesn't grow with their lengths.
+
+        usage:
+            About(read_records(path)).should_equal_stream(expected_records())
+            About(iter([1, 2, 3])).should_equal_stream(range(1, 4)) # OK!
+
+        @param expected: iterable of expected items
+        @param chunk_size: number of items read from each stream at once
+        @param window: number of items shown around the difference
+        """)
+
+    should_equal_file = VerifyMethod(
+        _equal_files,
+        "%(actual_value)s should equal file %(expected)s, but was different.",
+        "%(actual_value)s should equal file %(expected)s.",
+        doc="""Test the file has the same bytes as expected file or bytes.
+
+        The value and expected are paths or bytes-like objects. Files are
+        memory-mapped and compared chunk by chunk, so whole files are never
+        read into memory.
+
+        usage:
+            About("out/result.csv").should_equal_file("expected/result.csv")
+            About("out/header.bin").should_equal_file(b"PK\x03\x04")
+
+        @param expected: path or bytes-like object
+        @param chunk_size: number of bytes compared at once
+        """)
+
+    should_match_snapshot = VerifyMethod(
+        _matches_snapshot,
+        "%(actual)s should match snapshot %(name)s, but was different.",
+        "%(actual)s should match snapshot %(name)s.",
+        doc="""Test the value is the same as the recorded snapshot.
+
+        The snapshot is recorded at the first run in '__snapshots__'
+        directory next to the spec file. Set PYSPEC_UPDATE_SNAPSHOTS=1 to
+        rewrite snapshots that are different. See pyspec3.snapshot.
+
+        usage:
+            About(render_page()).should_match_snapshot("front page")
+
+        @param name: snapshot name that is unique in the spec function
+        """)
 
     def should_not_equal(self, expected, msg = None):
         """Test the value is unequal to a target.
@@ -205,20 +948,23 @@ class StandardVerifier(VerifierBase):
 
         @param expected: target value
         """
-        global ignore_stack
-        ignore_stack = True
-        source = self._get_target()
-        if expected == self.actual:
-            msg = "%s should not equal %s, but equal." % \
-                (self._source(source, self.actual), self._value(expected))
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should not equal %s." % \
-            (self._value_with_source(source, self.actual),
-             self._value(expected))
-        self._write((source, msg))
-        ignroe_stack = False
-        return msg
+        _ignore_stack.set(True)
+        try:
+            if expected == self.actual:
+                source = self._get_target()
+                msg = "%s should not equal %s, but equal." % \
+                    (self._source(source, self.actual), self._value(expected))
+                raise AssertionError(msg)
+            if count_only:
+                return self._count()
+            source = self._get_target()
+            msg = "%s should not equal %s." % \
+                (self._value_with_source(source, self.actual),
+                 self._value(expected))
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
 
     def should_equal_nearly(self, expected, tolerance=None):
         """Test the value is near to a target value.
@@ -237,20 +983,26 @@ class StandardVerifier(VerifierBase):
         @type  tolerance: float
 
         """
-        global ignore_stack
-        ignore_stack = True
-        if tolerance is None:
-            tolerance = expected * 0.01
-        source = self._get_target()
-        if abs(expected - self.actual) > tolerance:
-            msg = "%s should equal nearly %f(within %f), but was %f." % \
-                (self._source(source, self.actual), expected, tolerance, self.actual)
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should not equal %f(more than %f)." % \
-            (self._value_with_source(source, self.actual), expected, tolerance)
-        self._write((source, msg))
-        ignore_stack = False
+        _ignore_stack.set(True)
+        try:
+            if tolerance is None:
+                tolerance = expected * 0.01
+            if abs(expected - self.actual) > tolerance:
+                source = self._get_target()
+                msg = "%s should equal nearly %f(within %f), but was %f." % \
+                    (self._source(source, self.actual), expected, tolerance,
+                     self.actual)
+                raise AssertionError(msg)
+            if not self._is_reported():
+                return self._count()
+            source = self._get_target()
+            msg = "%s should not equal %f(more than %f)." % \
+                (self._value_with_source(source, self.actual), expected,
+                 tolerance)
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
 
     def should_not_equal_nearly(self, expected, tolerance=None):
         """Test the value is far from a target value.
@@ -269,256 +1021,413 @@ class StandardVerifier(VerifierBase):
         @type  tolerance: float
 
         """
-        global ignore_stack
-        ignore_stack = True
-        if tolerance is None:
-            tolerance = expected * 0.01
-        source = self._get_target()
-        if abs(expected - self.actual) < tolerance:
-            msg = "%s should not equal %f(more than %f), but was." % \
-                (self._source(source, self.actual), expected, tolerance)
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should not equal nearly %f(within %f)." % \
-            (self._value_with_source(source, self.actual), expected, tolerance)
-        self._write((source, msg))
-        ignore_stack = False
-
-    def should_be_true(self, msg=""):
-        """Fail if value is not True."""
-        global ignore_stack
-        ignore_stack = True
-        source = self._get_target()
-        if not self.actual:
-            msg = "%s should be True, but was False." % \
-                self._source(source, self.actual)
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should be True." % \
-            self._source(source, self.actual)
-        self._write((source, msg))
-        ignore_stack = False
-
-    def should_be_false(self, msg=""):
-        """Fail if value is not False."""
-        global ignore_stack
-        ignore_stack = True
-        source = self._get_target()
-        if self.actual:
-            msg = "%s should be False, but was True." % \
-                self._source(source, self.actual)
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should be False." % \
-            self._source(source, self.actual)
-        self._write((source, msg))
-        ignore_stack = False
-
-    def should_be_none(self, msg=""):
-        """Fail if value is not None."""
-        global ignore_stack
-        ignore_stack = True
-        source = self._get_target()
-        if self.actual is not None:
-            msg = "%s should be None, but was not." % \
-                self._source(source, self.actual)
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should be None." % \
-            self._source(source, self.actual)
-        self._write((source, msg))
-        ignore_stack = False
-
-    def should_not_be_none(self, msg=""):
-        """Fail if value is None."""
-        global ignore_stack
-        ignore_stack = True
-        source = self._get_target()
-        if self.actual is None:
-            msg = "%s should not be None, but was." % \
-                self._source(source, self.actual)
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should not be None." % \
-            self._source(source, self.actual)
-        self._write((source, msg))
-        ignore_stack = False
+        _ignore_stack.set(True)
+        try:
+            if tolerance is None:
+                tolerance = expected * 0.01
+            if abs(expected - self.actual) < tolerance:
+                source = self._get_target()
+                msg = "%s should not equal %f(more than %f), but was." % \
+                    (self._source(source, self.actual), expected, tolerance)
+                raise AssertionError(msg)
+            if not self._is_reported():
+                return self._count()
+            source = self._get_target()
+            msg = "%s should not equal nearly %f(within %f)." % \
+                (self._value_with_source(source, self.actual), expected,
+                 tolerance)
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
+
+    should_be_true = VerifyMethod(
+        lambda actual, msg="": actual,
+        "%(actual)s should be True, but was False.",
+        "%(actual)s should be True.",
+        doc="Fail if value is not True.")
+
+    should_be_false = VerifyMethod(
+        lambda actual, msg="": not actual,
+        "%(actual)s should be False, but was True.",
+        "%(actual)s should be False.",
+        doc="Fail if value is not False.")
+
+    should_be_none = VerifyMethod(
+        lambda actual, msg="": actual is None,
+        "%(actual)s should be None, but was not.",
+        "%(actual)s should be None.",
+        doc="Fail if value is not None.")
+
+    should_not_be_none = VerifyMethod(
+        lambda actual, msg="": actual is not None,
+        "%(actual)s should not be None, but was.",
+        "%(actual)s should not be None.",
+        doc="Fail if value is None.")
 
     def should_be_same(self, expected, msg = None):
         """Fail if the two objects are different as determined by the 'is'
              operator.
         """
-        import re
-        global ignore_stack
-        ignore_stack = True
-        source = compat_ironpython.get_source_code()
-        if source is None:
-            match1 = None
-            match2 = None
-        else:
-            m = re.search(r"About\((.*?)\).should_be_same\((.*?)\)", source)
-            match1 = m.group(1)
-            match2 = m.group(2)
-        if not expected is self.actual:
+        _ignore_stack.set(True)
+        try:
+            if not expected is self.actual:
+                source, match1, match2 = self._get_arguments("should_be_same")
+                try:
+                    msg = "%s(id=%d) should be same %s(id=%d), but was " \
+                          "not." % \
+                        (self._source(match1, self.actual), id(self.actual), \
+                         self._source(match2, expected), id(expected))
+                except:
+                    msg = "%s(id=%d) should be same %s(id=%d), but was " \
+                          "not." % \
+                        (self.actual, id(self.actual), expected, id(expected))
+                raise AssertionError(msg)
+            if not self._is_reported():
+                return self._count()
+            source, match1, match2 = self._get_arguments("should_be_same")
             try:
-                msg = "%s(id=%d) should be same %s(id=%d), but was not." % \
-                    (self._source(match1, self.actual), id(self.actual), \
-                     self._source(match2, expected), id(expected))
+                msg = "%s should be same %s." % \
+                    (self._source(match1, self.actual),
+                     self._source(match2, expected))
             except:
-                msg = "%s(id=%d) should be same %s(id=%d), but was not." % \
-                    (self.actual, id(self.actual), expected, id(expected))
-            ignore_stack = False
-            raise AssertionError(msg)
-        try:
-            msg = "%s should be same %s." % \
-                (self._source(match1, self.actual), \
-                 self._source(match2, expected))
-        except:
-            msg = "%s should not equal %s." % \
-                (self.actual, expected)
-        self._write((source, msg))
-        ignore_stack = False
+                msg = "%s should be same %s." % (self.actual, expected)
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
 
     def should_not_be_same(self, expected, msg = None):
         """Fail if the two objects are different as determined by the 'is'
              operator.
         """
-        from re import search
-        global ignore_stack
-        ignore_stack = True
-        source = compat_ironpython.get_source_code()
-        if source is None:
-             match1 = None
-             match2 = None
-        else:
-             m = search(r"About\((.*?)\).should_not_be_same\((.*?)\)", source)
-             match1 = m.group(1)
-             match2 = m.group(2)
-        if expected is self.actual:
+        _ignore_stack.set(True)
+        try:
+            if expected is self.actual:
+                source, match1, match2 = \
+                    self._get_arguments("should_not_be_same")
+                try:
+                    msg = "%s should not be same %s, but equal." % \
+                        (self._source(match1, self.actual), \
+                         self._source(match2, expected))
+                except:
+                    msg = "%s should not be same %s, but equal." % \
+                        (self.actual, expected)
+                raise AssertionError(msg)
+            if not self._is_reported():
+                return self._count()
+            source, match1, match2 = self._get_arguments("should_not_be_same")
             try:
-                msg = "%s should not be same %s, but equal." % \
-                    (self._source(match1, self.actual), \
-                     self._source(match2, expected))
+                msg = "%s(id=%d) should not be same %s(id=%d)." % \
+                    (self._source(match1, self.actual), id(self.actual),
+                     self._source(match2, expected), id(expected))
             except:
-                msg = "%s should not be same %s, but equal." % \
-                    (self.actual, expected)
-            ignore_stack = False
-            raise AssertionError(msg)
-        try:
-            msg = "%s(id=%d) should not be same %s(id=%d)." % \
-                (self._source(match1, self.actual), id(self.actual), \
-                 self._source(match2, expected), id(expected))
-        except:
-            msg = "%s(id=%d) should not be same %s(id=%d)." % \
-                (self.actual, id(self.actual), expected, id(expected))
-        self._write((source, msg))
-        ignore_stack = False
+                msg = "%s(id=%d) should not be same %s(id=%d)." % \
+                    (self.actual, id(self.actual), expected, id(expected))
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
 
     def should_include(self, expected, msg = None):
-        from re import search
-        global ignore_stack
-        ignore_stack = True
-        source = compat_ironpython.get_source_code()
-        if source is None:
-             match1 = None
-             match2 = None
-        else:
-             m = search(r"About\((.*?)\).should_include\((.*?)\)", source)
-             match1 = m.group(1)
-             match2 = m.group(2)
-        if (not hasattr(self.actual, "__contains__")
-            and not hasattr(self.actual, "__iter__")):
-            msg = "%s should have __contains__ or __iter__ method." % \
-                self._value_with_source(match1, self.actual)
-            ignore_stack = False
-            raise TypeError(msg)
-        elif not expected in self.actual:
-            msg = "%s should include %s, but didn't." % \
-                (self._value_with_source(match1, self.actual), \
+        _ignore_stack.set(True)
+        try:
+            if (not hasattr(self.actual, "__contains__")
+                and not hasattr(self.actual, "__iter__")):
+                source, match1, match2 = self._get_arguments("should_include")
+                msg = "%s should have __contains__ or __iter__ method." % \
+                    self._value_with_source(match1, self.actual)
+                raise TypeError(msg)
+            elif not expected in self.actual:
+                source, match1, match2 = self._get_arguments("should_include")
+                msg = "%s should include %s, but didn't." % \
+                    (self._value_with_source(match1, self.actual), \
+                     self._value_with_source(match2, expected))
+                raise AssertionError(msg)
+            if not self._is_reported():
+                return self._count()
+            source, match1, match2 = self._get_arguments("should_include")
+            msg = "%s should include %s." % \
+                (self._value_with_source(match1, self.actual),
                  self._value_with_source(match2, expected))
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should include %s." % \
-            (self._value_with_source(match1, self.actual), \
-             self._value_with_source(match2, expected))
-        self._write((source, msg))
-        ignore_stack = False
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
 
     def should_not_include(self, expected, msg = None):
-        from re import search
-        global ignore_stack
-        ignore_stack = True
-        source = compat_ironpython.get_source_code()
-        if source is None:
-             match1 = None
-             match2 = None
-        else:
-             m = search(r"About\((.*?)\).should_not_include\((.*?)\)", source)
-             match1 = m.group(1)
-             match2 = m.group(2)
-        if (not hasattr(self.actual, "__contains__")
-            and not hasattr(self.actual, "__iter__")):
-            msg = "%s should have __contains__ or __iter__ method." % \
-                self._value_with_source(match1, self.actual)
-            ignore_stack = False
-            raise TypeError(msg)
-        elif expected in self.actual:
+        _ignore_stack.set(True)
+        try:
+            if (not hasattr(self.actual, "__contains__")
+                and not hasattr(self.actual, "__iter__")):
+                source, match1, match2 = \
+                    self._get_arguments("should_not_include")
+                msg = "%s should have __contains__ or __iter__ method." % \
+                    self._value_with_source(match1, self.actual)
+                raise TypeError(msg)
+            elif expected in self.actual:
+                source, match1, match2 = \
+                    self._get_arguments("should_not_include")
+                try:
+                    msg = "%s should not include %s, but include." % \
+                        (self._value_with_source(match1, self.actual), \
+                         self._value_with_source(match2, expected))
+                except:
+                    msg = "%s should not include %s, but include." % \
+                        (self.actual, expected)
+                raise AssertionError(msg)
+            if not self._is_reported():
+                return self._count()
+            source, match1, match2 = self._get_arguments("should_not_include")
             try:
-                msg = "%s should not include %s, but include." % \
-                    (self._value_with_source(match1, self.actual), \
+                msg = "%s should not include %s." % \
+                    (self._value_with_source(match1, self.actual),
                      self._value_with_source(match2, expected))
             except:
-                msg = "%s should not include %s, but include." % \
-                    (self.actual, expected)
-            ignore_stack = False
-            raise AssertionError(msg)
-        try:
-            msg = "%s should not include %s." % \
-                (self._value_with_source(match1, self.actual), \
-                 self._value_with_source(match2, expected))
-        except:
-            msg = "%s should not include %s." % \
-                (self.actual, expected)
-        self._write((source, msg))
-        ignore_stack = False
+                msg = "%s should not include %s." % (self.actual, expected)
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
+
+    should_include_all = VerifyMethod(
+        _includes_all,
+        "%(actual_value)s should include all of %(expected)s, but "
+        "%(count)d items were missing: %(missing)s",
+        "%(actual_value)s should include all of %(expected)s.",
+        doc="""Fail if any of expected items are not in the value.
+
+        It makes one hash index of the value, so checking m items in n items
+        costs O(n+m) instead of O(n*m) of repeated should_include(). str,
+        bytes and values that have their own __contains__ are checked by
+        the 'in' operator.
+
+        usage:
+            a = [1, 2, 3, 4]
+            About(a).should_include_all([1, 3]) # OK!
+            About(a).should_include_all([1, 5]) # Fail!
+
+        @param expected: iterable of items
+        @param max_report: number of missing items shown in the message
+        """)
+
+    should_include_none = VerifyMethod(
+        _includes_none,
+        "%(actual_value)s should include none of %(expected)s, but "
+        "%(count)d items were included: %(included)s",
+        "%(actual_value)s should include none of %(expected)s.",
+        doc="""Fail if any of expected items are in the value.
+
+        usage:
+            a = [1, 2, 3, 4]
+            About(a).should_include_none([5, 6]) # OK!
+            About(a).should_include_none([1, 5]) # Fail!
+
+        @param expected: iterable of items
+        @param max_report: number of included items shown in the message
+        """)
+
+    should_have_same_elements = VerifyMethod(
+        _has_same_elements,
+        "%(actual_value)s should have same elements as %(expected)s, but "
+        "%(missing_count)d items were missing: %(missing)s and "
+        "%(unexpected_count)d items were unexpected: %(unexpected)s",
+        "%(actual_value)s should have same elements as %(expected)s.",
+        doc="""Fail if the value and expected don't have the same elements.
+
+        Order is ignored, but the number of each element is checked.
+
+        usage:
+            a = [3, 1, 2, 1]
+            About(a).should_have_same_elements([1, 1, 2, 3]) # OK!
+            About(a).should_have_same_elements([1, 2, 3])    # Fail!
+
+        @param expected: iterable of items
+        @param max_report: number of different items shown in the message
+        """)
 
     def should_be_empty(self, msg = None):
-        global ignore_stack
-        ignore_stack = True
-        source = self._get_target()
-        if not hasattr(self.actual, "__len__"):
-            msg = "%s should have __len__ method." % \
-                self._source(source, self.actual)
-            ignore_stack = False
-            raise AssertionError(msg)
-        if len(self.actual) != 0:
-            msg = "%s should be empty, but was not." % \
+        _ignore_stack.set(True)
+        try:
+            if not hasattr(self.actual, "__len__"):
+                source = self._get_target()
+                msg = "%s should have __len__ method." % \
+                    self._source(source, self.actual)
+                raise AssertionError(msg)
+            if len(self.actual) != 0:
+                source = self._get_target()
+                msg = "%s should be empty, but was not." % \
+                    self._source(source, self.actual)
+                raise AssertionError(msg)
+            if not self._is_reported():
+                return self._count()
+            source = self._get_target()
+            msg = "%s should be empty." % \
                 self._source(source, self.actual)
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should be empty." % \
-            self._source(source, self.actual)
-        self._write((source, msg))
-        ignore_stack = False
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
 
     def should_not_be_empty(self, msg = None):
-        global ignore_stack
-        ignore_stack = True
-        source = self._get_target()
-        if not hasattr(self.actual, "__len__"):
-            msg = "%s should have __len__ method." % \
-                self._source(source, self.actual)
-            ignore_stack = False
-            raise AssertionError(msg)
-        if len(self.actual) == 0:
-            msg = "%s should not be empty, but was empty." % \
+        _ignore_stack.set(True)
+        try:
+            if not hasattr(self.actual, "__len__"):
+                source = self._get_target()
+                msg = "%s should have __len__ method." % \
+                    self._source(source, self.actual)
+                raise AssertionError(msg)
+            if len(self.actual) == 0:
+                source = self._get_target()
+                msg = "%s should not be empty, but was empty." % \
+                    self._source(source, self.actual)
+                raise AssertionError(msg)
+            if not self._is_reported():
+                return self._count()
+            source = self._get_target()
+            msg = "%s should not be empty." % \
                 self._source(source, self.actual)
-            ignore_stack = False
-            raise AssertionError(msg)
-        msg = "%s should not be empty." % \
-            self._source(source, self.actual)
-        self._write((source, msg))
-        ignore_stack = False
+            self._write((source, msg))
+            return msg
+        finally:
+            _ignore_stack.set(False)
+
+    should_resolve_to = VerifyMethod(
+        _resolves_to,
+        "%(actual)s should resolve to %(expected)s, but was %(result)s.",
+        "%(actual)s should resolve to %(expected)s.",
+        doc="""Fail if the awaitable doesn't result in expected value.
+
+        The awaitable is run on the shared event loop.
+
+        usage:
+            About(fetch_status()).should_resolve_to("ok")
+            About(fetch_status()).should_resolve_to("ok", within=0.5)
+
+        @param expected: expected result
+        @param within: time budget in seconds
+        """)
+
+    should_all_resolve_to = VerifyMethod(
+        _all_resolve_to,
+        "%(actual)s should resolve to %(expected)s, but was %(result)s.",
+        "%(actual)s should all resolve to %(expected)s.",
+        doc="""Fail if the awaitables gathered concurrently don't result in
+        expected values.
+
+        usage:
+            About([fetch(1), fetch(2)]).should_all_resolve_to(["a", "b"])
+
+        @param expected: list of expected results in the same order
+        @param within: time budget of the whole batch in seconds
+        """)
+
+    should_complete_within = VerifyMethod(
+        _completes_within,
+        "%(actual)s should complete within %(budget)s, but p%(percentile)g "
+        "was %(measured)s. (%(timing)s)",
+        "%(actual)s should complete within %(budget)s. (%(timing)s)",
+        doc="""Fail if the callable takes more time than seconds.
+
+        The callable is called with warmup and calibrated loops, and the
+        percentile of the mean per-call durations of the samples is
+        compared with the budget. It is not the latency of single calls.
+
+        Coroutine functions are called on the shared event loop. An
+        awaitable like coroutine object can run only once, so it is run
+        once on the shared loop and cancelled when the budget is over.
+
+        usage:
+            About(lambda: sorted(data)).should_complete_within(0.01)
+            About(lambda: query()).should_complete_within(0.2, percentile=90)
+            About(fetch(url)).should_complete_within(0.5)
+
+        @param seconds: time budget of one call
+        @type  seconds: float
+        @param percentile: 50 means median
+        @param repeat: number of samples. None means automatic.
+        @param warmup: number of calls before measurement
+        """)
+
+    should_be_faster_than = VerifyMethod(
+        _faster_than,
+        "%(actual)s should be %(times)gx faster than %(expected_source)s, "
+        "but p%(percentile)g was %(measured)s against "
+        "%(expected_measured)s. (%(timing)s / %(expected_timing)s)",
+        "%(actual)s should be %(times)gx faster than %(expected_source)s. "
+        "(%(timing)s / %(expected_timing)s)",
+        doc="""Fail if the callable is not faster than expected callable.
+
+        usage:
+            About(lambda: bisect(data, 10)).should_be_faster_than(
+                lambda: data.index(10))
+            About(new_parser).should_be_faster_than(old_parser, times=2)
+
+        @param expected: callable to be compared
+        @param times: required speed ratio. 2 means twice as fast.
+        @param percentile: 50 means median
+        @param repeat: number of samples. None means automatic.
+        @param warmup: number of calls before measurement
+        """)
+
+    should_allocate_less_than = VerifyMethod(
+        _allocates_less_than,
+        "%(actual)s should allocate less than %(budget)s, but %(kind)s was "
+        "%(measured)s. (%(allocation)s)",
+        "%(actual)s should allocate less than %(budget)s. (%(allocation)s)",
+        doc="""Fail if the callable allocates more memory than size.
+
+        The callable is called once under tracemalloc. The failure message
+        shows the source lines that allocated most.
+
+        usage:
+            About(lambda: load(path)).should_allocate_less_than(10 * 1024)
+            About(cache.update).should_allocate_less_than(0, net=True)
+
+        @param size: memory budget in bytes
+        @param net: if True, memory that is still allocated after the call
+                    is checked instead of the peak
+        """)
+
+    should_scale_as = VerifyMethod(
+        _scales_as,
+        "%(actual)s should scale as %(complexity)s (exponent %(limit).2f), "
+        "but exponent was %(exponent).2f.\n  %(table)s",
+        "%(actual)s should scale as %(complexity)s. (%(scaling)s)\n  "
+        "%(table)s",
+        doc="""Fail if the callable grows faster than complexity.
+
+        The callable is timed with generator(n) at each input size n, and
+        the growth exponent fitted on log-log scale is compared with the
+        exponent of complexity over the same sizes.
+
+        usage:
+            About(sorted).should_scale_as("O(n log n)",
+                                          lambda n: random_list(n))
+            About(find_pairs).should_scale_as(2, make_input,
+                                              sizes=[100, 200, 400, 800])
+
+        @param complexity: "O(1)", "O(log n)", "O(n)", "O(n log n)",
+                           "O(n^2)", "O(n^3)" or exponent number
+        @param generator: callable that returns an input of size n
+        @param sizes: increasing input sizes(default=256 to 8192)
+        @param tolerance: allowable excess of exponent
+        @param repeat: number of samples at each size
+        """)
+
+    should_scale_linearly = VerifyMethod(
+        _scales_linearly,
+        "%(actual)s should scale as %(complexity)s (exponent %(limit).2f), "
+        "but exponent was %(exponent).2f.\n  %(table)s",
+        "%(actual)s should scale as %(complexity)s. (%(scaling)s)\n  "
+        "%(table)s",
+        doc="""Fail if the callable grows faster than O(n).
+
+        usage:
+            About(parse).should_scale_linearly(lambda n: "a," * n)
+
+        @sa should_scale_as
+        """)
 
 
 def fail(msg="Stop by user"):
@@ -531,12 +1440,36 @@ def ignore_spec(msg="This spec was ignored"):
     raise IgnoreTestCase(msg)
 
 
-def spec(method = None, group=None, expected=None):
-    """Set BDD method flag."""
+def spec(method = None, group=None, expected=None, cases=None,
+         timeout=None):
+    """Set BDD method flag.
+
+    If cases is given, the spec runs once for each case, as independent
+    specs that have their own ids and results. Cases are read one by one
+    while the specs run, so they are never kept in a list:
+
+        @spec(cases=[(1, 1), (2, 4), (3, 9)])
+        def square(self, value, expected):
+            value_of(value ** 2).should_equal(expected)
+
+        @spec(cases="cases/square.jsonl")
+        def square_from_file(self, value, expected):
+            ...
+
+    @param cases: iterable of cases, callable that returns the iterable
+                  (like generator function), or path of .jsonl, .csv or
+                  text file. A relative path is relative to the spec file.
+                  A tuple or a list case is passed as positional
+                  arguments, a dict case as keyword arguments and others
+                  as one argument. See pyspec3.runner.iter_cases.
+    @param timeout: seconds. A spec that runs longer is interrupted by
+                    pyspec3.watchdog. Default is 100 seconds, and 0
+                    disables it.
+    """
     if method is not None:
         append_pyspec_attribute(method, SpecMethodAttribute)
         return method
-    return BDDDecorator(group, SpecMethodAttribute, expected)
+    return BDDDecorator(group, SpecMethodAttribute, expected, cases, timeout)
 
 
 internal_spec = spec
@@ -590,48 +1523,141 @@ def ignore(method):
 # Spec Register
 
 def append_pyspec_attribute(method, AttributeClass):
-    if not hasattr(method, "__pyspec_attribute"):
-        method.__pyspec_attribute = AttributeClass(method)
-    return getattr(method, "__pyspec_attribute")
+    attribute = get_pyspec_attribute(method)
+    if attribute is None:
+        attribute = AttributeClass(method)
+        try:
+            # decorated functions had this attribute before the registry.
+            setattr(method, "__pyspec_attribute", attribute)
+        except AttributeError:
+            pass
+    return attribute
+
+
+def get_pyspec_attribute(method):
+    """Return attribute of decorated method or None."""
+    row = _registry.row_of(method)
+    if row is None:
+        return None
+    attribute = object.__new__(_attribute_classes[_registry.kinds[row]])
+    attribute.row = row
+    return attribute
+
+
+def _column(name, doc=None):
+    """Return property that reads and writes a column of the registry."""
+    def get(self):
+        return getattr(_registry, name)[self.row]
+    def set(self, value):
+        getattr(_registry, name)[self.row] = value
+    return property(get, set, doc=doc)
+
+
+def _flag(flag, doc=None):
+    """Return property of a flag bit of the registry."""
+    def get(self):
+        return _registry.get_flag(self.row, flag)
+    def set(self, value):
+        _registry.set_flag(self.row, flag, value)
+    return property(get, set, doc=doc)
 
 
 class PySpecAttribute(object):
-    def __init__(self):
+    """Attribute of decorated method.
+
+    It has only the row number of pyspec3.registry.registry. The values are
+    kept in the columns of the registry.
+
+    @ivar index: ordering number in this process.
+    @ivar spec_id: stable identifier made by make_spec_id().
+    @ivar key: short digest of spec_id made by spec_key().
+    """
+    __slots__ = ("row",)
+    kind = _registry_module.SPEC
+    is_context = False
+    is_finalize = False
+
+    def __init__(self, method=None):
         """set test decorator.
         @category load.registmethod
         """
-        self.is_context = False
-        self.is_finalize = False
-        self.index = get_test_index()
+        self.row = _registry.add(self.kind, method, get_test_index())
+
+    index = _column("indexes")
+
+    @property
+    def function(self):
+        return _registry.function(self.row)
+
+    @property
+    def spec_id(self):
+        function = self.function
+        if function is None:
+            return None
+        return make_spec_id(function)
+
+    @property
+    def key(self):
+        spec_id = self.spec_id
+        if spec_id is None:
+            return None
+        return spec_key(spec_id)
 
 
 class SpecMethodAttribute(PySpecAttribute):
-    def __init__(self, method):
-        super(SpecMethodAttribute, self).__init__()
-        self.timeout = 100.0
-        self.ignored = False
-        self.groups = None
-        self.expected = None
+    __slots__ = ()
+
+    ignored = _flag(_registry_module.IGNORED)
+    expected = _column("expected")
+
+    @property
+    def groups(self):
+        return _registry.groups[self.row]
 
     def set_group(self, group):
         """group attribute is used by BDD.
         Spec method uses same group contexts.
         """
         if type(group) in (list, tuple):
-            self.groups = group
+            _registry.set_groups(self.row, tuple(group))
+        elif group is None:
+            # no group, as specs that are not decorated with options.
+            _registry.set_groups(self.row, None)
         else:
-            self.groups = (group,)
+            _registry.set_groups(self.row, (group,))
 
     def set_expected(self, expected):
         self.expected = expected
 
+    cases = _column("cases")
+
+    def set_cases(self, cases):
+        self.cases = cases
+
+    @property
+    def timeout(self):
+        return _registry.timeouts[self.row]
+
+    @timeout.setter
+    def timeout(self, timeout):
+        # the column is an array of doubles. zero disables the timeout.
+        _registry.timeouts[self.row] = 0.0 if timeout is None else timeout
+
+    def set_timeout(self, timeout):
+        """@param timeout: seconds. None or zero disables the timeout."""
+        self.timeout = timeout
+
 
 class ContextMethodAttribute(PySpecAttribute):
-    def __init__(self, method):
-        super(ContextMethodAttribute, self).__init__()
-        self.is_context = True
-        self.is_class = False
-        self.group = None
+    __slots__ = ()
+    kind = _registry_module.CONTEXT
+    is_context = True
+
+    is_class = _flag(_registry_module.IS_CLASS)
+
+    @property
+    def group(self):
+        return _registry.groups[self.row]
 
     def context(self, test_fixture, context_method):
         method = getattr(test_fixture, context_method.name())
@@ -641,27 +1667,38 @@ class ContextMethodAttribute(PySpecAttribute):
         if type(group) in (list, tuple):
             raise TypeError("context's group argument cannot accept list, tuple.")
         else:
-            self.group = group
+            _registry.set_groups(self.row, group)
 
 
 class FinalizeMethodAttribute(PySpecAttribute):
-    def __init__(self, method):
-        super(FinalizeMethodAttribute, self).__init__()
-        self.is_finalize = True
-        self.is_class = False
+    __slots__ = ()
+    kind = _registry_module.FINALIZE
+    is_finalize = True
+
+    is_class = _flag(_registry_module.IS_CLASS)
 
     def finalize(self, test_fixture, finalize_method):
         method = getattr(test_fixture, finalize_method.name())
         method()
 
 
+_attribute_classes = {
+    _registry_module.SPEC: SpecMethodAttribute,
+    _registry_module.CONTEXT: ContextMethodAttribute,
+    _registry_module.FINALIZE: FinalizeMethodAttribute,
+}
+
+
 class BDDDecorator(object):
     """BDD method decorator.
     This object contains grouping types.
     """
-    def __init__(self, group, Attribute, expected=None):
+    def __init__(self, group, Attribute, expected=None, cases=None,
+                 timeout=None):
         self.group = group
         self.expected = expected
+        self.cases = cases
+        self.timeout = timeout
         self.Attribute = Attribute
 
     def __call__(self, method):
@@ -670,6 +1707,10 @@ class BDDDecorator(object):
         attr.set_group(self.group)
         if self.expected is not None:
            attr.set_expected(self.expected)
+        if self.cases is not None:
+           attr.set_cases(self.cases)
+        if self.timeout is not None:
+           attr.set_timeout(self.timeout)
         return method
 
 
@@ -677,7 +1718,7 @@ def run_test():
     """Easy test launcher method.
 
     usage:
-        from pyspec import *
+        from pyspec3 import *
 
         @spec
         def easy_test():
@@ -686,5 +1727,8 @@ def run_test():
         if __name__ == "__main__":
             run_test()
     """
-    import pyspec.textui
-    pyspec.textui.TextSpecTestRunner(auto=True).run()
+    import pyspec3.textui
+    pyspec3.textui.TextSpecTestRunner(auto=True).run()
+
+
+import pyspec3.arrayverifier
@@ -0,0 +1,280 @@
+# -*- coding: ascii -*-
+
+"""Verifier for numeric arrays.
+
+value_of() returns ArrayVerifier for array.array, memoryview and
+numpy.ndarray. It can compare all elements in one pass:
+
+    value_of(result).should_equal_array(expected)
+    value_of(result).should_equal_array_nearly(expected, tolerance=1e-6)
+
+numpy is used if the value is numpy.ndarray. Otherwise the buffers are
+compared chunk by chunk with memcmp, and only the chunks that have any
+differences are compared element by element. The failure message shows
+the number of different elements and the first ones.
+
+NaN is equal to NaN at the same index in every path, like
+numpy.testing.assert_array_equal(). Arrays of different shapes are
+different even if they have the same number of elements.
+"""
+
+__pyspec = 1
+
+import sys
+import array
+import operator
+from itertools import compress, repeat
+
+import pyspec3
+
+
+CHUNK_SIZE = 1 << 16
+
+
+class ArrayDifference(object):
+    """Result of array comparison.
+
+    @ivar size: number of elements of actual value.
+    @ivar expected_size: number of elements of expected value.
+    @ivar shape: shape of actual value, or None if it is not compared.
+    @ivar expected_shape: shape of expected value, or None.
+    @ivar count: number of different elements.
+    @ivar items: list of (index, actual, expected) of first differences.
+    """
+    __slots__ = ("size", "expected_size", "shape", "expected_shape", "count",
+                 "items")
+    def __init__(self, size, expected_size, shape=None, expected_shape=None):
+        self.size = size
+        self.expected_size = expected_size
+        self.shape = shape
+        self.expected_shape = expected_shape
+        self.count = 0
+        self.items = []
+
+    def is_same(self):
+        return self.size == self.expected_size and \
+            self.shape == self.expected_shape and not self.count
+
+    def __str__(self):
+        items = ", ".join("[%d] %r != %r" % item for item in self.items)
+        if self.count > len(self.items):
+            items += ", ..."
+        return items
+
+
+def _numpy(*values):
+    """Return numpy module if it is loaded and any value is ndarray."""
+    numpy = sys.modules.get("numpy")
+    if numpy is None:
+        return None
+    for value in values:
+        if isinstance(value, numpy.ndarray):
+            return numpy
+    return None
+
+
+def _compare_numpy(numpy, actual, expected, tolerance, relative, max_report):
+    actual = numpy.asarray(actual)
+    expected = numpy.asarray(expected)
+    result = ArrayDifference(actual.size, expected.size, actual.shape,
+                             expected.shape)
+    if actual.shape != expected.shape:
+        return result
+    if tolerance is None:
+        different = actual != expected
+    else:
+        if relative:
+            tolerance = numpy.abs(expected) * tolerance
+        # subtract the smaller one so that unsigned integers don't wrap.
+        errors = numpy.where(actual > expected, actual - expected,
+                             expected - actual)
+        different = ~(errors <= tolerance)
+    if actual.dtype.kind in "fc" and expected.dtype.kind in "fc":
+        different &= ~(numpy.isnan(actual) & numpy.isnan(expected))
+    result.count = int(numpy.count_nonzero(different))
+    if result.count:
+        flat_actual = actual.reshape(-1)
+        flat_expected = expected.reshape(-1)
+        for index in numpy.flatnonzero(different)[:max_report].tolist():
+            result.items.append((index, flat_actual[index].item(),
+                                 flat_expected[index].item()))
+    return result
+
+
+def _element_view(value, format=None):
+    """Return (1-dimensional view, shape of multi-dimensional buffer or
+    None)."""
+    try:
+        view = memoryview(value)
+    except TypeError:
+        if format is None:
+            raise
+        view = memoryview(array.array(format, value))
+    if view.ndim == 1:
+        return view, None
+    return view.cast("B").cast(view.format), view.shape
+
+
+def _not_both_nan(actual, expected):
+    # NaN is the only value that is not equal to itself.
+    return actual == actual or expected == expected
+
+
+def _different_indexes(actual, expected, start, tolerance, relative):
+    """Return iterator of indexes of different elements in a chunk."""
+    if tolerance is None:
+        different = map(operator.ne, actual, expected)
+    else:
+        errors = map(abs, map(operator.sub, actual, expected))
+        if relative:
+            limits = map(operator.mul, map(abs, expected), repeat(tolerance))
+            different = map(operator.not_, map(operator.le, errors, limits))
+        else:
+            different = map(operator.not_,
+                            map(float(tolerance).__ge__, errors))
+    candidates = compress(range(start, start + len(actual)), different)
+    return (index for index in candidates
+            if _not_both_nan(actual[index - start], expected[index - start]))
+
+
+def _compare_buffer(actual, expected, tolerance, relative, max_report):
+    actual, shape = _element_view(actual)
+    expected, expected_shape = _element_view(expected, actual.format)
+    if shape is None or expected_shape is None:
+        # a flat sequence can be compared with any shape.
+        shape = expected_shape = None
+    result = ArrayDifference(len(actual), len(expected), shape,
+                             expected_shape)
+    if len(actual) != len(expected) or shape != expected_shape:
+        return result
+    same_format = actual.format == expected.format
+    actual_bytes = actual.cast("B")
+    expected_bytes = expected.cast("B")
+    itemsize = actual.itemsize
+    step = max(1, CHUNK_SIZE // itemsize)
+    for start in range(0, len(actual), step):
+        stop = min(start + step, len(actual))
+        if same_format and (actual_bytes[start * itemsize:stop * itemsize]
+                            .tobytes() ==
+                            expected_bytes[start * itemsize:stop * itemsize]
+                            .tobytes()):
+            continue
+        for index in _different_indexes(actual[start:stop],
+                                        expected[start:stop], start,
+                                        tolerance, relative):
+            result.count += 1
+            if len(result.items) < max_report:
+                result.items.append((index, actual[index], expected[index]))
+    return result
+
+
+def compare_arrays(actual, expected, tolerance=None, relative=False,
+                   max_report=10):
+    """Compare all elements of two arrays.
+
+    @param actual: numpy.ndarray or object that supports buffer protocol.
+    @param expected: same as actual, or sequence of numbers.
+    @param tolerance: allowable margin of error. None means exact equality.
+    @param relative: if True, tolerance is the ratio to each expected value.
+    @param max_report: number of differences to be recorded.
+    @rtype: ArrayDifference
+    """
+    numpy = _numpy(actual, expected)
+    if numpy is not None:
+        return _compare_numpy(numpy, actual, expected, tolerance, relative,
+                              max_report)
+    return _compare_buffer(actual, expected, tolerance, relative, max_report)
+
+
+def _mismatch(result):
+    """Return True or pyspec3.Mismatch for ArrayDifference."""
+    if result.is_same():
+        return True
+    if result.shape != result.expected_shape:
+        return pyspec3.Mismatch(
+            "%(actual)s should have shape %(expected_shape)s, but had "
+            "%(shape)s.", expected_shape=result.expected_shape,
+            shape=result.shape)
+    if result.size != result.expected_size:
+        return pyspec3.Mismatch(
+            "%(actual)s should have %(expected_size)d elements, but had "
+            "%(size)d.", expected_size=result.expected_size,
+            size=result.size)
+    return pyspec3.Mismatch(count=result.count, size=result.size,
+                            difference=result)
+
+
+def _equal_arrays(actual, expected, max_report=10):
+    return _mismatch(compare_arrays(actual, expected, None, False,
+                                    max_report))
+
+
+def _equal_arrays_nearly(actual, expected, tolerance=None, max_report=10):
+    if tolerance is None:
+        return _mismatch(compare_arrays(actual, expected, 0.01, True,
+                                        max_report))
+    return _mismatch(compare_arrays(actual, expected, tolerance, False,
+                                    max_report))
+
+
+class ArrayVerifier(pyspec3.StandardVerifier):
+    """Verifier for array.array, memoryview and numpy.ndarray.
+
+    usage:
+        result = array.array("d", [0.0, 1.0, 2.0])
+        value_of(result).should_equal_array([0.0, 1.0, 2.0])
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def _describe(value):
+        try:
+            size = len(value)
+        except TypeError:
+            return "<%s>" % type(value).__name__
+        return "<%s of %d elements>" % (type(value).__name__, size)
+
+    @classmethod
+    def _source(cls, source, actual):
+        # arrays are too long to show without the expression.
+        if source is not None:
+            return "%s" % source
+        return cls._describe(actual)
+
+    should_equal_array = pyspec3.VerifyMethod(
+        _equal_arrays,
+        "%(actual)s should equal %(expected_source)s, but %(count)d of "
+        "%(size)d elements were different: %(difference)s",
+        "%(actual)s should equal %(expected_source)s.",
+        doc="""Test all elements are equal to expected ones.
+
+        usage:
+            result = array.array("i", [1, 2, 3])
+            value_of(result).should_equal_array([1, 2, 3]) # OK!
+            value_of(result).should_equal_array([1, 2, 4]) # Fail!
+
+        @param expected: array or sequence of numbers.
+        @param max_report: number of differences shown in the message.
+        """)
+
+    should_equal_array_nearly = pyspec3.VerifyMethod(
+        _equal_arrays_nearly,
+        "%(actual)s should equal %(expected_source)s, but %(count)d of "
+        "%(size)d elements were different: %(difference)s",
+        "%(actual)s should equal nearly %(expected_source)s.",
+        doc="""Test all elements are near to expected ones.
+
+        usage:
+            result = array.array("d", [1.0, 2.0])
+            value_of(result).should_equal_array_nearly([1.0, 2.001]) # OK!
+
+        @param expected: array or sequence of numbers.
+        @param tolerance: allowable margin of error
+                          (default=each expected value*0.01)
+        @type  tolerance: float
+        @param max_report: number of differences shown in the message.
+        """)
+
+
+pyspec3.regist_type_verifier((array.array, memoryview, "numpy.ndarray"),
+                             ArrayVerifier)
@@ -0,0 +1,147 @@
+# -*- coding: ascii -*-
+
+"""Shared event loop for verifiers of asyncio code.
+
+Verifiers that accept awaitables run them on one event loop per thread.
+The loop is made at the first use and reused by all later verifications,
+so creating a loop is not paid for each assertion. A loop is closed when
+its thread exits, and the loop of the main thread when the interpreter
+exits. asyncio is imported at the first use, so specs without awaitables
+don't pay for it.
+
+    value_of(fetch()).should_resolve_to({"status": "ok"})
+    value_of([fetch(1), fetch(2)]).should_all_resolve_to([r1, r2])
+"""
+
+__pyspec = 1
+
+import atexit
+import inspect
+import threading
+from time import perf_counter_ns
+
+
+_local = threading.local()
+_loops = set()
+_loops_lock = threading.Lock()
+
+
+class _LoopHolder(object):
+    """Owner of the loop of one thread.
+
+    It is kept in thread local storage, which is released when the thread
+    exits, and closes the loop then.
+    """
+    __slots__ = ("loop",)
+    def __init__(self, loop):
+        self.loop = loop
+
+    def __del__(self):
+        _close(self.loop)
+
+
+def _close(loop):
+    with _loops_lock:
+        _loops.discard(loop)
+    if not loop.is_closed() and not loop.is_running():
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def is_awaitable(value):
+    return inspect.isawaitable(value)
+
+
+def close_awaitables(awaitables):
+    """Close coroutines that will not be run.
+
+    It avoids "coroutine was never awaited" warnings when a verifier
+    rejects its arguments.
+    """
+    for awaitable in awaitables:
+        if inspect.iscoroutine(awaitable):
+            awaitable.close()
+
+
+def get_loop():
+    """Return the event loop of the current thread."""
+    holder = getattr(_local, "holder", None)
+    if holder is None or holder.loop.is_closed():
+        import asyncio
+        holder = _LoopHolder(asyncio.new_event_loop())
+        _local.holder = holder
+        with _loops_lock:
+            _loops.add(holder.loop)
+    return holder.loop
+
+
+def run(awaitable, timeout=None):
+    """Run awaitable on the shared loop and return its result.
+
+    @param timeout: seconds. TimeoutError is raised if the awaitable
+                    doesn't complete in time.
+    """
+    import asyncio
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        close_awaitables([awaitable])
+        raise RuntimeError("awaitable verifiers can't be used in a running "
+                           "event loop. await the value before value_of().")
+    if timeout is not None:
+        awaitable = asyncio.wait_for(awaitable, timeout)
+    try:
+        return get_loop().run_until_complete(awaitable)
+    except asyncio.TimeoutError as error:
+        # asyncio.TimeoutError is not TimeoutError before Python 3.11.
+        if isinstance(error, TimeoutError):
+            raise
+        raise TimeoutError(*error.args)
+
+
+def synchronous(function):
+    """Return callable that runs coroutine function on the shared loop.
+
+    Other callables are returned as they are.
+    """
+    if not inspect.iscoroutinefunction(function):
+        return function
+    def call():
+        return run(function())
+    return call
+
+
+def run_timed(awaitable, timeout=None):
+    """Run awaitable and return (result, elapsed nanoseconds)."""
+    start = perf_counter_ns()
+    result = run(awaitable, timeout)
+    return result, perf_counter_ns() - start
+
+
+async def _gather(awaitables):
+    import asyncio
+    return await asyncio.gather(*awaitables)
+
+
+def gather(awaitables, timeout=None):
+    """Run awaitables concurrently and return the list of results."""
+    awaitables = list(awaitables)
+    try:
+        return run(_gather(awaitables), timeout)
+    except RuntimeError:
+        # run() refused them in a running loop.
+        close_awaitables(awaitables)
+        raise
+
+
+def close_loops():
+    """Close all shared loops."""
+    with _loops_lock:
+        loops = list(_loops)
+    for loop in loops:
+        _close(loop)
+
+
+atexit.register(close_loops)
@@ -0,0 +1,320 @@
+# -*- coding: ascii -*-
+
+"""Timing and memory measurement for performance verifiers.
+
+measure() runs a callable with warmup and calibrated loops, and returns
+Timing that has the mean per-call duration of each sample:
+
+    timing = measure(lambda: sorted(data))
+    timing.median()          # nanoseconds
+    timing.percentile(90)    # nanoseconds
+
+Each sample runs the callable 'loops' times, and 'loops' is chosen so that
+one sample takes at least 'sample_time' seconds. It hides the resolution
+of the timer and the overhead of the measurement loop. Garbage collection
+is disabled while sampling like timeit module. Percentiles are taken over
+the samples, so they show the spread between samples of 'loops' calls,
+not the latency of single calls: one slow call in a sample is averaged
+with the other calls.
+
+measure_allocation() runs a callable under tracemalloc and returns
+Allocation that has peak and net allocated bytes, the number of allocated
+blocks and the source lines that allocated most. tracemalloc is started
+only while the callable runs, so the rest of the spec runs at full speed.
+
+measure_scaling() times a callable at a geometric series of input sizes
+and fits the growth exponent on log-log scale. O(n) code has exponent
+near 1, and O(n^2) code has exponent near 2.
+"""
+
+__pyspec = 1
+
+import gc
+import os
+import math
+import tracemalloc
+from time import perf_counter_ns
+from itertools import repeat as _repeat
+
+
+MIN_SAMPLES = 5
+MAX_SAMPLES = 101
+
+
+class Timing(object):
+    """Measured mean per-call durations in nanoseconds.
+
+    @ivar samples: sorted list of mean per-call durations of each sample.
+    @ivar loops: number of calls in one sample.
+    """
+    __slots__ = ("samples", "loops")
+    def __init__(self, samples, loops):
+        self.samples = sorted(samples)
+        self.loops = loops
+
+    def percentile(self, percent):
+        """Return percentile of samples with linear interpolation.
+
+        @param percent: 0 - 100. 50 is median.
+        """
+        if not 0 <= percent <= 100:
+            raise ValueError("percent should be in 0 - 100, but was %r" %
+                             percent)
+        position = (len(self.samples) - 1) * percent / 100.0
+        lower = int(position)
+        upper = min(lower + 1, len(self.samples) - 1)
+        fraction = position - lower
+        return self.samples[lower] * (1 - fraction) + \
+            self.samples[upper] * fraction
+
+    def median(self):
+        return self.percentile(50)
+
+    def minimum(self):
+        return self.samples[0]
+
+    def maximum(self):
+        return self.samples[-1]
+
+    def __str__(self):
+        return "median %s, p90 %s, min %s, max %s, %d samples x %d loops" % \
+            (format_time(self.median()), format_time(self.percentile(90)),
+             format_time(self.minimum()), format_time(self.maximum()),
+             len(self.samples), self.loops)
+
+
+def format_time(nanoseconds):
+    """Return string like '1.23 ms' from nanoseconds."""
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if nanoseconds >= scale:
+            return "%.3g %s" % (nanoseconds / scale, unit)
+    return "%.3g ns" % nanoseconds
+
+
+def _run(function, loops):
+    start = perf_counter_ns()
+    for _ in _repeat(None, loops):
+        function()
+    return perf_counter_ns() - start
+
+
+def calibrate(function, sample_time=0.001, max_time=None):
+    """Return number of loops that takes at least sample_time seconds.
+
+    @param max_time: time budget of calibration in seconds. When it is
+                     used up, the last number of loops is returned.
+    """
+    target = sample_time * 1e9
+    budget = None if max_time is None else max_time * 1e9
+    spent = 0
+    loops = 1
+    while True:
+        elapsed = _run(function, loops)
+        spent += elapsed
+        if elapsed >= target or loops >= 10 ** 8 or \
+                (budget is not None and spent >= budget):
+            return loops
+        if elapsed * 10 < target:
+            loops *= 10
+        else:
+            loops *= 2
+
+
+def measure(function, repeat=None, warmup=1, sample_time=0.001,
+            max_time=0.5):
+    """Measure mean per-call duration of function in each sample.
+
+    @param function: callable without arguments.
+    @param repeat: number of samples. If None, samples are taken until
+                   max_time seconds pass (at least MIN_SAMPLES and at most
+                   MAX_SAMPLES samples).
+    @param warmup: number of calls before calibration.
+    @param sample_time: minimum duration of one sample in seconds.
+    @param max_time: time budget of calibration and sampling in seconds.
+                     Calibration stops when it uses up the budget, and
+                     sampling stops after it if repeat is None.
+    @rtype: Timing
+    """
+    for _ in _repeat(None, warmup):
+        function()
+    deadline = perf_counter_ns() + max_time * 1e9
+    loops = calibrate(function, sample_time, max_time)
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while True:
+            samples.append(_run(function, loops) / loops)
+            if repeat is not None:
+                if len(samples) >= repeat:
+                    break
+            elif len(samples) >= MAX_SAMPLES or \
+                    (len(samples) >= MIN_SAMPLES and
+                     perf_counter_ns() >= deadline):
+                break
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return Timing(samples, loops)
+
+
+class Allocation(object):
+    """Memory allocated by a callable.
+
+    @ivar peak: peak of traced memory while the callable ran, in bytes.
+    @ivar net: memory that was still allocated after the call, in bytes.
+    @ivar count: number of memory blocks that were still allocated.
+    @ivar statistics: tracemalloc.StatisticDiff list sorted by size.
+    """
+    __slots__ = ("peak", "net", "count", "statistics")
+    def __init__(self, peak, net, count, statistics):
+        self.peak = peak
+        self.net = net
+        self.count = count
+        self.statistics = statistics
+
+    def top_lines(self, limit=5):
+        """Return lines like 'spec.py:12: 1.2 KiB (3 blocks)'."""
+        lines = []
+        for statistic in self.statistics[:limit]:
+            if statistic.size_diff <= 0:
+                break
+            frame = statistic.traceback[0]
+            lines.append("%s:%d: %s (%d blocks)" %
+                         (frame.filename, frame.lineno,
+                          format_size(statistic.size_diff),
+                          statistic.count_diff))
+        return lines
+
+    def __str__(self):
+        return "peak %s, net %s, %d blocks" % \
+            (format_size(self.peak), format_size(self.net), self.count)
+
+
+def format_size(size):
+    """Return string like '1.5 KiB' from bytes."""
+    for unit, scale in (("GiB", 1 << 30), ("MiB", 1 << 20),
+                        ("KiB", 1 << 10)):
+        if abs(size) >= scale:
+            return "%.3g %s" % (size / scale, unit)
+    return "%d B" % size
+
+
+_ignored_files = (tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, os.path.abspath(__file__)))
+
+
+def measure_allocation(function):
+    """Measure memory allocated by one call of function.
+
+    @rtype: Allocation
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(_ignored_files)
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(_ignored_files)
+        del result
+    finally:
+        if started:
+            tracemalloc.stop()
+    statistics = after.compare_to(before, "lineno")
+    count = sum(statistic.count_diff for statistic in statistics
+                if statistic.count_diff > 0)
+    return Allocation(peak - base, current - base, count, statistics)
+
+
+COMPLEXITIES = {
+    "O(1)": lambda n: 1.0,
+    "O(log n)": lambda n: math.log(n),
+    "O(n)": lambda n: float(n),
+    "O(n log n)": lambda n: n * math.log(n),
+    "O(n^2)": lambda n: float(n) ** 2,
+    "O(n^3)": lambda n: float(n) ** 3,
+}
+
+
+DEFAULT_SIZES = (256, 512, 1024, 2048, 4096, 8192)
+
+
+def fit_exponent(sizes, values):
+    """Return slope of least squares line of log(values) on log(sizes)."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(value, 1e-9)) for value in values]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    return numerator / denominator
+
+
+def complexity_exponent(complexity, sizes):
+    """Return growth exponent of complexity class over sizes.
+
+    @param complexity: name in COMPLEXITIES like "O(n log n)" or exponent.
+    """
+    if isinstance(complexity, (int, float)):
+        return float(complexity)
+    try:
+        function = COMPLEXITIES[complexity]
+    except KeyError:
+        raise ValueError("unknown complexity %r. use one of %s or number." %
+                         (complexity, ", ".join(COMPLEXITIES)))
+    return fit_exponent(sizes, [function(size) for size in sizes])
+
+
+class Scaling(object):
+    """Timings of a callable at several input sizes.
+
+    @ivar sizes: input sizes.
+    @ivar timings: Timing object of each size.
+    @ivar exponent: fitted growth exponent of minimum durations.
+    """
+    __slots__ = ("sizes", "timings", "exponent")
+    def __init__(self, sizes, timings):
+        self.sizes = sizes
+        self.timings = timings
+        self.exponent = fit_exponent(
+            sizes, [timing.minimum() for timing in timings])
+
+    def table(self):
+        """Return lines of 'n, time, ratio to previous size' table."""
+        lines = ["%10s %12s %8s" % ("n", "time", "ratio")]
+        previous = None
+        for size, timing in zip(self.sizes, self.timings):
+            ratio = "" if previous is None else \
+                "%.2f" % (timing.minimum() / max(previous, 1e-9))
+            lines.append("%10d %12s %8s" %
+                         (size, format_time(timing.minimum()), ratio))
+            previous = timing.minimum()
+        return lines
+
+    def __str__(self):
+        return "exponent %.2f" % self.exponent
+
+
+def measure_scaling(function, generator, sizes=None, repeat=3):
+    """Measure function(generator(n)) at each size n.
+
+    Inputs are made before timing, so generator's cost is not measured.
+
+    @param function: callable that accepts one input.
+    @param generator: callable that returns an input of size n.
+    @param sizes: increasing input sizes. DEFAULT_SIZES is used if None.
+    @rtype: Scaling
+    """
+    if sizes is None:
+        sizes = DEFAULT_SIZES
+    sizes = tuple(sizes)
+    if len(sizes) < 2:
+        raise ValueError("sizes should have two or more sizes.")
+    timings = []
+    for size in sizes:
+        data = generator(size)
+        timings.append(measure(lambda: function(data), repeat=repeat))
+    return Scaling(sizes, timings)
@@ -98,12 +98,10 @@ def get_console_encoder(output_encoding):
 
 
 def get_source_code(depth=2):
-    import sys
-    import inspect
+    import pyspec3.source
     if sys.platform == "cli":
         return None
-    frame = inspect.stack()[depth]
-    return "".join(frame[4])
+    return pyspec3.source.get_source_line(depth + 1)
 
 
 def format_exception_only(etype, value):
@@ -0,0 +1,458 @@
+# -*- coding: ascii -*-
+
+"""Static spec discovery with a persistent index.
+
+discover() walks a directory tree and finds spec functions and methods by
+reading their decorators with ast, without importing the modules:
+
+    for spec_file in discover("specs"):
+        for info in spec_file.specs:
+            print(spec_file.path, info.qualname())
+
+Decorators are recognized by name, with or without the module prefix and
+arguments: spec, context, ignore, class_context, spec_finalize and
+class_finalize.
+
+Specs are found in classes nested in classes, and in if, try and with
+blocks. A file that can't be parsed is returned with its error, so the
+runner reports it instead of stopping.
+
+The result of each file is saved in '.pyspec_cache/index.json' at the top
+of the tree with the modification time, size and sha1 of the file. At the
+next run a file that has the same modification time and size is not read,
+and a file that has the same hash is not parsed again. Files that don't
+have any decorator name are skipped without parsing.
+"""
+
+__pyspec = 1
+
+import os
+import ast
+import json
+import hashlib
+import zlib
+import fnmatch
+import tempfile
+import traceback
+from itertools import starmap
+
+from pyspec3 import make_spec_id
+
+
+CACHE_DIRECTORY = ".pyspec_cache"
+INDEX_NAME = "index.json"
+INDEX_VERSION = 2
+SKIP_DIRECTORIES = frozenset(("__pycache__", "__snapshots__", "build",
+                              "dist", "node_modules"))
+
+_decorator_kinds = {
+    "spec": ("spec", False, False),
+    "internal_spec": ("spec", False, False),
+    "ignore": ("spec", False, True),
+    "context": ("context", False, False),
+    "class_context": ("context", True, False),
+    "spec_finalize": ("finalize", False, False),
+    "class_finalize": ("finalize", True, False),
+}
+
+
+class SpecInfo(object):
+    """Spec function or method found in source code.
+
+    @ivar class_name: name of the class or None for module functions.
+    @ivar name: function name.
+    @ivar lineno: line number of the definition.
+    @ivar kind: "spec", "context" or "finalize".
+    @ivar is_class: True for class_context and class_finalize.
+    @ivar ignored: True for ignore decorator.
+    @ivar group: literal group argument or None.
+    @ivar expected: source text of expected argument or None.
+    """
+    __slots__ = ("class_name", "name", "lineno", "kind", "is_class",
+                 "ignored", "group", "expected")
+    def __init__(self, class_name, name, lineno, kind, is_class=False,
+                 ignored=False, group=None, expected=None):
+        self.class_name = class_name
+        self.name = name
+        self.lineno = lineno
+        self.kind = kind
+        self.is_class = is_class
+        self.ignored = ignored
+        self.group = group
+        self.expected = expected
+
+    def qualname(self):
+        if self.class_name is None:
+            return self.name
+        return "%s.%s" % (self.class_name, self.name)
+
+    def to_list(self):
+        return [self.class_name, self.name, self.lineno, self.kind,
+                self.is_class, self.ignored, self.group, self.expected]
+
+    def __repr__(self):
+        return "<SpecInfo %s %s:%d>" % (self.kind, self.qualname(),
+                                        self.lineno)
+
+
+class SpecFile(object):
+    """Specs of one file.
+
+    @ivar path: absolute path of the file.
+    @ivar specs: list of SpecInfo in source order.
+    @ivar relative_path: path from the discovery root with '/' separators.
+    @ivar error: message of the error that stopped parsing, or None.
+    """
+    __slots__ = ("path", "specs", "relative_path", "error")
+    def __init__(self, path, specs, relative_path=None, error=None):
+        self.path = path
+        self.specs = specs
+        if relative_path is None:
+            relative_path = os.path.basename(path)
+        self.relative_path = relative_path.replace(os.sep, "/")
+        self.error = error
+
+    def spec_id(self, info, root=None):
+        """Return id like 'dir/spec_file.py::Class.method'.
+
+        It is the id that the runner gives to the spec. See
+        pyspec3.make_spec_id() for root.
+        """
+        return make_spec_id((self.path, info.qualname()), root=root)
+
+    def __repr__(self):
+        return "<SpecFile %s (%d)>" % (self.path, len(self.specs))
+
+
+def _decorator_name(node):
+    if isinstance(node, ast.Call):
+        node = node.func
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+
+def _keyword(node, name):
+    if not isinstance(node, ast.Call):
+        return None
+    for keyword in node.keywords:
+        if keyword.arg == name:
+            return keyword.value
+    return None
+
+
+def _literal(node):
+    if node is None:
+        return None
+    try:
+        value = ast.literal_eval(node)
+    except ValueError:
+        return None
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def _function_specs(node, class_name, source):
+    info = None
+    for decorator in node.decorator_list:
+        kind = _decorator_kinds.get(_decorator_name(decorator))
+        if kind is None:
+            continue
+        if info is None:
+            info = SpecInfo(class_name, node.name, node.lineno, *kind)
+        elif kind[2]:
+            info.ignored = True
+        group = _literal(_keyword(decorator, "group"))
+        if group is not None:
+            info.group = group
+        expected = _keyword(decorator, "expected")
+        if expected is not None:
+            info.expected = ast.get_source_segment(source, expected)
+    return info
+
+
+_functions = (ast.FunctionDef, ast.AsyncFunctionDef)
+_blocks = ("body", "orelse", "handlers", "finalbody")
+
+
+def _scan_body(body, class_name, source, specs):
+    for node in body:
+        if isinstance(node, _functions):
+            info = _function_specs(node, class_name, source)
+            if info is not None:
+                specs.append(info)
+        elif isinstance(node, ast.ClassDef):
+            if class_name is not None:
+                name = "%s.%s" % (class_name, node.name)
+            else:
+                name = node.name
+            _scan_body(node.body, name, source, specs)
+        else:
+            # definitions in if, try and with blocks are made at import.
+            for block in _blocks:
+                _scan_body(getattr(node, block, ()), class_name, source,
+                           specs)
+
+
+def scan_source(source, filename="<string>"):
+    """Return list of SpecInfo defined in source code."""
+    specs = []
+    _scan_body(ast.parse(source, filename).body, None, source, specs)
+    return specs
+
+
+def _may_have_specs(source):
+    """Return False if source bytes can't have any spec decorator."""
+    if b"@" not in source:
+        return False
+    # every decorator name has one of these words.
+    return any(word in source for word in
+               (b"spec", b"context", b"ignore", b"finalize"))
+
+
+def _format_error(error):
+    return "".join(traceback.format_exception_only(type(error), error))
+
+
+def scan_file(path, source=None):
+    """Return (list of SpecInfo, error message or None) of python file."""
+    if source is None:
+        with open(path, "rb") as source_file:
+            source = source_file.read()
+    if not _may_have_specs(source):
+        return [], None
+    try:
+        return scan_source(source.decode("utf-8"), path), None
+    except (SyntaxError, UnicodeDecodeError, ValueError) as error:
+        return [], _format_error(error)
+
+
+def _iter_python_files(root):
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            name = entry.name
+            if name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if name not in SKIP_DIRECTORIES:
+                    subdirectories.append(entry.path)
+            elif name.endswith(".py"):
+                yield entry
+        stack.extend(reversed(subdirectories))
+
+
+class SpecIndex(object):
+    """Persistent cache of scan results of a directory tree.
+
+    @ivar path: path of the index file.
+    @ivar files: dict of relative path -> [mtime_ns, size, sha1, specs,
+                 error].
+    @ivar changed: True if files was updated after loading.
+    """
+    __slots__ = ("path", "files", "changed")
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        self.files = {}
+        try:
+            with open(path, "r") as index_file:
+                data = json.load(index_file)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.files = data.get("files", {})
+
+    def lookup(self, relative_path, entry):
+        """Return (list of SpecInfo, error message or None) of the file,
+        scanning it if needed."""
+        stat = entry.stat()
+        cached = self.files.get(relative_path)
+        if cached is not None and cached[0] == stat.st_mtime_ns and \
+                cached[1] == stat.st_size:
+            return list(starmap(SpecInfo, cached[3])), cached[4]
+        with open(entry.path, "rb") as source_file:
+            source = source_file.read()
+        digest = hashlib.sha1(source).hexdigest()
+        if cached is not None and cached[2] == digest:
+            specs, error = list(starmap(SpecInfo, cached[3])), cached[4]
+        else:
+            specs, error = scan_file(entry.path, source)
+        self.files[relative_path] = [stat.st_mtime_ns, stat.st_size, digest,
+                                     [info.to_list() for info in specs],
+                                     error]
+        self.changed = True
+        return specs, error
+
+    def prune(self, relative_paths):
+        """Forget files that were not found."""
+        for relative_path in list(self.files):
+            if relative_path not in relative_paths:
+                del self.files[relative_path]
+                self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+                # keep the cache out of version control.
+                with open(os.path.join(directory, ".gitignore"), "w") as \
+                        ignore_file:
+                    ignore_file.write("*\n")
+            fd, temporary = tempfile.mkstemp(prefix=".index", dir=directory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "w") as output:
+                json.dump({"version": INDEX_VERSION, "files": self.files},
+                          output, separators=(",", ":"))
+            os.replace(temporary, self.path)
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return
+        self.changed = False
+
+
+def discover(root, index_path=None, save=True):
+    """Find specs in python files under root.
+
+    @param root: directory or python file.
+    @param index_path: path of index file. Default is INDEX_NAME in
+                       CACHE_DIRECTORY of root. False disables the index.
+    @param save: write updated index.
+    @return: list of SpecFile that have one or more specs or an error.
+    """
+    root = os.path.abspath(root)
+    if os.path.isfile(root):
+        specs, error = scan_file(root)
+        return [SpecFile(root, specs, error=error)] if specs or error else []
+    if index_path is None:
+        index_path = os.path.join(root, CACHE_DIRECTORY, INDEX_NAME)
+    index = SpecIndex(index_path) if index_path else SpecIndex(os.devnull)
+    found = []
+    seen = set()
+    prefix = len(os.path.join(root, ""))
+    for entry in _iter_python_files(root):
+        relative_path = entry.path[prefix:]
+        seen.add(relative_path)
+        specs, error = index.lookup(relative_path, entry)
+        if specs or error:
+            found.append(SpecFile(entry.path, specs, relative_path, error))
+    index.prune(seen)
+    if save and index_path:
+        index.save()
+    return found
+
+
+def _match_pattern(spec_id, pattern):
+    if any(character in pattern for character in "*?["):
+        return fnmatch.fnmatchcase(spec_id, pattern) or \
+            fnmatch.fnmatchcase(spec_id.split("::", 1)[-1], pattern)
+    return pattern in spec_id
+
+
+def _match_group(info, groups):
+    group = info.group
+    if isinstance(group, list):
+        return any(str(item) in groups for item in group)
+    return group is not None and str(group) in groups
+
+
+def select(spec_files, patterns=(), groups=(), shard=None,
+           include_ignored=True, root=None):
+    """Return SpecFiles that have only selected specs.
+
+    Contexts and finalizers are kept, because selected specs need them.
+    It works on the result of discover(), so no spec module is imported.
+
+    @param patterns: spec ids like 'dir/spec.py::Class.method', or their
+                     parts. Glob patterns are matched with the whole id or
+                     the 'Class.method' part, and others are substrings.
+    @param groups: group names. Groups are compared as strings.
+    @param shard: (index, count) tuple. Specs are divided into count shards
+                  by crc32 of spec ids, so adding a spec doesn't move other
+                  specs to other shards.
+    @param include_ignored: select specs that have ignore decorator.
+    @param root: run root of spec ids. See pyspec3.make_spec_id().
+
+    Files that have errors are always selected, because they may have
+    selected specs. With shard, they are in the shard of their path.
+    """
+    groups = set(str(group) for group in groups)
+    selected_files = []
+    for spec_file in spec_files:
+        if spec_file.error is not None:
+            if shard is None or zlib.crc32(
+                    spec_file.relative_path.encode("utf-8")) % shard[1] == \
+                    shard[0]:
+                selected_files.append(spec_file)
+            continue
+        selected = []
+        has_spec = False
+        for info in spec_file.specs:
+            if info.kind != "spec":
+                selected.append(info)
+                continue
+            spec_id = spec_file.spec_id(info, root)
+            if patterns and not any(_match_pattern(spec_id, pattern)
+                                    for pattern in patterns):
+                continue
+            if groups and not _match_group(info, groups):
+                continue
+            if not include_ignored and info.ignored:
+                continue
+            if shard is not None and \
+                    zlib.crc32(spec_id.encode("utf-8")) % shard[1] != shard[0]:
+                continue
+            selected.append(info)
+            has_spec = True
+        if has_spec:
+            selected_files.append(SpecFile(spec_file.path, selected,
+                                           spec_file.relative_path))
+    return selected_files
+
+
+def format_tree(spec_files):
+    """Return lines of file, class and spec tree for listing."""
+    lines = []
+    for spec_file in spec_files:
+        if spec_file.error is not None:
+            lines.append("%s (error: %s)" % (
+                spec_file.relative_path,
+                spec_file.error.strip().splitlines()[-1]))
+            continue
+        lines.append(spec_file.relative_path)
+        class_name = None
+        for info in spec_file.specs:
+            if info.kind != "spec":
+                continue
+            indent = "  "
+            if info.class_name is not None:
+                if info.class_name != class_name:
+                    lines.append("  %s" % info.class_name)
+                indent = "    "
+            class_name = info.class_name
+            notes = []
+            if info.group is not None:
+                notes.append("group %s" % (info.group,))
+            if info.expected is not None:
+                notes.append("expected %s" % info.expected)
+            if info.ignored:
+                notes.append("ignored")
+            lines.append("%s%s%s" % (indent, info.name,
+                                      " (%s)" % ", ".join(notes)
+                                      if notes else ""))
+    return lines
@@ -0,0 +1,162 @@
+# -*- coding: ascii -*-
+
+"""Chunked comparison of file contents for file verifiers.
+
+compare_contents() compares two files, or a file and a bytes-like object,
+without reading whole files into memory:
+
+    value_of("out/result.csv").should_equal_file("expected/result.csv")
+    value_of("out/result.bin").should_equal_file(b"\\x00\\x01")
+
+Files are memory-mapped and compared chunk by chunk, so only one chunk of
+each side is copied at a time. The line number of the difference is
+counted only when a difference is found.
+"""
+
+__pyspec = 1
+
+import os
+import mmap
+import binascii
+from contextlib import contextmanager
+
+
+CHUNK_SIZE = 1 << 20
+
+
+def is_path(value):
+    return isinstance(value, (str, os.PathLike))
+
+
+class _Content(object):
+    """Bytes of a file or a bytes-like object that can be sliced."""
+    __slots__ = ("name", "size", "data")
+    def __init__(self, name, size, data):
+        self.name = name
+        self.size = size
+        self.data = data
+
+    def chunk(self, start, stop):
+        return bytes(self.data[start:stop])
+
+
+@contextmanager
+def open_content(value):
+    """Yield _Content of a path or a bytes-like object."""
+    if not is_path(value):
+        with memoryview(value) as view:
+            with view.cast("B") as data:
+                yield _Content("<%s>" % type(value).__name__, len(data), data)
+        return
+    with open(value, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            yield _Content(os.fspath(value), 0, b"")
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield _Content(os.fspath(value), size, data)
+
+
+class ContentDifference(object):
+    """First difference of two contents.
+
+    @ivar offset: byte offset of the first difference.
+    @ivar line: line number (from 1) of the first difference.
+    @ivar column: column (from 1) in the line.
+    @ivar size: size of actual content.
+    @ivar expected_size: size of expected content.
+    @ivar actual_window: bytes of actual content around offset.
+    @ivar expected_window: bytes of expected content around offset.
+    @ivar window_start: offset of the first byte of the windows.
+    """
+    __slots__ = ("offset", "line", "column", "size", "expected_size",
+                 "actual_window", "expected_window", "window_start")
+    def __init__(self, offset, size, expected_size):
+        self.offset = offset
+        self.size = size
+        self.expected_size = expected_size
+        self.line = 1
+        self.column = 1
+        self.actual_window = b""
+        self.expected_window = b""
+        self.window_start = 0
+
+    def lines(self):
+        """Return lines for failure message."""
+        lines = []
+        if self.size != self.expected_size:
+            lines.append("size: expected %d bytes, but was %d bytes" %
+                         (self.expected_size, self.size))
+        lines.append("first difference at byte %d (line %d, column %d)" %
+                     (self.offset, self.line, self.column))
+        lines.append("  expected: %s  %r" %
+                     (_hex(self.expected_window), self.expected_window))
+        lines.append("  actual:   %s  %r" %
+                     (_hex(self.actual_window), self.actual_window))
+        return lines
+
+
+def _hex(data):
+    return binascii.hexlify(data, " ").decode("ascii")
+
+
+def _first_difference(actual, expected, chunk_size):
+    """Return offset of the first different byte of the common part."""
+    size = min(actual.size, expected.size)
+    for start in range(0, size, chunk_size):
+        stop = min(start + chunk_size, size)
+        lhs = actual.chunk(start, stop)
+        rhs = expected.chunk(start, stop)
+        if lhs == rhs:
+            continue
+        # bisect the chunk by slice comparison, then scan a few bytes.
+        low, high = 0, len(lhs)
+        while high - low > 64:
+            middle = (low + high) // 2
+            if lhs[low:middle] == rhs[low:middle]:
+                low = middle
+            else:
+                high = middle
+        for index in range(low, high):
+            if lhs[index] != rhs[index]:
+                return start + index
+    return size
+
+
+def _locate(content, offset, chunk_size):
+    """Return (line, column) of offset by counting newlines before it."""
+    line = 1
+    line_start = 0
+    for start in range(0, offset, chunk_size):
+        chunk = content.chunk(start, min(start + chunk_size, offset))
+        count = chunk.count(b"\n")
+        if count:
+            line += count
+            line_start = start + chunk.rfind(b"\n") + 1
+    return line, offset - line_start + 1
+
+
+def compare_contents(actual, expected, chunk_size=CHUNK_SIZE, window=8):
+    """Compare bytes of two paths or bytes-like objects.
+
+    @param window: number of bytes shown before and after the difference.
+    @return: ContentDifference or None if the contents are equal.
+    """
+    with open_content(actual) as actual_content:
+        with open_content(expected) as expected_content:
+            return _compare(actual_content, expected_content, chunk_size,
+                            window)
+
+
+def _compare(actual, expected, chunk_size, window):
+    offset = _first_difference(actual, expected, chunk_size)
+    if offset == actual.size == expected.size:
+        return None
+    result = ContentDifference(offset, actual.size, expected.size)
+    result.line, result.column = _locate(actual, offset, chunk_size)
+    result.window_start = max(offset - window, 0)
+    result.actual_window = actual.chunk(result.window_start,
+                                        offset + window + 1)
+    result.expected_window = expected.chunk(result.window_start,
+                                            offset + window + 1)
+    return result
@@ -0,0 +1,437 @@
+# -*- coding: ascii -*-
+
+"""Scoped fixture cache.
+
+A fixture is a function that builds a value that specs use. Decorate it
+with fixture() and call it from context methods:
+
+    @fixture(scope="module")
+    def corpus(path):
+        return parse_corpus(path)
+
+    class SearchBehavior(object):
+        @context
+        def a_corpus(self):
+            self.corpus = corpus("data/corpus.txt")
+
+The value is built at the first call and returned again to later calls
+with the same arguments while its scope lives. Scopes are:
+
+* "spec": until the spec ends. It is the default.
+* "class": until all specs of the class end.
+* "module": until all specs of the module end.
+* "session": until the run ends.
+
+A value used outside a running scope of its own, as a spec fixture used
+in a class context, belongs to the innermost running outer scope.
+
+A generator fixture yields its value, and the code after yield runs when
+the value is released, like spec_finalize:
+
+    @fixture(scope="session", size=64 << 20)
+    def database():
+        connection = sqlite3.connect(":memory:")
+        yield connection
+        connection.close()
+
+The runner releases fixtures when their scope ends. Values are also
+released in least recently used order when the total size goes over
+config.budget bytes, except values still in use: a value is kept until
+the end of the spec, class, module or session that used it last, or the
+outermost of them if it is used again. A value made in a class context
+lives until the class ends even if the budget is short. Size is
+estimated by estimate_size(), or given by the size argument as bytes or a
+function of the value. The budget can be set by PYSPEC_FIXTURE_BUDGET
+environment variable.
+
+Build time, hits and evictions of each fixture are counted, and the
+runner reports them at the end of the run.
+"""
+
+__pyspec = 1
+
+import os
+import sys
+import time
+import inspect
+import functools
+import threading
+from collections import OrderedDict
+
+
+SPEC = "spec"
+CLASS = "class"
+MODULE = "module"
+SESSION = "session"
+SCOPES = (SPEC, CLASS, MODULE, SESSION)
+
+
+class _config_type(object):
+    __slots__ = ("budget",)
+    def __init__(self):
+        self.budget = int(os.environ.get("PYSPEC_FIXTURE_BUDGET",
+                                         512 << 20))
+
+
+config = _config_type()
+
+
+def estimate_size(value, limit=100000):
+    """Return approximate bytes of value and the objects it contains.
+
+    Items of containers and attributes of instances are followed. Classes,
+    modules and functions are not. At most limit objects are counted.
+    """
+    seen = set()
+    stack = [value]
+    total = 0
+    while stack and len(seen) < limit:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, (type, type(sys), type(estimate_size))):
+            continue
+        try:
+            total += sys.getsizeof(item)
+        except TypeError:
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return total
+
+
+class FixtureStats(object):
+    """Counts of one fixture.
+
+    @ivar name: qualified name of the fixture function.
+    @ivar scope: scope of the fixture.
+    @ivar builds: number of built values.
+    @ivar hits: number of calls that got a cached value.
+    @ivar evictions: number of values released to keep the budget.
+    @ivar build_time: seconds spent building values.
+    """
+    __slots__ = ("name", "scope", "builds", "hits", "evictions",
+                 "build_time")
+    def __init__(self, name, scope):
+        self.name = name
+        self.scope = scope
+        self.builds = 0
+        self.hits = 0
+        self.evictions = 0
+        self.build_time = 0.0
+
+    def hit_rate(self):
+        uses = self.builds + self.hits
+        return float(self.hits) / uses if uses else 0.0
+
+
+class _Entry(object):
+    __slots__ = ("fixture", "value", "teardown", "size", "pin")
+    def __init__(self, fixture, value, teardown, size, pin):
+        self.fixture = fixture
+        self.value = value
+        self.teardown = teardown
+        self.size = size
+        self.pin = pin
+
+
+class _Identity(object):
+    """Key of an unhashable argument. It is equal only to the same object,
+    and keeps the object alive while the value is cached, so its id is not
+    reused."""
+    __slots__ = ("value",)
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return id(self.value)
+
+    def __eq__(self, other):
+        return isinstance(other, _Identity) and other.value is self.value
+
+
+def _hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return _Identity(value)
+    return value
+
+
+def _arguments_key(args, kwargs):
+    return (tuple(_hashable(arg) for arg in args),
+            tuple(sorted((name, _hashable(value))
+                         for name, value in kwargs.items())))
+
+
+def _close(entry):
+    teardown = entry.teardown
+    if teardown is None:
+        return
+    try:
+        next(teardown)
+    except StopIteration:
+        return
+    raise RuntimeError("fixture %s should yield only once" %
+                       entry.fixture.__qualname__)
+
+
+def _close_all(entries):
+    """Close entries in reverse order and return the first exception, or
+    None. An exception doesn't stop closing the rest."""
+    first_error = None
+    for entry in reversed(entries):
+        try:
+            _close(entry)
+        except Exception as error:
+            if first_error is None:
+                first_error = error
+    return first_error
+
+
+class FixtureCache(object):
+    """Values of fixtures in least recently used order.
+
+    The runner calls enter() when a scope starts and leave() when it ends.
+
+    @ivar entries: OrderedDict of key -> entry. The oldest is first.
+    @ivar owners: dict of scope -> name of the running spec, class, module
+                  or session.
+    @ivar live: dict of scope -> generation of the running scope. An entry
+                is pinned while the scope of its pin is live.
+    @ivar stats: dict of Fixture -> FixtureStats.
+    @ivar total_size: sum of sizes of cached values.
+    @ivar budget: bytes, or None to use config.budget.
+    @ivar errors: exceptions raised by teardown code of evicted values,
+                  reported by the next leave().
+    """
+    __slots__ = ("entries", "owners", "live", "stats", "total_size",
+                 "budget", "generation", "errors", "lock")
+    def __init__(self, budget=None):
+        self.entries = OrderedDict()
+        self.owners = {}
+        self.live = {}
+        self.stats = {}
+        self.total_size = 0
+        self.budget = budget
+        self.generation = 0
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def _stats_of(self, fixture):
+        stats = self.stats.get(fixture)
+        if stats is None:
+            stats = self.stats[fixture] = FixtureStats(fixture.__qualname__,
+                                                       fixture.scope)
+        return stats
+
+    def get(self, fixture, args=(), kwargs={}):
+        """Return cached value of fixture, building it if needed."""
+        key = (fixture, self._owner(fixture.scope),
+               _arguments_key(args, kwargs))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                entry.pin = self._pin(entry.pin)
+                self._stats_of(fixture).hits += 1
+                return entry.value
+        start = time.perf_counter()
+        value, teardown = fixture.build(args, kwargs)
+        elapsed = time.perf_counter() - start
+        size = fixture.measure(value)
+        with self.lock:
+            stats = self._stats_of(fixture)
+            stats.builds += 1
+            stats.build_time += elapsed
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_size -= old.size
+            self.entries[key] = _Entry(fixture, value, teardown, size,
+                                       self._pin(None))
+            self.total_size += size
+            evicted = self._evict()
+        if old is not None:
+            evicted.append(old)
+        error = _close_all(evicted[::-1])
+        if error is not None:
+            with self.lock:
+                self.errors.append(error)
+        return value
+
+    def _owner(self, scope):
+        """Return (scope, owner) that a value of scope belongs to: scope
+        itself if it is running, or else the innermost running outer scope,
+        so a spec fixture used in a class context is released when the
+        class ends."""
+        for outer in SCOPES[SCOPES.index(scope):]:
+            if outer in self.owners:
+                return (outer, self.owners[outer])
+        return (scope, None)
+
+    def _pinned(self, pin):
+        return pin is not None and self.live.get(pin[0]) == pin[1]
+
+    def _pin(self, pin):
+        """Return pin of a value used now: the innermost running scope, or
+        pin itself if it is live and outer."""
+        for scope in SCOPES:
+            if scope in self.live:
+                if self._pinned(pin) and \
+                        SCOPES.index(pin[0]) >= SCOPES.index(scope):
+                    return pin
+                return (scope, self.live[scope])
+        return None
+
+    def _evict(self):
+        budget = config.budget if self.budget is None else self.budget
+        evicted = []
+        if self.total_size <= budget:
+            return evicted
+        for key, entry in list(self.entries.items()):
+            if self._pinned(entry.pin):
+                continue
+            del self.entries[key]
+            self.total_size -= entry.size
+            self._stats_of(entry.fixture).evictions += 1
+            evicted.append(entry)
+            if self.total_size <= budget:
+                break
+        return evicted
+
+    def enter(self, scope, owner):
+        """Start scope. Values used in it are not evicted until it ends or
+        the same scope starts again."""
+        with self.lock:
+            self.owners[scope] = owner
+            self.generation += 1
+            self.live[scope] = self.generation
+
+    def leave(self, scope):
+        """Release values of scope and return the first exception raised
+        by their teardown code or by teardown code of values evicted
+        before, or None."""
+        with self.lock:
+            owner = self.owners.pop(scope, None)
+            self.live.pop(scope, None)
+            released = [key for key in self.entries
+                        if key[1] == (scope, owner)]
+            entries = [self.entries.pop(key) for key in released]
+            for entry in entries:
+                self.total_size -= entry.size
+            errors = self.errors
+            self.errors = []
+        error = _close_all(entries)
+        if errors:
+            return errors[0]
+        return error
+
+    def clear(self):
+        """Release all values and forget counts. Return the first
+        exception raised by teardown code, or None."""
+        with self.lock:
+            entries = list(self.entries.values())
+            self.entries.clear()
+            self.owners.clear()
+            self.live.clear()
+            self.total_size = 0
+            self.stats.clear()
+            errors = self.errors
+            self.errors = []
+        error = _close_all(entries)
+        if errors:
+            return errors[0]
+        return error
+
+    def clear_statistics(self):
+        with self.lock:
+            self.stats.clear()
+
+    def statistics(self):
+        """Return list of FixtureStats in the order of first use."""
+        with self.lock:
+            return list(self.stats.values())
+
+
+cache = FixtureCache()
+
+
+class Fixture(object):
+    """Fixture function with its scope. Calling it returns the cached
+    value.
+
+    @ivar function: function that returns or yields the value.
+    @ivar scope: one of SCOPES.
+    @ivar size: bytes, function of the value, or None to estimate.
+    """
+    def __init__(self, function, scope=SPEC, size=None):
+        if scope not in SCOPES:
+            raise ValueError("scope should be one of %s, but was %r" %
+                             (", ".join(SCOPES), scope))
+        functools.update_wrapper(self, function)
+        self.function = function
+        self.scope = scope
+        self.size = size
+
+    def build(self, args, kwargs):
+        """Return (value, teardown generator or None)."""
+        result = self.function(*args, **kwargs)
+        if inspect.isgenerator(result):
+            return next(result), result
+        return result, None
+
+    def measure(self, value):
+        if self.size is None:
+            return estimate_size(value)
+        if callable(self.size):
+            return self.size(value)
+        return self.size
+
+    def __call__(self, *args, **kwargs):
+        return cache.get(self, args, kwargs)
+
+    def __repr__(self):
+        return "<Fixture %s (%s)>" % (self.__qualname__, self.scope)
+
+
+def fixture(function=None, scope=SPEC, size=None):
+    """Decorator of fixture functions.
+
+    usage:
+        @fixture
+        def stack():
+            return []
+
+        @fixture(scope="session", size=lambda table: len(table) * 100)
+        def regex_table():
+            return compile_table()
+    """
+    if function is None:
+        return lambda function: Fixture(function, scope, size)
+    return Fixture(function, scope, size)
+
+
+def format_statistics(statistics):
+    """Return lines of build time and hit rate for the run report."""
+    if not statistics:
+        return []
+    builds = sum(stats.builds for stats in statistics)
+    hits = sum(stats.hits for stats in statistics)
+    build_time = sum(stats.build_time for stats in statistics)
+    uses = builds + hits
+    lines = ["Fixtures: %d built in %.3fs, %d of %d uses hit the cache "
+             "(%.0f%%)" % (builds, build_time, hits, uses,
+                           100.0 * hits / uses if uses else 0.0)]
+    for stats in statistics:
+        lines.append("  %s (%s): %d built in %.3fs, %d hits (%.0f%%), "
+                     "%d evicted" % (stats.name, stats.scope, stats.builds,
+                                     stats.build_time, stats.hits,
+                                     100.0 * stats.hit_rate(),
+                                     stats.evictions))
+    return lines
@@ -0,0 +1,150 @@
+# -*- coding: ascii -*-
+
+"""Membership checks of many items for bulk verifiers.
+
+'item in list' is a linear scan, so checking m items against a list of n
+items one by one costs O(n*m). These functions build one hash index of
+the collection and check all items in O(n+m). Unhashable items are kept in
+a list and compared by '=='. Other collections that have __contains__, like
+str and bytes, are checked by the 'in' operator.
+
+All functions return at most 'limit' items in their lists, with the total
+count, so that failure messages stay small.
+"""
+
+__pyspec = 1
+
+from collections import Counter
+
+
+def _reiterable(items):
+    """Return items that can be iterated twice. Iterators are read into a
+    list, so the fallback for unhashable items sees all of them."""
+    if iter(items) is items:
+        return list(items)
+    return items
+
+
+class HashIndex(object):
+    """Set of items that also accepts unhashable items."""
+    __slots__ = ("hashed", "unhashable")
+    def __init__(self, items):
+        if isinstance(items, (set, frozenset, dict)):
+            self.hashed = items
+            self.unhashable = ()
+            return
+        items = _reiterable(items)
+        try:
+            self.hashed = set(items)
+            self.unhashable = ()
+        except TypeError:
+            self.hashed = set()
+            self.unhashable = []
+            for item in items:
+                try:
+                    self.hashed.add(item)
+                except TypeError:
+                    self.unhashable.append(item)
+
+    def __contains__(self, item):
+        try:
+            if item in self.hashed:
+                return True
+        except TypeError:
+            pass
+        return bool(self.unhashable) and item in self.unhashable
+
+
+# containers whose 'in' is a linear scan or a hash lookup of their items.
+_ITEM_CONTAINS = (list.__contains__, tuple.__contains__, set.__contains__,
+                  frozenset.__contains__, dict.__contains__)
+
+
+def _index(collection):
+    """Return HashIndex of lists, tuples, sets and iterators. Other types
+    that have __contains__ keep their own meaning of 'in', like substring
+    of str and bytes."""
+    contains = getattr(type(collection), "__contains__", None)
+    if contains is None:
+        if hasattr(collection, "__iter__"):
+            return HashIndex(collection)
+        return collection
+    if contains in _ITEM_CONTAINS:
+        return HashIndex(collection)
+    return collection
+
+
+def missing_items(collection, items, limit=10):
+    """Return (count, first items) of items that are not in collection."""
+    index = _index(collection)
+    count = 0
+    missing = []
+    for item in items:
+        if item not in index:
+            count += 1
+            if len(missing) < limit:
+                missing.append(item)
+    return count, missing
+
+
+def included_items(collection, items, limit=10):
+    """Return (count, first items) of items that are in collection."""
+    index = _index(collection)
+    count = 0
+    included = []
+    for item in items:
+        if item in index:
+            count += 1
+            if len(included) < limit:
+                included.append(item)
+    return count, included
+
+
+class _Multiset(object):
+    """Counter that also accepts unhashable items."""
+    __slots__ = ("counter", "unhashable")
+    def __init__(self, items):
+        items = _reiterable(items)
+        try:
+            self.counter = Counter(items)
+            self.unhashable = []
+        except TypeError:
+            self.counter = Counter()
+            self.unhashable = []
+            for item in items:
+                try:
+                    self.counter[item] += 1
+                except TypeError:
+                    self.unhashable.append(item)
+
+    def subtract(self, other, limit):
+        """Return (count, first items) of items that other doesn't have."""
+        count = 0
+        items = []
+        for item, number in self.counter.items():
+            rest = number - other.counter.get(item, 0)
+            if rest > 0:
+                count += rest
+                items.extend([item] * min(rest, limit - len(items)))
+        rest = list(other.unhashable)
+        for item in self.unhashable:
+            for i, other_item in enumerate(rest):
+                if item == other_item:
+                    del rest[i]
+                    break
+            else:
+                count += 1
+                if len(items) < limit:
+                    items.append(item)
+        return count, items
+
+
+def different_elements(actual, expected, limit=10):
+    """Compare two collections ignoring order.
+
+    @return: ((missing count, first missing items),
+              (unexpected count, first unexpected items))
+    """
+    actual = _Multiset(actual)
+    expected = _Multiset(expected)
+    return expected.subtract(actual, limit), actual.subtract(expected, limit)
@@ -0,0 +1,211 @@
+# -*- coding: ascii -*-
+
+"""Columnar table of decorated spec methods.
+
+Each spec, context or finalize method decorated by pyspec3 has one row in
+the registry. Values are kept in columns: arrays for numbers and flags,
+and lists for other values. Attribute objects made by
+pyspec3.get_pyspec_attribute() only have the row number. Suites with
+hundreds of thousands of specs don't make dicts for each spec.
+
+The registry refers to functions weakly, so functions of specs that are
+no longer used, like specs defined in a function, are freed. find() skips
+their rows.
+
+Groups are indexed when they are set, so specs of a group are found
+without walking modules:
+
+    from pyspec3.registry import registry
+    registry.find(kind=SPEC, group="database")
+"""
+
+__pyspec = 1
+
+import array
+import weakref
+import threading
+
+
+SPEC = 0
+CONTEXT = 1
+FINALIZE = 2
+
+IS_CLASS = 1
+IGNORED = 2
+
+DEFAULT_TIMEOUT = 100.0
+
+_any = object()
+
+
+def _no_function():
+    return None
+
+
+def _reference(function):
+    """Return weak reference of function, or a strong one if it doesn't
+    support weak references."""
+    if function is None:
+        return _no_function
+    try:
+        return weakref.ref(function)
+    except TypeError:
+        return lambda: function
+
+
+class SpecRegistry(object):
+    """Rows of decorated methods.
+
+    @ivar kinds: kind of each row, SPEC, CONTEXT or FINALIZE.
+    @ivar flags: IS_CLASS and IGNORED bits of each row.
+    @ivar indexes: ordering number of each row.
+    @ivar timeouts: timeout seconds of each row.
+    @ivar groups: tuple of groups of specs, or group of contexts.
+    @ivar expected: expected exception of specs.
+    @ivar cases: case source of parametrized specs.
+    @ivar functions: references of decorated functions. Call them to get
+                     the functions, or None if they were freed.
+    """
+    __slots__ = ("kinds", "flags", "indexes", "timeouts", "groups",
+                 "expected", "cases", "functions", "function_rows",
+                 "strong_rows", "group_rows", "group_tuples", "lock")
+    def __init__(self):
+        self.kinds = bytearray()
+        self.flags = bytearray()
+        self.indexes = array.array("q")
+        self.timeouts = array.array("d")
+        self.groups = []
+        self.expected = []
+        self.cases = []
+        self.functions = []
+        self.function_rows = weakref.WeakKeyDictionary()
+        self.strong_rows = {}
+        self.group_rows = {}
+        self.group_tuples = {}
+        self.lock = threading.Lock()
+
+    def add(self, kind, function, index):
+        """Append a row and return its number."""
+        with self.lock:
+            row = len(self.kinds)
+            self.kinds.append(kind)
+            self.flags.append(0)
+            self.indexes.append(index)
+            self.timeouts.append(DEFAULT_TIMEOUT)
+            self.groups.append(None)
+            self.expected.append(None)
+            self.cases.append(None)
+            self.functions.append(_reference(function))
+            if function is not None:
+                try:
+                    self.function_rows[function] = row
+                except TypeError:
+                    self.strong_rows[function] = row
+        return row
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def row_of(self, function):
+        """Return row of decorated function or None.
+
+        Bound methods and wrappers made by functools.wraps are followed to
+        the decorated function.
+        """
+        function = getattr(function, "__func__", function)
+        while True:
+            try:
+                return self.function_rows[function]
+            except (KeyError, TypeError):
+                pass
+            try:
+                return self.strong_rows[function]
+            except KeyError:
+                pass
+            except TypeError:
+                return None
+            function = getattr(function, "__wrapped__", None)
+            if function is None:
+                return None
+
+    def get_flag(self, row, flag):
+        return bool(self.flags[row] & flag)
+
+    def set_flag(self, row, flag, value):
+        with self.lock:
+            if value:
+                self.flags[row] |= flag
+            else:
+                self.flags[row] &= ~flag & 0xff
+
+    def set_groups(self, row, groups):
+        """Set group value and update the group index.
+
+        @param groups: tuple of groups for specs, one group for contexts.
+        """
+        with self.lock:
+            self._unindex(row)
+            if self.kinds[row] == SPEC and groups is not None:
+                # specs often have the same groups. share the tuples.
+                groups = self.group_tuples.setdefault(groups, groups)
+            self.groups[row] = groups
+            for group in self._group_keys(row):
+                self.group_rows.setdefault(group, array.array("q")) \
+                    .append(row)
+
+    def _group_keys(self, row):
+        groups = self.groups[row]
+        if groups is None:
+            return ()
+        if self.kinds[row] == SPEC:
+            return groups
+        return (groups,)
+
+    def _unindex(self, row):
+        for group in self._group_keys(row):
+            rows = self.group_rows[group]
+            del rows[rows.index(row)]
+
+    def rows(self, kind=None, group=_any, ignored=None):
+        """Return row numbers that match all conditions.
+
+        @param kind: SPEC, CONTEXT, FINALIZE or None for all.
+        @param group: group name. Rows without group if None.
+        @param ignored: True or False to select by ignore decorator.
+        """
+        if group is _any:
+            candidates = range(len(self.kinds))
+        elif group is None:
+            candidates = [row for row, groups in enumerate(self.groups)
+                          if groups is None]
+        else:
+            candidates = self.group_rows.get(group, ())
+        kinds = self.kinds
+        flags = self.flags
+        result = []
+        for row in candidates:
+            if kind is not None and kinds[row] != kind:
+                continue
+            if ignored is not None and \
+                    bool(flags[row] & IGNORED) != ignored:
+                continue
+            result.append(row)
+        return result
+
+    def function(self, row):
+        """Return decorated function of row, or None if it was freed."""
+        return self.functions[row]()
+
+    def functions_of(self, rows):
+        functions = [self.functions[row]() for row in rows]
+        return [function for function in functions if function is not None]
+
+    def find(self, kind=None, group=_any, ignored=None):
+        """Return decorated functions that match the conditions of rows().
+
+        Freed functions are skipped.
+        """
+        return self.functions_of(self.rows(kind, group, ignored))
+
+
+registry = SpecRegistry()
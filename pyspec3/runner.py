@@ -0,0 +1,744 @@
+# -*- coding: ascii -*-
+
+"""Spec collection and execution.
+
+Specs are functions and methods marked by decorators in pyspec3:
+
+    class StackBehavior(object):
+        @context
+        def an_empty_stack(self):
+            self.stack = []
+
+        @spec
+        def should_be_empty(self):
+            value_of(self.stack).should_be_empty()
+
+collect_module() finds them in a loaded module and makes SpecSuite for
+module functions and for each class. run_suites() runs them:
+
+* class_context methods run once per class, on a shared instance. Its
+  attributes are copied to the instance of each spec.
+* context methods run before each spec. A spec that has groups uses the
+  contexts of the groups, and a spec without group uses contexts without
+  group.
+* spec_finalize methods run after each spec, and class_finalize methods
+  run after all specs of the class.
+
+With share_contexts=True, schedule() divides specs into groups that use
+the same contexts. The contexts run once for each group on one fixture,
+all specs of the group run on it, and spec_finalize methods run after
+the last one. Expensive setup like loading a big model runs once per
+group instead of once per spec.
+
+Module functions are called without arguments in the same way.
+
+Specs that have cases are expanded by iter_cases() while they run. Each
+case gets new fixture and contexts, and its own id and result.
+
+run_suites() opens the scopes of pyspec3.fixtures.cache: a spec scope for
+each spec (or for each group with share_contexts), a class scope for each
+suite, a module scope for the suites of each module and one session scope.
+Fixture values are released when their scope ends, and RunResult.fixtures
+has the counts of each fixture.
+
+Each spec runs under pyspec3.watchdog with the timeout of its attribute
+(100 seconds by default, spec(timeout=...) to change). A spec that runs
+longer is interrupted and gets a TIMEOUT result with its stack. Its
+finalizers still run. Class contexts and class finalizers run under the
+largest timeout of the specs of the class.
+"""
+
+__pyspec = 1
+
+import os
+import csv
+import sys
+import json
+import inspect
+import time
+import traceback
+import importlib.util
+
+import pyspec3
+from pyspec3 import fixtures
+from pyspec3 import snapshot
+from pyspec3.registry import DEFAULT_TIMEOUT
+from pyspec3.watchdog import watchdog, SpecTimeout
+
+
+SUCCESS = "success"
+FAILURE = "failure"
+ERROR = "error"
+IGNORED = "ignored"
+TIMEOUT = "timeout"
+
+
+def get_attribute(function):
+    """Return pyspec attribute of function or None."""
+    return pyspec3.get_pyspec_attribute(function)
+
+
+class SpecMethod(object):
+    """Decorated function with its pyspec attribute."""
+    __slots__ = ("name", "function", "attribute")
+    def __init__(self, name, function, attribute):
+        self.name = name
+        self.function = function
+        self.attribute = attribute
+
+    def groups(self):
+        return self.attribute.groups
+
+
+class SpecSuite(object):
+    """Specs and fixtures of one class or of module functions.
+
+    @ivar name: qualified name like 'module.Class'.
+    @ivar owner: class, or None for module functions.
+    """
+    __slots__ = ("name", "owner", "specs", "contexts", "finalizers",
+                 "class_contexts", "class_finalizers")
+    def __init__(self, name, owner):
+        self.name = name
+        self.owner = owner
+        self.specs = []
+        self.contexts = []
+        self.finalizers = []
+        self.class_contexts = []
+        self.class_finalizers = []
+
+    def add(self, method):
+        attribute = method.attribute
+        if attribute.is_context:
+            if attribute.is_class:
+                self.class_contexts.append(method)
+            else:
+                self.contexts.append(method)
+        elif attribute.is_finalize:
+            if attribute.is_class:
+                self.class_finalizers.append(method)
+            else:
+                self.finalizers.append(method)
+        else:
+            self.specs.append(method)
+
+    def sort(self):
+        for methods in (self.specs, self.contexts, self.finalizers,
+                        self.class_contexts, self.class_finalizers):
+            methods.sort(key=lambda method: method.attribute.index)
+
+    def contexts_of(self, spec):
+        """Return context methods that are used by the spec."""
+        groups = spec.groups()
+        if groups is None:
+            return [context for context in self.contexts
+                    if context.attribute.group is None]
+        return [context for context in self.contexts
+                if context.attribute.group in groups]
+
+    def __len__(self):
+        return len(self.specs)
+
+
+def _collect_class(module, qualname, owner, names, suites):
+    suite = SpecSuite("%s.%s" % (module.__name__, qualname), owner)
+    for name, value in list(vars(owner).items()):
+        if isinstance(value, type):
+            # nested class defined in this class, not an alias.
+            if getattr(value, "__qualname__", None) == \
+                    "%s.%s" % (qualname, name) and \
+                    value.__module__ == module.__name__:
+                _collect_class(module, value.__qualname__, value, names,
+                               suites)
+            continue
+        attribute = get_attribute(value)
+        if attribute is None:
+            continue
+        if attribute.is_context or attribute.is_finalize or \
+                names is None or "%s.%s" % (qualname, name) in names:
+            suite.add(SpecMethod(name, value, attribute))
+    if suite.specs:
+        suites.append(suite)
+
+
+def collect_module(module, names=None):
+    """Return list of SpecSuite of a loaded module.
+
+    Classes nested in classes have their own suites.
+
+    @param names: set of qualified names like 'Class.method' to select.
+                  None selects all specs.
+    """
+    module_suite = SpecSuite(module.__name__, None)
+    suites = [module_suite]
+    for name, value in list(vars(module).items()):
+        if getattr(value, "__module__", None) != module.__name__:
+            continue
+        if isinstance(value, type):
+            _collect_class(module, name, value, names, suites)
+        elif callable(value):
+            attribute = get_attribute(value)
+            if attribute is None:
+                continue
+            if attribute.is_context or attribute.is_finalize or \
+                    names is None or name in names:
+                module_suite.add(SpecMethod(name, value, attribute))
+    suites = [suite for suite in suites if suite.specs]
+    for suite in suites:
+        suite.sort()
+    suites.sort(key=lambda suite: suite.specs[0].attribute.index)
+    return suites
+
+
+def load_file(path, root=None):
+    """Import python file and return the module.
+
+    @param root: directory that is added to sys.path. The module name is
+                 made from the path relative to it.
+    """
+    path = os.path.abspath(path)
+    if root is None:
+        root = os.path.dirname(path)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    relative_path = os.path.relpath(path, root)
+    name = os.path.splitext(relative_path)[0].replace(os.sep, ".")
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+class SpecResult(object):
+    """Result of one spec.
+
+    @ivar name: spec id made by pyspec3.make_spec_id().
+    @ivar status: SUCCESS, FAILURE, ERROR or IGNORED.
+    @ivar message: formatted traceback or reason of ignoring.
+    @ivar elapsed: seconds.
+    """
+    __slots__ = ("name", "status", "message", "elapsed")
+    def __init__(self, name, status, message="", elapsed=0.0):
+        self.name = name
+        self.status = status
+        self.message = message
+        self.elapsed = elapsed
+
+
+class RunResult(object):
+    """Results of a run.
+
+    @ivar results: list of SpecResult. Passed results are not kept if
+                   keep_passed is False, so a run of millions of cases
+                   keeps only the failures.
+    @ivar counts: dict of status -> number of specs.
+    @ivar fixtures: list of pyspec3.fixtures.FixtureStats of the run.
+    """
+    __slots__ = ("results", "counts", "keep_passed", "elapsed", "fixtures")
+    def __init__(self, keep_passed=True):
+        self.results = []
+        self.counts = {}
+        self.keep_passed = keep_passed
+        self.elapsed = 0.0
+        self.fixtures = []
+
+    def add(self, result):
+        self.counts[result.status] = self.counts.get(result.status, 0) + 1
+        if self.keep_passed or result.status in (FAILURE, ERROR, TIMEOUT):
+            self.results.append(result)
+
+    def count(self, status=None):
+        if status is None:
+            return sum(self.counts.values())
+        return self.counts.get(status, 0)
+
+    def was_successful(self):
+        return not (self.counts.get(FAILURE) or self.counts.get(ERROR) or
+                    self.counts.get(TIMEOUT))
+
+
+class Listener(object):
+    """Receiver of progress. Override methods to show it."""
+    def start_spec(self, name):
+        pass
+
+    def end_spec(self, result):
+        pass
+
+
+def _is_pyspec_frame(traceback_object):
+    return "__pyspec" in traceback_object.tb_frame.f_globals
+
+
+def format_error(error):
+    """Return traceback text without frames of pyspec modules."""
+    tb = error.__traceback__
+    frames = []
+    while tb is not None:
+        if not _is_pyspec_frame(tb):
+            frames.append(tb)
+        tb = tb.tb_next
+    lines = ["Traceback (most recent call last):\n"]
+    for frame in frames:
+        lines.extend(traceback.format_list(
+            traceback.extract_tb(frame, limit=1)))
+    lines.extend(traceback.format_exception_only(type(error), error))
+    return "".join(lines)
+
+
+def _classify(error, expected):
+    if expected is not None:
+        if isinstance(error, expected):
+            return SUCCESS, ""
+        if error is None:
+            return FAILURE, "%s should be raised, but wasn't." % \
+                getattr(expected, "__name__", expected)
+    if error is None:
+        return SUCCESS, ""
+    if isinstance(error, pyspec3.IgnoreTestCase):
+        return IGNORED, str(error)
+    if isinstance(error, AssertionError):
+        return FAILURE, format_error(error)
+    return ERROR, format_error(error)
+
+
+def _call(function, *args, **kwargs):
+    try:
+        function(*args, **kwargs)
+    except (Exception, SpecTimeout) as error:
+        return error
+    return None
+
+
+def _watched(name, timeout, function, *args):
+    """Call function under the watchdog.
+
+    @return: (return value, or None if the timeout interrupted it before
+              it returned,
+              SpecTimeout with the stack if it timed out, or None)
+    """
+    value = None
+    watchdog.arm(name, timeout)
+    try:
+        value = function(*args)
+    except SpecTimeout:
+        pass
+    finally:
+        stack = watchdog.disarm()
+    if stack is None:
+        return value, None
+    return value, SpecTimeout(name, timeout, stack)
+
+
+def _timeout_result(timeout, elapsed, name=None):
+    return SpecResult(name or timeout.name, TIMEOUT,
+                      "%s.\nStack of the spec:\n%s" % (timeout, timeout.stack),
+                      elapsed)
+
+
+def _new_fixture(suite, shared):
+    fixture = suite.owner()
+    if shared is not None:
+        fixture.__dict__.update(shared.__dict__)
+    return fixture
+
+
+class SpecCase(object):
+    """One run of a spec. A parametrized spec has one case for each
+    parameters.
+
+    @ivar spec: SpecMethod.
+    @ivar name: spec id with parameters.
+    """
+    __slots__ = ("spec", "name", "args", "kwargs")
+    def __init__(self, spec, name, args=(), kwargs=None):
+        self.spec = spec
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs or {}
+
+
+def _read_lines(path):
+    with open(path, "r") as case_file:
+        for line in case_file:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def _read_csv(path):
+    with open(path, "r", newline="") as case_file:
+        for row in csv.DictReader(case_file):
+            yield row
+
+
+def iter_case_source(source, directory=None):
+    """Yield cases of a case source one by one.
+
+    @param source: iterable, callable that returns iterable, or path.
+                   A path of .jsonl file yields a JSON value of each line,
+                   .csv file yields a dict of each row, and other files
+                   yield each non-empty line.
+    @param directory: directory that a relative path is resolved against.
+                      None means the current directory.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        if directory is not None:
+            path = os.path.join(directory, path)
+        if path.endswith((".jsonl", ".ndjson")):
+            return map(json.loads, _read_lines(path))
+        if path.endswith(".csv"):
+            return _read_csv(path)
+        return _read_lines(path)
+    if callable(source):
+        source = source()
+    return iter(source)
+
+
+def _spec_directory(function):
+    try:
+        return os.path.dirname(os.path.abspath(
+            inspect.getfile(inspect.unwrap(function))))
+    except TypeError:
+        return None
+
+
+def iter_cases(spec):
+    """Yield SpecCase objects of a spec lazily.
+
+    A relative path of cases is read from the directory of the spec file.
+    """
+    cases = spec.attribute.cases
+    if cases is None:
+        yield SpecCase(spec, spec.attribute.spec_id)
+        return
+    for case in iter_case_source(cases, _spec_directory(spec.function)):
+        if isinstance(case, dict):
+            args, kwargs = (), case
+            parameters = case
+        elif isinstance(case, (tuple, list)):
+            args, kwargs = tuple(case), None
+            parameters = args
+        else:
+            args, kwargs = (case,), None
+            parameters = args
+        yield SpecCase(spec, pyspec3.make_spec_id(spec.function, parameters),
+                       args, kwargs)
+
+
+def _prepare(suite, contexts, shared):
+    """Make a fixture and run contexts on it.
+
+    @return: (arguments tuple for spec methods, exception or None). The
+             arguments are returned also when a context fails or times
+             out, so that the finalizers run on them.
+    """
+    args = ()
+    try:
+        if suite.owner is not None:
+            args = (_new_fixture(suite, shared),)
+        for context in contexts:
+            error = _call(context.function, *args)
+            if error is not None:
+                return args, error
+    except (Exception, SpecTimeout) as error:
+        return args, error
+    return args, None
+
+
+def _finalize(suite, args):
+    """Run finalizers and return the first exception or None."""
+    first_error = None
+    for finalizer in suite.finalizers:
+        try:
+            error = _call(finalizer.function, *args)
+        except SpecTimeout as timeout:
+            error = timeout
+        if first_error is None:
+            first_error = error
+    return first_error
+
+
+def _context_failure(error):
+    status, message = _classify(error, None)
+    if status == SUCCESS:
+        status = ERROR
+    return status, message
+
+
+def run_case(suite, case, shared=None, prepared=None):
+    """Run one spec case.
+
+    A new fixture is made, and the contexts and finalizers of the spec run
+    around the case, unless a prepared fixture is given.
+
+    @param prepared: arguments tuple of a fixture whose contexts have run.
+                     Contexts and finalizers are not run.
+    @return: SpecResult
+    """
+    spec = case.spec
+    name = case.name
+    if spec.attribute.ignored:
+        return SpecResult(name, IGNORED, "ignored by decorator")
+    start = time.perf_counter()
+    outcome, timeout = _watched(name, spec.attribute.timeout, _run_case_body,
+                                suite, case, shared, prepared)
+    elapsed = time.perf_counter() - start
+    if timeout is not None:
+        return _timeout_result(timeout, elapsed)
+    status, message = outcome
+    return SpecResult(name, status, message, elapsed)
+
+
+def _run_spec(case, args):
+    token = snapshot.set_running_spec(case.spec.function, case.name)
+    try:
+        error = _call(case.spec.function, *(args + case.args),
+                      **case.kwargs)
+    finally:
+        snapshot.reset_running_spec(token)
+    return _classify(error, case.spec.attribute.expected)
+
+
+def _run_case_body(suite, case, shared, prepared):
+    if prepared is not None:
+        return _run_spec(case, prepared)
+    fixtures.cache.enter(fixtures.SPEC, case.name)
+    args = ()
+    try:
+        args, error = _prepare(suite, suite.contexts_of(case.spec), shared)
+        if error is None:
+            status, message = _run_spec(case, args)
+        else:
+            status, message = _context_failure(error)
+    finally:
+        # a timeout outside of _call() gets here before it is reported.
+        error = _finalize(suite, args)
+        release_error = fixtures.cache.leave(fixtures.SPEC)
+    if error is None:
+        error = release_error
+    if error is not None and status == SUCCESS:
+        status, message = ERROR, format_error(error)
+    return status, message
+
+
+def schedule(suite):
+    """Divide specs into groups that use the same contexts.
+
+    @return: list of (contexts, specs) in the order of the first spec of
+             each group.
+    """
+    groups = {}
+    for spec in suite.specs:
+        contexts = suite.contexts_of(spec)
+        key = tuple(context.name for context in contexts)
+        if key not in groups:
+            groups[key] = (contexts, [])
+        groups[key][1].append(spec)
+    return list(groups.values())
+
+
+def _report(listener, result, spec_result):
+    result.add(spec_result)
+    listener.end_spec(spec_result)
+
+
+def _release(scope, name, listener, result):
+    """End scope of fixture cache and report an error of teardown."""
+    error = fixtures.cache.leave(scope)
+    if error is not None:
+        _report(listener, result, SpecResult("%s.<fixtures>" % name, ERROR,
+                                             format_error(error)))
+
+
+def _safe_cases(spec, listener, result):
+    """Yield cases of spec. An error of the case source is reported."""
+    try:
+        for case in iter_cases(spec):
+            yield case
+    except Exception as error:
+        _report(listener, result, SpecResult(spec.attribute.spec_id, ERROR,
+                                             format_error(error)))
+
+
+def _run_group(suite, contexts, specs, shared, listener, result):
+    """Run specs on one fixture whose contexts run once.
+
+    The fixture is made at the first spec that is not ignored, and the
+    finalizers run after the last spec.
+    """
+    prepared = None
+    error = None
+    for spec in specs:
+        for case in _safe_cases(spec, listener, result):
+            listener.start_spec(case.name)
+            if prepared is None and error is None and \
+                    not spec.attribute.ignored:
+                fixtures.cache.enter(fixtures.SPEC, case.name)
+                start = time.perf_counter()
+                outcome, error = _watched(case.name, spec.attribute.timeout,
+                                          _prepare, suite, contexts, shared)
+                elapsed = time.perf_counter() - start
+                if outcome is not None:
+                    # the finalizers run also on the arguments of contexts
+                    # that failed or timed out.
+                    prepared, context_error = outcome
+                    if error is None:
+                        error = context_error
+            if isinstance(error, SpecTimeout) and not spec.attribute.ignored:
+                spec_result = _timeout_result(error, elapsed, case.name)
+            elif error is not None and not spec.attribute.ignored:
+                status, message = _context_failure(error)
+                spec_result = SpecResult(case.name, status, message)
+            else:
+                spec_result = run_case(suite, case, prepared=prepared)
+            _report(listener, result, spec_result)
+    if prepared is not None:
+        name = "%s.<finalize>" % suite.name
+        start = time.perf_counter()
+        error, timeout = _watched(name, DEFAULT_TIMEOUT, _finalize, suite,
+                                  prepared)
+        if timeout is not None:
+            _report(listener, result, _timeout_result(
+                timeout, time.perf_counter() - start))
+        elif error is not None:
+            _report(listener, result,
+                    SpecResult(name, ERROR, format_error(error)))
+    if prepared is not None or error is not None:
+        _release(fixtures.SPEC, suite.name, listener, result)
+
+
+def _class_timeout(suite):
+    """Return the largest timeout of the specs of suite, which also bounds
+    its class contexts and class finalizers, or None if a spec has no
+    timeout."""
+    timeouts = [spec.attribute.timeout for spec in suite.specs]
+    if not timeouts:
+        return DEFAULT_TIMEOUT
+    if min(timeouts) <= 0:
+        return None
+    return max(timeouts)
+
+
+def _prepare_class(suite):
+    """Make the shared fixture of suite and run class contexts on it.
+
+    @return: (shared fixture or None, exception or None). The fixture is
+             returned also when a context fails or times out, so that the
+             class finalizers run on it.
+    """
+    shared = None
+    try:
+        shared = suite.owner()
+        for context in suite.class_contexts:
+            error = _call(context.function, shared)
+            if error is not None:
+                return shared, error
+    except (Exception, SpecTimeout) as error:
+        return shared, error
+    return shared, None
+
+
+def run_suite(suite, listener, result, share_contexts=False):
+    """Run all specs of suite and add SpecResults to result.
+
+    @param share_contexts: if True, specs that use the same contexts share
+                           one fixture. The contexts run once for each
+                           group of specs, and the finalizers run after
+                           the last spec of the group.
+    """
+    shared = None
+    class_error = None
+    class_timeout = None
+    timeout = _class_timeout(suite)
+    fixtures.cache.enter(fixtures.CLASS, suite.name)
+    if suite.owner is not None and (suite.class_contexts or
+                                    suite.class_finalizers):
+        start = time.perf_counter()
+        outcome, class_timeout = _watched("%s.<class_context>" % suite.name,
+                                          timeout, _prepare_class, suite)
+        elapsed = time.perf_counter() - start
+        if outcome is not None:
+            shared, class_error = outcome
+    if class_timeout is not None or class_error is not None:
+        for spec in suite.specs:
+            for case in _safe_cases(spec, listener, result):
+                listener.start_spec(case.name)
+                if class_timeout is not None:
+                    spec_result = _timeout_result(class_timeout, elapsed,
+                                                  case.name)
+                else:
+                    status, message = _context_failure(class_error)
+                    spec_result = SpecResult(case.name, status, message)
+                _report(listener, result, spec_result)
+    elif share_contexts:
+        for contexts, specs in schedule(suite):
+            _run_group(suite, contexts, specs, shared, listener, result)
+    else:
+        for spec in suite.specs:
+            for case in _safe_cases(spec, listener, result):
+                listener.start_spec(case.name)
+                _report(listener, result, run_case(suite, case, shared))
+    if shared is not None:
+        for finalizer in suite.class_finalizers:
+            name = "%s.%s" % (suite.name, finalizer.name)
+            start = time.perf_counter()
+            error, finalizer_timeout = _watched(name, timeout, _call,
+                                                finalizer.function, shared)
+            if finalizer_timeout is not None:
+                _report(listener, result, _timeout_result(
+                    finalizer_timeout, time.perf_counter() - start))
+            elif error is not None:
+                _report(listener, result,
+                        SpecResult(name, ERROR, format_error(error)))
+    _release(fixtures.CLASS, suite.name, listener, result)
+
+
+def _module_name(suite):
+    if suite.owner is None:
+        return suite.name
+    return suite.owner.__module__
+
+
+def run_suites(suites, listener=None, keep_passed=True, share_contexts=False,
+               errors=()):
+    """Run suites and return RunResult.
+
+    @param keep_passed: keep passed results in RunResult.results.
+    @param share_contexts: share fixtures between specs that use the same
+                           contexts. See run_suite().
+    @param errors: SpecResults of spec files that couldn't be parsed or
+                   imported. They are reported before the specs.
+    """
+    if listener is None:
+        listener = Listener()
+    result = RunResult(keep_passed)
+    for error in errors:
+        listener.start_spec(error.name)
+        _report(listener, result, error)
+    cache = fixtures.cache
+    cache.clear_statistics()
+    cache.enter(fixtures.SESSION, "session")
+    module_name = None
+    start = time.perf_counter()
+    for suite in suites:
+        if _module_name(suite) != module_name:
+            if module_name is not None:
+                _release(fixtures.MODULE, module_name, listener, result)
+            module_name = _module_name(suite)
+            cache.enter(fixtures.MODULE, module_name)
+        run_suite(suite, listener, result, share_contexts)
+    if module_name is not None:
+        _release(fixtures.MODULE, module_name, listener, result)
+    _release(fixtures.SESSION, "session", listener, result)
+    result.elapsed = time.perf_counter() - start
+    result.fixtures = cache.statistics()
+    return result
@@ -0,0 +1,313 @@
+# -*- coding: ascii -*-
+
+"""Content-addressed store of snapshots for snapshot verifiers.
+
+should_match_snapshot() compares a value with the snapshot that was
+recorded at the first run:
+
+    value_of(render_page()).should_match_snapshot("front page")
+
+Snapshots are stored in '__snapshots__' directory next to the spec file:
+
+    __snapshots__/index.json       key -> sha256 of the snapshot
+    __snapshots__/objects/ab/cdef  snapshot contents named by sha256
+
+The key is made of the spec file name, the qualified name of the spec
+function with the parameters of its case (see pyspec3.make_spec_id) and
+the snapshot name, so each case of a parametrized spec has its own
+snapshot. The runner tells the running case by set_running_spec().
+
+The index is read once per process, so a snapshot that didn't change
+costs one hash of the value and one dict lookup. The stored content is
+read only when the hashes are different. A broken index.json raises
+ValueError that tells how to fix it.
+
+Values are serialized as bytes, str or pprint text of other values. dicts
+and sets are sorted by pprint, so their order doesn't change snapshots.
+
+Set PYSPEC_UPDATE_SNAPSHOTS=1, or pyspec3.snapshot.config.update = True,
+to rewrite different snapshots instead of failing. Files are written to
+temporary files and renamed, so an interrupted run never leaves a broken
+snapshot.
+
+Recorded snapshots are added to index.json by flush(), which runs when
+the interpreter exits. It merges them with the index on disk under a lock
+file, so parallel workers that share a snapshot directory don't lose each
+other's snapshots.
+"""
+
+__pyspec = 1
+
+import os
+import time
+import json
+import atexit
+import inspect
+import pprint
+import hashlib
+import tempfile
+import threading
+import contextvars
+
+
+class _config_type(object):
+    __slots__ = ("directory_name", "update", "record_missing",
+                 "lock_timeout")
+    def __init__(self):
+        self.directory_name = "__snapshots__"
+        self.update = os.environ.get("PYSPEC_UPDATE_SNAPSHOTS", "") \
+            not in ("", "0")
+        self.record_missing = True
+        # seconds after which a lock file is treated as left by a dead
+        # process.
+        self.lock_timeout = 10.0
+
+
+config = _config_type()
+
+
+def serialize(value):
+    """Return bytes of value with its kind in the first line."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return b"bytes\n" + bytes(value)
+    if isinstance(value, str):
+        return b"str\n" + value.encode("utf-8")
+    return b"pprint\n" + pprint.pformat(value).encode("utf-8")
+
+
+def deserialize(data):
+    """Return bytes or text of serialized data for difference reports."""
+    kind, _, body = data.partition(b"\n")
+    if kind == b"bytes":
+        return body
+    return body.decode("utf-8")
+
+
+_running_spec = contextvars.ContextVar("pyspec_running_spec",
+                                       default=None)
+
+
+def set_running_spec(function, spec_id):
+    """Tell spec_key() the spec id of the case that runs function in this
+    context. Return token for reset_running_spec()."""
+    code = getattr(inspect.unwrap(function), "__code__", None)
+    return _running_spec.set((code, spec_id))
+
+
+def reset_running_spec(token):
+    _running_spec.reset(token)
+
+
+def spec_key(frame, name):
+    """Return key of snapshot from the frame of spec function."""
+    code = frame.f_code
+    running = _running_spec.get()
+    if running is not None and running[0] is code:
+        # qualified name and case parameters without the path.
+        qualname = running[1].split("::", 1)[-1]
+    else:
+        qualname = getattr(code, "co_qualname", code.co_name)
+    return "%s::%s::%s" % (os.path.basename(code.co_filename), qualname,
+                           name)
+
+
+def _atomic_write(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(prefix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as output:
+            output.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _read_index(path):
+    try:
+        with open(path, "r") as index_file:
+            index = json.load(index_file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as error:
+        raise ValueError("snapshot index %s is broken (%s). Restore it from "
+                         "version control, or remove it to record the "
+                         "snapshots again." % (path, error))
+    if not isinstance(index, dict):
+        raise ValueError("snapshot index %s should have a JSON object, but "
+                         "had %s." % (path, type(index).__name__))
+    return index
+
+
+class _FileLock(object):
+    """Lock between processes made by creating a file exclusively."""
+    __slots__ = ("path",)
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        while True:
+            try:
+                os.close(os.open(self.path,
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                try:
+                    age = time.time() - os.path.getmtime(self.path)
+                except OSError:
+                    continue
+                if age > config.lock_timeout:
+                    try:
+                        os.remove(self.path)
+                    except OSError:
+                        pass
+                    continue
+                time.sleep(0.01)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class SnapshotStore(object):
+    """Snapshots in one directory.
+
+    @ivar directory: path of the store.
+    @ivar index: dict of key -> sha256 hex digest.
+    @ivar changes: dict of keys written by this process that are not
+                   flushed to index.json yet.
+    """
+    __slots__ = ("directory", "index", "changes", "lock")
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.index = _read_index(self.index_path())
+        self.changes = {}
+
+    def index_path(self):
+        return os.path.join(self.directory, "index.json")
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2],
+                            digest[2:])
+
+    def get(self, key):
+        """Return digest of snapshot or None."""
+        return self.index.get(key)
+
+    def read(self, digest):
+        with open(self.object_path(digest), "rb") as object_file:
+            return object_file.read()
+
+    def write(self, key, data, digest):
+        """Store data as the snapshot of key.
+
+        The index on disk is updated by flush().
+        """
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            _atomic_write(path, data)
+        with self.lock:
+            self.index[key] = digest
+            self.changes[key] = digest
+
+    def flush(self):
+        """Merge written snapshots into index.json on disk."""
+        with self.lock:
+            if not self.changes:
+                return
+            index_path = self.index_path()
+            with _FileLock(index_path + ".lock"):
+                index = _read_index(index_path)
+                index.update(self.changes)
+                text = json.dumps(index, indent=1, sort_keys=True)
+                _atomic_write(index_path, text.encode("ascii"))
+            self.changes = {}
+            self.index = index
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(spec_filename):
+    """Return SnapshotStore of the spec file. Stores are cached."""
+    directory = os.path.join(os.path.dirname(os.path.abspath(spec_filename)),
+                             config.directory_name)
+    try:
+        return _stores[directory]
+    except KeyError:
+        with _stores_lock:
+            store = _stores.get(directory)
+            if store is None:
+                store = _stores[directory] = SnapshotStore(directory)
+            return store
+
+
+def flush():
+    """Write recorded snapshots of all stores to their index files."""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush()
+
+
+def clear_cache():
+    """Flush and forget loaded indexes. They are read again at next use."""
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.flush()
+
+
+atexit.register(flush)
+
+
+class SnapshotResult(object):
+    """Result of check().
+
+    @ivar status: "match", "recorded", "updated", "missing" or "different".
+    @ivar expected: serialized snapshot if it was read.
+    @ivar actual: serialized value.
+    @ivar path: path of the snapshot content.
+    """
+    __slots__ = ("status", "expected", "actual", "path")
+    def __init__(self, status, actual, path, expected=None):
+        self.status = status
+        self.actual = actual
+        self.path = path
+        self.expected = expected
+
+
+def check(frame, name, value):
+    """Compare value with the snapshot of the spec function of frame.
+
+    @rtype: SnapshotResult
+    """
+    store = get_store(frame.f_code.co_filename)
+    key = spec_key(frame, name)
+    data = serialize(value)
+    digest = hashlib.sha256(data).hexdigest()
+    stored = store.get(key)
+    if stored == digest:
+        return SnapshotResult("match", data, store.object_path(digest))
+    if stored is None:
+        if not (config.record_missing or config.update):
+            return SnapshotResult("missing", data, None)
+        store.write(key, data, digest)
+        return SnapshotResult("recorded", data, store.object_path(digest))
+    if config.update:
+        store.write(key, data, digest)
+        return SnapshotResult("updated", data, store.object_path(digest))
+    path = store.object_path(stored)
+    try:
+        expected = store.read(stored)
+    except FileNotFoundError:
+        expected = None
+    return SnapshotResult("different", data, path, expected)
@@ -0,0 +1,269 @@
+# -*- coding: ascii -*-
+
+"""Source code lookup for verifier messages.
+
+Verifiers show the expression that produced the actual value, like
+"a + b should equal 3.". inspect.stack() builds the whole stack and reads
+the source context of every frame, so this module picks up only the frame
+it needs and caches the result by (code object, line number).
+
+Each spec module is parsed once into a SourceIndex. It knows every
+value_of(...).should_xxx(...) and About(...).should_xxx(...) call and its
+argument expressions, even if the call spans several lines. The index is
+rebuilt when the modification time of the file changes.
+
+A code object never changes after compiling, so the cached text stays valid
+while the module is loaded. Reloading the module makes new code objects and
+the cache is filled again.
+"""
+
+__pyspec = 1
+
+import os
+import re
+import ast
+import sys
+import linecache
+
+
+_target_pattern = re.compile(r"About\((.*?)\).should")
+_argument_patterns = {}
+_line_cache = {}
+_target_cache = {}
+_argument_cache = {}
+_indexes = {}
+_verify_functions = frozenset(("value_of", "About"))
+
+
+class VerifyCall(object):
+    """Source information of one 'value_of(actual).should_xxx(...)' call.
+
+    @ivar method: verifier method name like 'should_equal'.
+    @ivar target: expression passed to value_of() or About().
+    @ivar arguments: expressions passed to the verifier method.
+    @ivar text: whole source text of the call.
+    """
+    __slots__ = ("method", "target", "arguments", "text", "end")
+    def __init__(self, method, target, arguments, text, end):
+        self.method = method
+        self.target = target
+        self.arguments = arguments
+        self.text = text
+        self.end = end
+
+
+class SourceIndex(object):
+    """Verify call table of one source file.
+
+    It maps each line number to the verify calls that contain the line.
+    """
+    __slots__ = ("filename", "mtime", "lines")
+    def __init__(self, filename, mtime, source_text):
+        self.filename = filename
+        self.mtime = mtime
+        self.lines = {}
+        try:
+            tree = ast.parse(source_text, filename)
+        except (SyntaxError, ValueError):
+            return
+        for node in ast.walk(tree):
+            call = self._verify_call(node, source_text)
+            if call is None:
+                continue
+            for lineno in range(node.lineno, node.end_lineno + 1):
+                self.lines.setdefault(lineno, []).append(call)
+
+    @staticmethod
+    def _verify_call(node, source_text):
+        if not isinstance(node, ast.Call):
+            return None
+        method = node.func
+        if not isinstance(method, ast.Attribute):
+            return None
+        if not method.attr.startswith("should"):
+            return None
+        verify = method.value
+        if not isinstance(verify, ast.Call) or len(verify.args) != 1:
+            return None
+        function = verify.func
+        if isinstance(function, ast.Attribute):
+            name = function.attr
+        elif isinstance(function, ast.Name):
+            name = function.id
+        else:
+            return None
+        if name not in _verify_functions:
+            return None
+        segment = ast.get_source_segment
+        arguments = tuple(segment(source_text, arg) for arg in node.args)
+        return VerifyCall(method.attr, segment(source_text, verify.args[0]),
+                          arguments, segment(source_text, node),
+                          (node.end_lineno, node.end_col_offset))
+
+    def find(self, lineno, method=None, end=None):
+        """Return the verify call at the line.
+
+        @param lineno: line number.
+        @param method: verifier method name to choose a call.
+        @param end: (line, column) where the call ends. It is used to choose
+                    a call if the line has two or more calls.
+        @return: VerifyCall object or None.
+        """
+        calls = self.lines.get(lineno)
+        if not calls:
+            return None
+        candidates = [call for call in calls
+                      if method is None or call.method == method]
+        if end is not None and len(candidates) > 1:
+            for call in candidates:
+                if call.end == end:
+                    return call
+        if candidates:
+            return candidates[0]
+        return None
+
+
+def get_index(filename, module_globals=None):
+    """Return SourceIndex of the file.
+
+    The index is parsed at first call and rebuilt if the file is modified.
+
+    @return: SourceIndex object or None if the file is not available.
+    """
+    try:
+        mtime = os.stat(filename).st_mtime
+    except (OSError, ValueError):
+        mtime = None
+    index = _indexes.get(filename)
+    if index is not None and index.mtime == mtime:
+        return index
+    if index is not None:
+        _forget_file(filename)
+    linecache.checkcache(filename)
+    lines = linecache.getlines(filename, module_globals)
+    if not lines:
+        return None
+    index = SourceIndex(filename, mtime, "".join(lines))
+    _indexes[filename] = index
+    return index
+
+
+def _forget_file(filename):
+    for cache in (_line_cache, _target_cache, _argument_cache):
+        for key in [key for key in cache if key[0].co_filename == filename]:
+            del cache[key]
+
+
+def _call_end(frame):
+    """Return (line, column) where the running call of the frame ends."""
+    positions = getattr(frame.f_code, "co_positions", None)
+    if positions is None or frame.f_lasti < 0:
+        return None
+    for i, position in enumerate(positions()):
+        if i == frame.f_lasti // 2:
+            return position[1], position[3]
+    return None
+
+
+def _find_call(frame, method=None):
+    index = get_index(frame.f_code.co_filename, frame.f_globals)
+    if index is None:
+        return None
+    return index.find(frame.f_lineno, method, _call_end(frame))
+
+
+def _argument_pattern(method_name):
+    """Return precompiled pattern to split 'About(a).method(b)'."""
+    pattern = _argument_patterns.get(method_name)
+    if pattern is None:
+        pattern = re.compile(r"About\((.*?)\).%s\((.*?)\)" %
+                             re.escape(method_name))
+        _argument_patterns[method_name] = pattern
+    return pattern
+
+
+def _read_line(frame):
+    key = (frame.f_code, frame.f_lineno)
+    try:
+        return _line_cache[key]
+    except KeyError:
+        pass
+    line = linecache.getline(frame.f_code.co_filename, frame.f_lineno,
+                             frame.f_globals)
+    if not line:
+        line = None
+    _line_cache[key] = line
+    return line
+
+
+def get_source_line(depth=1):
+    """Return source code line of the frame.
+
+    @param depth: frame depth. 0 is this function, 1 is the caller.
+    @return: source code line or None if the source is not available.
+    """
+    return _read_line(sys._getframe(depth))
+
+
+def get_target(depth=1):
+    """Return the expression passed to value_of() or About() in the frame.
+
+    @param depth: frame depth. 0 is this function, 1 is the caller.
+    @return: expression string or None.
+    """
+    frame = sys._getframe(depth)
+    key = (frame.f_code, frame.f_lasti)
+    try:
+        return _target_cache[key]
+    except KeyError:
+        pass
+    call = _find_call(frame)
+    if call is not None:
+        _target_cache[key] = call.target
+        return call.target
+    line = _read_line(frame)
+    target = None
+    if line is not None:
+        match = _target_pattern.search(line)
+        if match:
+            target = match.group(1)
+    _target_cache[key] = target
+    return target
+
+
+def get_arguments(method_name, depth=1):
+    """Return source code, target expression and verifier argument.
+
+    @param method_name: verifier method name like 'should_be_same'.
+    @param depth: frame depth. 0 is this function, 1 is the caller.
+    @return: tuple of (source code, actual expression, expected expression).
+             Unknown items are None.
+    """
+    frame = sys._getframe(depth)
+    key = (frame.f_code, frame.f_lasti, method_name)
+    try:
+        return _argument_cache[key]
+    except KeyError:
+        pass
+    call = _find_call(frame, method_name)
+    if call is not None:
+        expected = call.arguments[0] if call.arguments else None
+        result = (call.text, call.target, expected)
+        _argument_cache[key] = result
+        return result
+    line = _read_line(frame)
+    result = (line, None, None)
+    if line is not None:
+        match = _argument_pattern(method_name).search(line)
+        if match:
+            result = (line, match.group(1), match.group(2))
+    _argument_cache[key] = result
+    return result
+
+
+def clear_cache():
+    """Forget all cached source code."""
+    _indexes.clear()
+    _line_cache.clear()
+    _target_cache.clear()
+    _argument_cache.clear()
@@ -0,0 +1,101 @@
+# -*- coding: ascii -*-
+
+"""Lockstep comparison of iterables for stream verifiers.
+
+compare_streams() reads actual and expected iterables chunk by chunk and
+stops at the first difference. Only one chunk of each stream and a few
+items before the difference are kept, so streams of any length are
+compared in constant memory:
+
+    value_of(read_records(path)).should_equal_stream(expected_records())
+
+Each pair of chunks is compared by one list '==' first, and only the
+chunk that has the difference is compared item by item.
+"""
+
+__pyspec = 1
+
+from collections import deque
+from itertools import islice
+
+
+END = type("End", (object,), {"__repr__": lambda self: "<end>"})()
+
+
+class StreamDifference(object):
+    """First difference of two streams.
+
+    @ivar index: index of the first different item.
+    @ivar actual: actual item at index, or END if actual stream ended.
+    @ivar expected: expected item at index, or END if expected stream ended.
+    @ivar before: list of equal items just before index.
+    @ivar actual_after: list of actual items just after index.
+    @ivar expected_after: list of expected items just after index.
+    """
+    __slots__ = ("index", "actual", "expected", "before", "actual_after",
+                 "expected_after")
+    def __init__(self, index, actual, expected, before):
+        self.index = index
+        self.actual = actual
+        self.expected = expected
+        self.before = before
+        self.actual_after = []
+        self.expected_after = []
+
+    def reason(self):
+        if self.actual is END:
+            return "actual stream ended at index %d" % self.index
+        if self.expected is END:
+            return "actual stream had more than %d items" % self.index
+        return "item %d was different" % self.index
+
+
+def _following(chunk, start, iterator, count):
+    """Return count items after start of chunk, read on from iterator."""
+    items = chunk[start:start + count]
+    if len(items) < count:
+        items.extend(islice(iterator, count - len(items)))
+    return items
+
+
+def compare_streams(actual, expected, chunk_size=1024, window=3):
+    """Compare two iterables item by item.
+
+    @param chunk_size: number of items read from each stream at once.
+    @param window: number of items kept before and read after the
+                   difference.
+    @return: StreamDifference or None if the streams are equal.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size should be positive, but was %r" %
+                         chunk_size)
+    actual = iter(actual)
+    expected = iter(expected)
+    before = deque(maxlen=window)
+    index = 0
+    while True:
+        actual_chunk = list(islice(actual, chunk_size))
+        expected_chunk = list(islice(expected, chunk_size))
+        if actual_chunk == expected_chunk:
+            if len(actual_chunk) < chunk_size:
+                return None
+            index += len(actual_chunk)
+            if window:
+                before.extend(actual_chunk[-window:])
+            continue
+        for offset in range(max(len(actual_chunk), len(expected_chunk))):
+            lhs = actual_chunk[offset] if offset < len(actual_chunk) else END
+            rhs = expected_chunk[offset] \
+                if offset < len(expected_chunk) else END
+            if lhs is END or rhs is END or not lhs == rhs:
+                break
+            before.append(lhs)
+        difference = StreamDifference(index + offset, lhs, rhs, list(before))
+        if lhs is not END:
+            difference.actual_after = _following(actual_chunk, offset + 1,
+                                                 actual, window)
+        if rhs is not END:
+            difference.expected_after = _following(expected_chunk,
+                                                   offset + 1, expected,
+                                                   window)
+        return difference
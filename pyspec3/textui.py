@@ -0,0 +1,246 @@
+# -*- coding: ascii -*-
+
+"""Text user interface of spec runner.
+
+run_test() in pyspec3 runs specs of __main__ module with this runner:
+
+    from pyspec3 import *
+
+    @spec
+    def easy_test():
+        value_of(2 + 1).should_equal(3)
+
+    if __name__ == "__main__":
+        run_test()
+
+Specs in a directory tree are found by pyspec3.discovery without importing
+files that have no specs, and only those files are imported:
+
+    python -m pyspec3.textui specs/
+    python -m pyspec3.textui --list -k "StackBehavior.*" specs/
+    python -m pyspec3.textui --shard 0/4 specs/
+    python -m pyspec3.textui --share-contexts specs/
+    python -m pyspec3.textui --grace 0 specs/
+
+Listing, selection and sharding work on the static index, so spec modules
+are imported only by the process that runs their selected specs.
+
+The command line runner exits the process when a timed out spec doesn't
+stop within --grace seconds (see pyspec3.watchdog). 0 disables it.
+"""
+
+__pyspec = 1
+
+import os
+import sys
+import argparse
+
+from pyspec3 import runner
+from pyspec3 import discovery
+from pyspec3 import fixtures
+from pyspec3.watchdog import watchdog, GRACE
+
+
+class TextListener(runner.Listener):
+    """Show one character for each spec, or names if verbose."""
+    marks = {runner.SUCCESS: ".", runner.FAILURE: "F", runner.ERROR: "E",
+             runner.IGNORED: "I", runner.TIMEOUT: "T"}
+
+    def __init__(self, stream, verbosity=1):
+        self.stream = stream
+        self.verbosity = verbosity
+
+    def start_spec(self, name):
+        if self.verbosity > 1:
+            self.stream.write("%s ... " % name)
+
+    def end_spec(self, result):
+        if self.verbosity > 1:
+            self.stream.write("%s\n" % result.status)
+        else:
+            self.stream.write(self.marks[result.status])
+        self.stream.flush()
+
+
+class TextSpecTestRunner(object):
+    """Spec runner that writes results as text.
+
+    usage:
+        TextSpecTestRunner(auto=True).run()        # specs of __main__
+        TextSpecTestRunner().run(paths=["specs"])  # specs in directory
+
+    If share_contexts is True, specs that use the same contexts share one
+    fixture. See pyspec3.runner.run_suite().
+    """
+    def __init__(self, auto=False, stream=None, verbosity=1,
+                 share_contexts=False):
+        self.auto = auto
+        self.stream = stream or sys.stderr
+        self.verbosity = verbosity
+        self.share_contexts = share_contexts
+
+    @staticmethod
+    def discover(paths, **selection):
+        """Return list of (root, SpecFile) of selected specs in paths.
+
+        Files are not imported. See pyspec3.discovery.select() for the
+        selection keywords.
+        """
+        found = []
+        for path in paths:
+            root = path if os.path.isdir(path) else os.path.dirname(path)
+            spec_files = discovery.discover(path)
+            if selection:
+                spec_files = discovery.select(spec_files, **selection)
+            for spec_file in spec_files:
+                found.append((os.path.abspath(root), spec_file))
+        return found
+
+    def collect(self, modules=(), paths=(), errors=None, **selection):
+        """Return list of SpecSuite of modules and spec files in paths.
+
+        Only the spec files that have selected specs are imported.
+
+        @param errors: list that receives error SpecResults of spec files
+                       that couldn't be parsed or imported. If it is None,
+                       the errors are raised.
+        """
+        suites = []
+        if self.auto:
+            modules = [sys.modules["__main__"]] + list(modules)
+        for module in modules:
+            suites.extend(runner.collect_module(module))
+        for root, spec_file in self.discover(paths, **selection):
+            if spec_file.error is not None:
+                if errors is None:
+                    raise SyntaxError(spec_file.error)
+                errors.append(runner.SpecResult(spec_file.relative_path,
+                                                runner.ERROR,
+                                                spec_file.error))
+                continue
+            names = set(info.qualname() for info in spec_file.specs
+                        if info.kind == "spec")
+            try:
+                module = runner.load_file(spec_file.path, root)
+            except Exception as error:
+                if errors is None:
+                    raise
+                errors.append(runner.SpecResult(spec_file.relative_path,
+                                                runner.ERROR,
+                                                runner.format_error(error)))
+                continue
+            suites.extend(runner.collect_module(module, names))
+        return suites
+
+    def list(self, paths=(), **selection):
+        """Write the tree of selected specs without importing them."""
+        spec_files = [spec_file for root, spec_file
+                      in self.discover(paths, **selection)]
+        for line in discovery.format_tree(spec_files):
+            self.stream.write("%s\n" % line)
+        self.stream.flush()
+        return spec_files
+
+    def run(self, modules=(), paths=(), **selection):
+        """Run specs and write the report.
+
+        @rtype: pyspec3.runner.RunResult
+        """
+        errors = []
+        suites = self.collect(modules, paths, errors, **selection)
+        result = runner.run_suites(suites,
+                                   TextListener(self.stream, self.verbosity),
+                                   keep_passed=False,
+                                   share_contexts=self.share_contexts,
+                                   errors=errors)
+        self.report(result)
+        return result
+
+    def report(self, result):
+        write = self.stream.write
+        if self.verbosity <= 1 and result.count():
+            write("\n")
+        for spec_result in result.results:
+            if spec_result.status in (runner.FAILURE, runner.ERROR,
+                                      runner.TIMEOUT):
+                write("=" * 70 + "\n")
+                write("%s: %s\n" % (spec_result.status.upper(),
+                                    spec_result.name))
+                write("-" * 70 + "\n")
+                write(spec_result.message)
+                write("\n")
+        write("-" * 70 + "\n")
+        write("Ran %d specs in %.3fs\n\n" % (result.count(),
+                                             result.elapsed))
+        counts = []
+        for status in (runner.FAILURE, runner.ERROR, runner.TIMEOUT,
+                       runner.IGNORED):
+            count = result.count(status)
+            if count:
+                counts.append("%s=%d" % (status, count))
+        for line in fixtures.format_statistics(result.fixtures):
+            write("%s\n" % line)
+        if result.was_successful():
+            write("OK%s\n" % (" (%s)" % ", ".join(counts) if counts else ""))
+        else:
+            write("FAILED (%s)\n" % ", ".join(counts))
+        self.stream.flush()
+
+
+def _parse_shard(text):
+    index, count = text.split("/")
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError("shard should be like 0/4, but was %r" % text)
+    return index, count
+
+
+def main(argv=None):
+    """Command line entry point. Return exit status.
+
+    usage:
+        python -m pyspec3.textui [-v] [--list] [-k PATTERN] [-g GROUP]
+                                 [--shard INDEX/COUNT] [--share-contexts]
+                                 [--grace SECONDS] [PATH ...]
+    """
+    parser = argparse.ArgumentParser(prog="python -m pyspec3.textui")
+    parser.add_argument("paths", nargs="*", default=["."])
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("--list", action="store_true",
+                        help="list selected specs without importing them")
+    parser.add_argument("-k", dest="patterns", action="append", default=[],
+                        help="select specs by id, name or glob pattern")
+    parser.add_argument("-g", "--group", dest="groups", action="append",
+                        default=[], help="select specs of the group")
+    parser.add_argument("--shard", type=_parse_shard,
+                        help="run one shard like 0/4")
+    parser.add_argument("--share-contexts", action="store_true",
+                        help="run contexts once for each group of specs")
+    parser.add_argument("--grace", type=float, default=GRACE,
+                        help="seconds to wait for a timed out spec before "
+                             "exiting, 0 to wait forever")
+    options = parser.parse_args(argv)
+    selection = {}
+    if options.patterns:
+        selection["patterns"] = options.patterns
+    if options.groups:
+        selection["groups"] = options.groups
+    if options.shard:
+        selection["shard"] = options.shard
+    ui = TextSpecTestRunner(stream=sys.stdout if options.list else None,
+                            verbosity=2 if options.verbose else 1,
+                            share_contexts=options.share_contexts)
+    if options.list:
+        ui.list(options.paths, **selection)
+        return 0
+    grace = watchdog.grace
+    watchdog.grace = options.grace if options.grace > 0 else None
+    try:
+        result = ui.run(paths=options.paths, **selection)
+    finally:
+        watchdog.grace = grace
+    return 0 if result.was_successful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
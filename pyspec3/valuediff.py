@@ -0,0 +1,437 @@
+# -*- coding: ascii -*-
+
+"""Bounded value rendering and difference reports for failure messages.
+
+Verifiers show actual and expected values in failure messages. str() of a
+50 MB string or a million element list makes a huge message, so values are
+shortened to about 'repr_limit' characters here, and containers are
+rendered by reprlib without converting all items.
+
+describe_difference() explains where two values differ. It is called only
+when a verification fails and stops after 'max_differences' differences.
+Nested dicts, lists, sets and dataclasses are walked by iter_differences()
+and each difference is shown with its path like "['users'][0].name".
+If 'spill_directory' is set, the full unified diff is written to a file in
+the directory and the message shows its path.
+
+Options can be changed like this:
+
+    import pyspec3.valuediff
+    pyspec3.valuediff.config.repr_limit = 1000
+    pyspec3.valuediff.config.spill_directory = "diff_output"
+"""
+
+__pyspec = 1
+
+import os
+import array
+import pprint
+import difflib
+import dataclasses
+import reprlib
+import tempfile
+from collections import deque
+from itertools import islice
+
+
+class _config_type(object):
+    __slots__ = ("repr_limit", "max_differences", "spill_directory",
+                 "window")
+    def __init__(self):
+        self.repr_limit = 240
+        self.max_differences = 10
+        self.spill_directory = os.environ.get("PYSPEC_DIFF_DIR")
+        self.window = 20
+
+
+config = _config_type()
+
+
+class _LimitedRepr(reprlib.Repr):
+    def __init__(self):
+        reprlib.Repr.__init__(self)
+        self.maxlevel = 6
+        self.maxlist = self.maxtuple = self.maxset = self.maxfrozenset = 20
+        self.maxdeque = self.maxarray = 20
+        self.maxdict = 10
+        self.maxstring = 60
+        self.maxlong = 60
+        self.maxother = 60
+
+    def repr_str(self, value, level):
+        return repr(shorten(value, self.maxstring))
+
+    def repr_bytes(self, value, level):
+        return repr(shorten(value, self.maxstring))
+
+    def repr_bytearray(self, value, level):
+        return repr(shorten(value, self.maxstring))
+
+    def repr_instance(self, value, level):
+        # subclasses of containers are rendered by the handler of the
+        # nearest builtin class instead of their full repr().
+        for base in type(value).__mro__[1:]:
+            handler = _base_handlers.get(base)
+            if handler is not None:
+                return "%s(%s)" % (type(value).__name__,
+                                   handler(self, value, level))
+        return reprlib.Repr.repr_instance(self, value, level)
+
+    # reprlib sorts dict keys and set items. Keep the order of str().
+
+    def repr_dict(self, value, level):
+        if not value:
+            return "{}"
+        if level <= 0:
+            return "{...}"
+        pieces = ["%s: %s" % (self.repr1(key, level - 1),
+                              self.repr1(value[key], level - 1))
+                  for key in islice(value, self.maxdict)]
+        if len(value) > self.maxdict:
+            pieces.append("...")
+        return "{%s}" % ", ".join(pieces)
+
+    def repr_set(self, value, level):
+        if not value:
+            return "set()"
+        return self._repr_iterable(value, level, "{", "}", self.maxset)
+
+    def repr_frozenset(self, value, level):
+        if not value:
+            return "frozenset()"
+        return self._repr_iterable(value, level, "frozenset({", "})",
+                                   self.maxfrozenset)
+
+
+_base_handlers = {
+    str: _LimitedRepr.repr_str,
+    bytes: _LimitedRepr.repr_bytes,
+    bytearray: _LimitedRepr.repr_bytearray,
+    list: reprlib.Repr.repr_list,
+    tuple: reprlib.Repr.repr_tuple,
+    dict: _LimitedRepr.repr_dict,
+    set: _LimitedRepr.repr_set,
+    frozenset: _LimitedRepr.repr_frozenset,
+    deque: reprlib.Repr.repr_deque,
+    array.array: reprlib.Repr.repr_array,
+}
+_limited_repr = _LimitedRepr()
+_bounded_types = tuple(_base_handlers)
+
+
+def shorten(text, limit=None):
+    """Cut the middle of text, bytes or bytearray if it is longer than
+    limit."""
+    if limit is None:
+        limit = config.repr_limit
+    if len(text) <= limit:
+        return text
+    head = max(limit // 2, 1)
+    tail = max(limit - head - 5, 0)
+    if isinstance(text, (bytes, bytearray)):
+        return text[:head] + b" ... " + text[len(text) - tail:]
+    return "%s ... %s" % (text[:head],
+                          text[len(text) - tail:] if tail else "")
+
+
+def limited_repr(value, limit=None):
+    """repr() that never makes a string much longer than limit.
+
+    Strings, bytes and containers, including their subclasses, are
+    rendered without converting all items. Other objects are rendered by
+    their own repr() and cut.
+    """
+    if type(value) in (str, bytes, bytearray):
+        text = repr(shorten(value, limit))
+        if len(text) > 2 * (limit or config.repr_limit):
+            # escaped characters like '\x00' make repr() longer.
+            text = shorten(text, limit)
+        return text
+    if isinstance(value, _bounded_types):
+        return shorten(_limited_repr.repr(value), limit)
+    return shorten(repr(value), limit)
+
+
+def limited_str(value, limit=None):
+    """str() that never makes a string much longer than limit."""
+    if isinstance(value, str):
+        return shorten(str(value), limit)
+    if isinstance(value, _bounded_types):
+        return shorten(_limited_repr.repr(value), limit)
+    return shorten(str(value), limit)
+
+
+def _first_difference(expected, actual, step=4096):
+    """Return the first index where two strings differ.
+
+    Chunks are compared by slices, so only the chunk that has the
+    difference is scanned character by character.
+    """
+    size = min(len(expected), len(actual))
+    for start in range(0, size, step):
+        stop = min(start + step, size)
+        if expected[start:stop] == actual[start:stop]:
+            continue
+        for index in range(start, stop):
+            if expected[index] != actual[index]:
+                return index
+    return size
+
+
+def _describe_text(expected, actual):
+    index = _first_difference(expected, actual)
+    start = max(index - config.window, 0)
+    stop = index + config.window
+    lines = []
+    if len(expected) != len(actual):
+        lines.append("length: expected %d, but was %d" %
+                     (len(expected), len(actual)))
+    if isinstance(actual, str):
+        line = actual.count("\n", 0, index) + 1
+        column = index - (actual.rfind("\n", 0, index) + 1) + 1
+        lines.append("first difference at index %d (line %d, column %d)" %
+                     (index, line, column))
+    else:
+        lines.append("first difference at index %d" % index)
+    lines.append("  expected: %r" % expected[start:stop])
+    lines.append("  actual:   %r" % actual[start:stop])
+    return lines
+
+
+MISSING = type("Missing", (object,), {"__repr__": lambda self: "<missing>"})()
+
+
+class Difference(object):
+    """One difference found by iter_differences().
+
+    @ivar path: position of the values. Use format_path() to show it.
+    @ivar expected: expected value or MISSING.
+    @ivar actual: actual value or MISSING.
+    @ivar reason: None for different values, "length" for different sizes
+                  of sequences, "type" for containers of different types.
+    """
+    __slots__ = ("path", "expected", "actual", "reason")
+    def __init__(self, path, expected, actual, reason=None):
+        self.path = path
+        self.expected = expected
+        self.actual = actual
+        self.reason = reason
+
+    def __str__(self):
+        label = format_path(self.path)
+        if self.reason == "length":
+            return "%slength: expected %d, but was %d" % \
+                (label + " " if label else "", self.expected, self.actual)
+        if self.reason == "type":
+            return "%stype: expected %s, but was %s" % \
+                (label + " " if label else "", type(self.expected).__name__,
+                 type(self.actual).__name__)
+        if self.actual is MISSING:
+            return "%s: missing" % label
+        if self.expected is MISSING:
+            return "%s: unexpected" % label
+        return "%s: expected %s, but was %s" % \
+            (label or "value", limited_repr(self.expected, 80),
+             limited_repr(self.actual, 80))
+
+
+def format_path(path):
+    """Return string like "['users'][0].name" from a path."""
+    components = []
+    while path is not None:
+        path, kind, key = path
+        if kind == "attribute":
+            components.append(".%s" % key)
+        elif kind == "item":
+            components.append("{%s}" % limited_repr(key, 40))
+        else:
+            components.append("[%s]" % limited_repr(key, 40))
+    components.reverse()
+    return "".join(components)
+
+
+_set_types = (set, frozenset)
+
+
+def _kind(value):
+    """Return kind of container that is walked, or None for leaves."""
+    if isinstance(value, dict):
+        return dict
+    if isinstance(value, list):
+        return list
+    if isinstance(value, tuple):
+        return tuple
+    if isinstance(value, _set_types):
+        return set
+    if dataclasses.is_dataclass(value) and not isinstance(value, type) and \
+            value.__dataclass_params__.eq:
+        # dataclasses with eq=False are compared by identity.
+        return dataclasses.dataclass
+    return None
+
+
+def _same(expected, actual):
+    """Quick check of leaves by identity and '=='. Containers of the same
+    kind are left to the walker, so '==' never runs on deep values."""
+    if expected is actual:
+        return True
+    kind = _kind(expected)
+    if kind is not None and kind is _kind(actual):
+        return False
+    try:
+        return expected == actual
+    except RecursionError:
+        return False
+
+
+def _mapping_children(path, expected, actual):
+    for key in expected:
+        if key in actual:
+            if not _same(expected[key], actual[key]):
+                yield ((path, "key", key), expected[key], actual[key])
+        else:
+            yield Difference((path, "key", key), expected[key], MISSING)
+    for key in actual:
+        if key not in expected:
+            yield Difference((path, "key", key), MISSING, actual[key])
+
+
+def _sequence_children(path, expected, actual):
+    if len(expected) != len(actual):
+        yield Difference(path, len(expected), len(actual), "length")
+    for index, (lhs, rhs) in enumerate(zip(expected, actual)):
+        if not _same(lhs, rhs):
+            yield ((path, "index", index), lhs, rhs)
+
+
+def _set_children(path, expected, actual):
+    for item in expected:
+        if item not in actual:
+            yield Difference((path, "item", item), item, MISSING)
+    for item in actual:
+        if item not in expected:
+            yield Difference((path, "item", item), MISSING, item)
+
+
+def _dataclass_children(path, expected, actual):
+    for field in dataclasses.fields(expected):
+        lhs = getattr(expected, field.name)
+        rhs = getattr(actual, field.name)
+        if not _same(lhs, rhs):
+            yield ((path, "attribute", field.name), lhs, rhs)
+
+
+def _children(path, expected, actual):
+    """Return generator of child pairs, or None if values are leaves.
+
+    Containers of different kinds, like a list and a tuple, have one type
+    difference, because '==' of them is False.
+    """
+    kind = _kind(expected)
+    if kind is None:
+        return None
+    actual_kind = _kind(actual)
+    if actual_kind is None:
+        return None
+    if kind is not actual_kind or (kind is dataclasses.dataclass and
+                                   type(expected) is not type(actual)):
+        return iter((Difference(path, expected, actual, "type"),))
+    if kind is dict:
+        return _mapping_children(path, expected, actual)
+    if kind is set:
+        return _set_children(path, expected, actual)
+    if kind is dataclasses.dataclass:
+        return _dataclass_children(path, expected, actual)
+    return _sequence_children(path, expected, actual)
+
+
+def iter_differences(expected, actual):
+    """Yield Difference objects of two nested values.
+
+    It walks dicts, lists, tuples, sets and dataclasses without recursion,
+    so deep structures never hit the recursion limit. The stack has one
+    generator for each level, so memory is bounded by the depth of the
+    structure, not by its size. Stop the iteration to stop comparing.
+    """
+    stack = [iter(((None, expected, actual),))]
+    visiting = [None]
+    visiting_set = set()
+    while stack:
+        try:
+            item = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            visiting_set.discard(visiting.pop())
+            continue
+        if type(item) is Difference:
+            yield item
+            continue
+        path, lhs, rhs = item
+        if lhs is rhs:
+            continue
+        children = _children(path, lhs, rhs)
+        if children is None:
+            if not lhs == rhs:
+                yield Difference(path, lhs, rhs)
+            continue
+        key = (id(lhs), id(rhs))
+        if key in visiting_set:
+            # recursive structure. it is being compared on the stack.
+            continue
+        visiting_set.add(key)
+        visiting.append(key)
+        stack.append(children)
+
+
+def deep_equal(expected, actual):
+    """Compare two nested values without recursion."""
+    for difference in iter_differences(expected, actual):
+        return False
+    return True
+
+
+def _describe_container(expected, actual):
+    lines = []
+    differences = iter_differences(expected, actual)
+    for difference in islice(differences, config.max_differences):
+        lines.append("  %s" % difference)
+    for difference in differences:
+        lines.append("  ...")
+        break
+    return lines
+
+
+def _spill(expected, actual):
+    """Write full unified diff to a file and return its path."""
+    if isinstance(expected, str) and isinstance(actual, str):
+        expected_lines = expected.splitlines(True)
+        actual_lines = actual.splitlines(True)
+    else:
+        expected_lines = pprint.pformat(expected).splitlines(True)
+        actual_lines = pprint.pformat(actual).splitlines(True)
+    if not os.path.isdir(config.spill_directory):
+        os.makedirs(config.spill_directory)
+    fd, path = tempfile.mkstemp(suffix=".diff", prefix="pyspec_",
+                                dir=config.spill_directory)
+    with os.fdopen(fd, "w") as output:
+        output.writelines(difflib.unified_diff(expected_lines, actual_lines,
+                                               "expected", "actual"))
+    return path
+
+
+def describe_difference(expected, actual):
+    """Return text that shows where two values are different.
+
+    @return: multi-line string or None if there is nothing to explain.
+    """
+    if isinstance(expected, (str, bytes)) and type(expected) is type(actual):
+        lines = _describe_text(expected, actual)
+    elif _children(None, expected, actual) is not None:
+        lines = _describe_container(expected, actual)
+    else:
+        return None
+    if not lines:
+        return None
+    if config.spill_directory:
+        lines.append("full diff: %s" % _spill(expected, actual))
+    return "\n".join(lines)
@@ -0,0 +1,210 @@
+# -*- coding: ascii -*-
+
+"""Watchdog that enforces spec timeouts.
+
+One daemon thread watches the deadline of the running spec. The runner
+arms it before a spec and disarms it after, which only sets the deadline
+under a lock, so a spec costs no thread and no wake up of the watchdog:
+
+    watchdog.arm("module.StackBehavior.should_pop", 100.0)
+    try:
+        run_spec()
+    finally:
+        stack = watchdog.disarm()
+
+When the deadline passes, the watchdog records the stack of the spec's
+thread and raises SpecTimeout in it. If the spec runs in the main thread,
+a signal wakes it from sleep, lock and I/O waits. SpecTimeout derives from
+BaseException, so 'except Exception' in spec code doesn't swallow it.
+
+Code in C extensions may not return to the interpreter. If grace is set
+and a spec is still running grace seconds after the interruption, the
+watchdog writes the stack to stderr and exits the process with
+EXIT_STATUS, so a hung spec never stalls a CI job. Exiting ends the whole
+process, so grace is None by default. The command line runner of
+pyspec3.textui sets it to GRACE seconds (--grace to change).
+"""
+
+__pyspec = 1
+
+import os
+import sys
+import time
+import threading
+import traceback
+
+try:
+    import ctypes
+    _set_async_exc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+except (ImportError, AttributeError):
+    ctypes = None
+    _set_async_exc = None
+
+try:
+    import signal
+    _wake_signal = signal.SIGUSR2
+    _pthread_kill = signal.pthread_kill
+except (ImportError, AttributeError):
+    _wake_signal = None
+    _pthread_kill = None
+
+
+EXIT_STATUS = 3
+GRACE = 10.0
+
+
+class SpecTimeout(BaseException):
+    """Raised in a spec that runs longer than its timeout."""
+    def __init__(self, name=None, timeout=None, stack=""):
+        BaseException.__init__(self, name, timeout)
+        self.name = name
+        self.timeout = timeout
+        self.stack = stack
+
+    def __str__(self):
+        if self.name is None:
+            return "spec timed out"
+        return "%s timed out after %.1fs" % (self.name, self.timeout)
+
+
+def format_thread_stack(thread_id):
+    """Return stack text of the thread without frames of pyspec modules."""
+    frame = sys._current_frames().get(thread_id)
+    frames = []
+    while frame is not None:
+        if "__pyspec" not in frame.f_globals:
+            frames.append(frame)
+        frame = frame.f_back
+    lines = []
+    for frame in reversed(frames):
+        lines.extend(traceback.format_list(
+            traceback.extract_stack(frame, limit=1)))
+    return "".join(lines)
+
+
+def _wake(signum, frame):
+    # the pending SpecTimeout is raised when this handler returns.
+    pass
+
+
+class Watchdog(object):
+    """Deadline of one running spec, watched by one thread.
+
+    @ivar grace: seconds to wait for an interrupted spec before exiting the
+                 process, or None.
+    @ivar name: name of the armed spec.
+    @ivar timeout: timeout of the armed spec.
+    @ivar deadline: time.monotonic() value or None if disarmed.
+    @ivar stack: stack text of the spec that timed out, or None.
+    """
+    __slots__ = ("grace", "name", "timeout", "deadline", "stack", "target",
+                 "serial", "condition", "thread", "wakes_main")
+    def __init__(self, grace=None):
+        self.grace = grace
+        self.name = None
+        self.timeout = None
+        self.deadline = None
+        self.stack = None
+        self.target = None
+        self.serial = 0
+        self.condition = threading.Condition(threading.Lock())
+        self.thread = None
+        self.wakes_main = False
+
+    def _start(self):
+        if _wake_signal is not None and \
+                threading.current_thread() is threading.main_thread() and \
+                signal.getsignal(_wake_signal) == signal.SIG_DFL:
+            signal.signal(_wake_signal, _wake)
+            self.wakes_main = True
+        self.thread = threading.Thread(target=self._watch,
+                                       name="pyspec watchdog")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def arm(self, name, timeout):
+        """Start watching the spec that runs in the current thread.
+
+        @param timeout: seconds. None, zero or less disables the timeout.
+        """
+        if not timeout or timeout <= 0:
+            return
+        if self.thread is None:
+            self._start()
+        with self.condition:
+            idle = self.deadline is None
+            self.name = name
+            self.timeout = timeout
+            self.target = threading.get_ident()
+            self.stack = None
+            self.serial += 1
+            self.deadline = time.monotonic() + timeout
+            if idle:
+                self.condition.notify()
+
+    def disarm(self):
+        """Stop watching. Return the stack of the spec if it timed out,
+        or None."""
+        while True:
+            try:
+                return self._disarm()
+            except SpecTimeout:
+                # the interruption arrived after the spec returned.
+                continue
+
+    def _disarm(self):
+        with self.condition:
+            stack = self.stack
+            if stack is not None:
+                if _set_async_exc is not None:
+                    # drop the interruption if it is still pending.
+                    _set_async_exc(ctypes.c_ulong(self.target), None)
+                self.condition.notify()
+            self.deadline = None
+            self.serial += 1
+            self.stack = None
+            return stack
+
+    def _watch(self):
+        with self.condition:
+            while True:
+                if self.deadline is None:
+                    self.condition.wait()
+                    continue
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    # a later deadline set by arm() is seen after this wait.
+                    self.condition.wait(remaining)
+                    continue
+                self._expire()
+
+    def _expire(self):
+        self.deadline = None
+        self.stack = format_thread_stack(self.target)
+        serial = self.serial
+        self._interrupt(self.target)
+        if self.grace is None:
+            return
+        end = time.monotonic() + self.grace
+        while self.serial == serial:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                self._exit()
+            self.condition.wait(remaining)
+
+    def _interrupt(self, thread_id):
+        if _set_async_exc is not None:
+            _set_async_exc(ctypes.c_ulong(thread_id),
+                           ctypes.py_object(SpecTimeout))
+        if self.wakes_main and thread_id == threading.main_thread().ident:
+            _pthread_kill(thread_id, _wake_signal)
+
+    def _exit(self):
+        sys.stderr.write("%s timed out after %.1fs and didn't stop.\n"
+                         "Stack of the spec:\n%s" %
+                         (self.name, self.timeout, self.stack))
+        sys.stderr.flush()
+        os._exit(EXIT_STATUS)
+
+
+watchdog = Watchdog()